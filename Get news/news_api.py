@@ -2,28 +2,673 @@
 title: News
 author: Avesed
 description: Get news from newsapi.org
-version: 1.0.1
+version: 1.4.0
 """
 
+import asyncio
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from typing import Any, Callable, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
 from pydantic import BaseModel, Field
 from newsapi import NewsApiClient
 
+# Seconds a cached response stays fresh, per endpoint
+CACHE_TTL = {
+    "top_headlines": 5 * 60,
+    "everything": 15 * 60,
+}
+# Searches whose date range ended before today no longer change much
+PAST_RANGE_TTL = 6 * 60 * 60
+
+# Parameters whose values are comma-separated lists (order does not matter)
+LIST_PARAMS = ("sources", "domains", "country", "category")
+
+# Connections kept open per client
+POOL_SIZE = 10
+
+# Articles requested per page, and the most pages one call may fetch
+PAGE_SIZE = 10
+MAX_PAGES = 5
+
+# Gaps in the local index shorter than this (seconds) are not fetched again
+INDEX_REFRESH_SECONDS = 15 * 60
+# Pruning of old articles runs at most this often (seconds)
+INDEX_PRUNE_INTERVAL = 60 * 60
+# NewsAPI query operators, kept as FTS5 operators
+QUERY_OPERATORS = ("AND", "OR", "NOT")
+
+# Near-duplicate detection: MinHash signature size, LSH bands it is split into,
+# and the Jaccard similarity of word bigrams above which two articles are the
+# same story
+SIGNATURE_BINS = 32
+LSH_BANDS = 16
+DUPLICATE_SIMILARITY = 0.5
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache for NewsAPI responses
+
+    Keys are the endpoint plus the normalized parameters, entries expire
+    after a per-endpoint TTL and the oldest entries are evicted first.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (data, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        """Return (hit, data)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() < entry[1]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: tuple, data: Any, ttl: float):
+        with self._lock:
+            self._entries[key] = (data, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max(1, self.max_entries):
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def normalize_params(params: dict) -> tuple:
+    """Canonical form of the request parameters, used as the cache key"""
+    normalized = {}
+    for name, value in params.items():
+        value = " ".join(str(value).split())
+        if not value:
+            continue
+        if name in LIST_PARAMS:
+            value = ",".join(
+                sorted(
+                    {part.strip().lower() for part in value.split(",") if part.strip()}
+                )
+            )
+        elif name == "q":
+            value = value.lower()
+        normalized[name] = value
+    return tuple(sorted(normalized.items()))
+
+
+def cache_ttl(endpoint: str, params: dict) -> float:
+    """Seconds to cache a response, longer for searches over past dates"""
+    ttl = CACHE_TTL.get(endpoint, 0)
+    end = params.get("to")
+    if endpoint == "everything" and end and end[:10] < date.today().isoformat():
+        ttl = max(ttl, PAST_RANGE_TTL)
+    return ttl
+
+
+def news_client(api_key: str) -> NewsApiClient:
+    """Shared client per API key, reusing pooled HTTP connections"""
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            client = _clients[api_key] = NewsApiClient(api_key=api_key, session=session)
+        return client
+
+
+def format_article(idx: int, article: dict, others: List[str] = ()) -> str:
+    """Markdown block for one article, `others` are sources reporting the same story"""
+    text = f"**{idx}. {article.get('title', 'No title')}**\n"
+    text += f"   Source: {article.get('source', {}).get('name', 'Unknown')}\n"
+    if others:
+        text += (
+            f"   Also reported by {len(others)} other source(s): {', '.join(others)}\n"
+        )
+    text += f"   Published: {article.get('publishedAt', 'Unknown')}\n"
+    if article.get("description"):
+        text += f"   {article.get('description')}\n"
+    text += f"   {article.get('url', 'No URL')}\n\n"
+    return text
+
+
+def format_summary(total: int, stories: List[tuple]) -> str:
+    """One line per story, for when the full cards were already shown to the user"""
+    text = (
+        f"Found {total} articles, {len(stories)} stories already shown to the user:\n"
+    )
+    for idx, (article, others) in enumerate(stories, 1):
+        text += (
+            f"{idx}. {article.get('title', 'No title')} - "
+            f"{article.get('source', {}).get('name', 'Unknown')}"
+            f"{f' (+{len(others)} other source(s))' if others else ''}, "
+            f"{(article.get('publishedAt') or 'Unknown')[:10]} "
+            f"{article.get('url', '')}\n"
+        )
+    return text
+
+
+def parse_time(value: str, end_of_day: bool = False) -> float:
+    """Timestamp of a YYYY-MM-DD date or ISO 8601 datetime (UTC when no zone is given)"""
+    if len(value) == 10:
+        value += "T23:59:59" if end_of_day else "T00:00:00"
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def query_terms(q: str) -> Optional[frozenset]:
+    """Words of a plain keyword query, None when it uses phrases or operators"""
+    words = q.lower().split()
+    if any(not word.isalnum() or word.upper() in QUERY_OPERATORS for word in q.split()):
+        return None
+    return frozenset(words)
+
+
+def fts_query(q: str, strict: bool = True) -> Optional[str]:
+    """
+    Translate a NewsAPI query into FTS5 syntax
+
+    Phrases and words are quoted, AND/OR/NOT and parentheses are kept and a
+    leading "-" becomes NOT. Returns None when the parentheses are unbalanced.
+    With strict=False every word that is not excluded is simply required
+    (fallback when the translated query is not valid FTS5).
+    """
+    if not strict:
+        return " ".join(
+            f'"{word}"'
+            for token in q.split()
+            if not token.startswith("-") and token.upper() not in QUERY_OPERATORS
+            for word in re.findall(r"\w+", token)
+        )
+
+    def add(group: tuple, term: str, negated: bool):
+        parts, excluded = group
+        if not negated:
+            if (
+                parts
+                and parts[-1] not in QUERY_OPERATORS
+                and (term.startswith("(") or parts[-1].startswith("("))
+            ):
+                # FTS5 only joins plain phrases implicitly
+                parts.append("AND")
+            parts.append(term)
+        elif not parts:
+            excluded.append(term)
+        else:
+            if parts[-1] in QUERY_OPERATORS:
+                parts.pop()
+            parts += ["NOT", term]
+
+    def close(group: tuple) -> str:
+        parts, excluded = group
+        while parts and parts[-1] in QUERY_OPERATORS:
+            parts.pop()
+        if parts and excluded:
+            # Exclusions before any term, FTS5 needs them after one
+            if len(parts) > 1:
+                parts[:] = ["(" + " ".join(parts) + ")"]
+            for term in excluded:
+                parts += ["NOT", term]
+        return " ".join(parts)
+
+    groups = [([], [])]  # (parts, exclusions before any term) per open parenthesis
+    negated_groups = []
+    for token in re.findall(r'-?"[^"]*"|-?\(|\)|[^\s()]+', q):
+        if token in ("(", "-("):
+            groups.append(([], []))
+            negated_groups.append(token == "-(")
+            continue
+        if token == ")":
+            if len(groups) == 1:
+                return None
+            inner = close(groups.pop())
+            negated = negated_groups.pop()
+            if inner:
+                add(groups[-1], f"({inner})", negated)
+            continue
+        if token.upper() in QUERY_OPERATORS:
+            parts = groups[-1][0]
+            if parts and parts[-1] not in QUERY_OPERATORS:
+                parts.append(token.upper())
+            continue
+        words = re.findall(r"\w+", token)
+        if words:
+            add(groups[-1], '"' + " ".join(words) + '"', token.startswith("-"))
+    if len(groups) > 1:
+        return None
+    return close(groups[0])
+
+
+def shingles(article: dict) -> frozenset:
+    """Word bigrams of an article's title and description"""
+    title = article.get("title") or ""
+    # NewsAPI titles usually end with " - <source name>"
+    name = (article.get("source") or {}).get("name")
+    if name and title.endswith(" - " + name):
+        title = title[: -len(name) - 3]
+    words = re.findall(r"\w+", f"{title} {article.get('description') or ''}".lower())
+    if len(words) < 2:
+        return frozenset(words)
+    return frozenset(f"{a} {b}" for a, b in zip(words, words[1:]))
+
+
+def minhash(items: frozenset) -> tuple:
+    """
+    One-permutation MinHash signature of a set of strings
+
+    Each item is hashed once and only kept as the minimum of one of the
+    SIGNATURE_BINS bins; empty bins borrow the next filled bin's value so
+    small sets still get comparable signatures.
+    """
+    bins = [None] * SIGNATURE_BINS
+    for item in items:
+        h = zlib.crc32(item.encode())
+        slot, value = h % SIGNATURE_BINS, h // SIGNATURE_BINS
+        if bins[slot] is None or value < bins[slot]:
+            bins[slot] = value
+    if not items:
+        return tuple(bins)
+    signature = []
+    for slot in range(SIGNATURE_BINS):
+        offset = 0
+        while bins[(slot + offset) % SIGNATURE_BINS] is None:
+            offset += 1
+        signature.append((bins[(slot + offset) % SIGNATURE_BINS], offset))
+    return tuple(signature)
+
+
+class StoryClusters:
+    """
+    Groups articles about the same story, e.g. one wire report republished by
+    several outlets
+
+    Articles are added one by one. Their MinHash signatures are split into
+    LSH bands so a new article is only compared, by exact Jaccard similarity,
+    with stories sharing at least one band. The first article of a story is its
+    representative, later ones only add their source name.
+    """
+
+    def __init__(self, merge: bool = True):
+        self.merge = merge
+        self.stories = []  # [representative, shingles, other source names]
+        self._buckets = {}
+        self._urls = {}
+
+    def add(self, article: dict) -> bool:
+        """Add an article, True if it starts a new story"""
+        url = article.get("url")
+        if self.merge and url in self._urls:
+            return False
+
+        words = shingles(article)
+        keys = self._bands(words) if self.merge and words else []
+        story = self._match(words, keys)
+        if story is not None:
+            name = (article.get("source") or {}).get("name") or "Unknown"
+            representative, _, others = self.stories[story]
+            if name != (representative.get("source") or {}).get("name") and (
+                name not in others
+            ):
+                others.append(name)
+            if url:
+                self._urls[url] = story
+            return False
+
+        story = len(self.stories)
+        self.stories.append((article, words, []))
+        if url:
+            self._urls[url] = story
+        for key in keys:
+            self._buckets.setdefault(key, []).append(story)
+        return True
+
+    def items(self) -> List[tuple]:
+        """(representative article, other source names) per story, in order"""
+        return [(article, others) for article, _, others in self.stories]
+
+    def _match(self, words: frozenset, keys: List[tuple]) -> Optional[int]:
+        """Most similar story sharing an LSH band, if above DUPLICATE_SIMILARITY"""
+        best, best_similarity = None, DUPLICATE_SIMILARITY
+        checked = set()
+        for key in keys:
+            for story in self._buckets.get(key, ()):
+                if story in checked:
+                    continue
+                checked.add(story)
+                other = self.stories[story][1]
+                similarity = len(words & other) / len(words | other)
+                if similarity >= best_similarity:
+                    best, best_similarity = story, similarity
+        return best
+
+    @staticmethod
+    def _bands(words: frozenset) -> List[tuple]:
+        signature = minhash(words)
+        rows = SIGNATURE_BINS // LSH_BANDS
+        return [
+            (band, signature[band * rows : (band + 1) * rows])
+            for band in range(LSH_BANDS)
+        ]
+
+
+class ArticleIndex:
+    """
+    Local SQLite FTS5 index of every article the tool has fetched
+
+    Besides the articles it records which (query, sources, domains, time range)
+    combinations have been fetched from NewsAPI, so searches over covered
+    ranges are answered locally with BM25 ranking and only the uncovered
+    ranges are requested upstream. Articles older than the retention period
+    are pruned.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS articles (
+                id INTEGER PRIMARY KEY,
+                url TEXT UNIQUE,
+                title TEXT,
+                description TEXT,
+                content TEXT,
+                source_id TEXT,
+                source_name TEXT,
+                domain TEXT,
+                published_at TEXT,
+                published REAL
+            );
+            CREATE INDEX IF NOT EXISTS articles_published ON articles (published);
+            CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5 (
+                title, description, content, content='articles', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS articles_insert AFTER INSERT ON articles BEGIN
+                INSERT INTO articles_fts (rowid, title, description, content)
+                VALUES (new.id, new.title, new.description, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS articles_delete AFTER DELETE ON articles BEGIN
+                INSERT INTO articles_fts (articles_fts, rowid, title, description, content)
+                VALUES ('delete', old.id, old.title, old.description, old.content);
+            END;
+            CREATE TABLE IF NOT EXISTS coverage (
+                q TEXT,
+                sources TEXT,
+                domains TEXT,
+                start REAL,
+                end REAL,
+                complete INTEGER,
+                fetched INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS coverage_scope ON coverage (sources, domains);
+            """)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(coverage)")]
+        if "fetched" not in columns:
+            # Index files created before the number of fetched articles was kept
+            self._db.execute(
+                "ALTER TABLE coverage ADD COLUMN fetched INTEGER NOT NULL DEFAULT 0"
+            )
+
+    def ingest(self, articles: List[dict]):
+        """Store articles, ignoring ones already indexed (same URL)"""
+        rows = []
+        for article in articles:
+            url = article.get("url")
+            published_at = article.get("publishedAt") or ""
+            if not url or not published_at:
+                continue
+            try:
+                published = parse_time(published_at)
+            except ValueError:
+                continue
+            source = article.get("source") or {}
+            domain = (urlparse(url).hostname or "").lower()
+            rows.append(
+                (
+                    url,
+                    article.get("title") or "",
+                    article.get("description") or "",
+                    article.get("content") or "",
+                    source.get("id") or "",
+                    source.get("name") or "",
+                    domain[4:] if domain.startswith("www.") else domain,
+                    published_at,
+                    published,
+                )
+            )
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO articles (url, title, description, content, "
+                "source_id, source_name, domain, published_at, published) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def gaps(
+        self,
+        q: str,
+        sources: str,
+        domains: str,
+        start: float,
+        end: float,
+        wanted: int = PAGE_SIZE,
+    ):
+        """
+        Parts of [start, end] not yet fetched for this search
+
+        Complete fetches (every result retrieved) of the same query count, and
+        so do complete fetches of a query whose words are a subset of this one.
+        A partial fetch of the same query only counts when it retrieved at
+        least `wanted` articles.
+        """
+        terms = query_terms(q)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT q, start, end, complete, fetched FROM coverage "
+                "WHERE sources = ? AND domains = ? AND end >= ? AND start <= ?",
+                (sources, domains, start, end),
+            ).fetchall()
+        covered = sorted(
+            (row_start, row_end)
+            for row_q, row_start, row_end, complete, fetched in rows
+            if (complete and (row_q == q or self._narrower(terms, query_terms(row_q))))
+            or (row_q == q and fetched >= wanted)
+        )
+
+        gaps = []
+        cursor = start
+        for row_start, row_end in covered:
+            if row_start > cursor:
+                gaps.append((cursor, min(row_start, end)))
+            cursor = max(cursor, row_end)
+            if cursor >= end:
+                break
+        if cursor < end:
+            gaps.append((cursor, end))
+        return [(a, b) for a, b in gaps if b - a >= INDEX_REFRESH_SECONDS]
+
+    @staticmethod
+    def _narrower(terms: Optional[frozenset], covered: Optional[frozenset]) -> bool:
+        """Whether every match of `terms` is also a match of the covered query"""
+        return terms is not None and covered is not None and covered <= terms
+
+    def record(
+        self,
+        q: str,
+        sources: str,
+        domains: str,
+        start: float,
+        end: float,
+        fetched: int,
+        complete: bool,
+    ):
+        """Remember that `fetched` articles of [start, end] were fetched for this search"""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO coverage (q, sources, domains, start, end, complete, "
+                "fetched) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (q, sources, domains, start, end, int(complete), fetched),
+            )
+
+    def search(
+        self,
+        q: str,
+        start: float,
+        end: float,
+        sources: str = "",
+        domains: str = "",
+        limit: int = PAGE_SIZE,
+    ):
+        """Return (number of matches, best matches by BM25) as NewsAPI-style articles"""
+        where = "articles_fts MATCH ? AND a.published BETWEEN ? AND ?"
+        filters = [start, end]
+        if sources:
+            names = sources.split(",")
+            where += f" AND a.source_id IN ({', '.join('?' * len(names))})"
+            filters += names
+        if domains:
+            names = domains.split(",")
+            where += (
+                " AND ("
+                + " OR ".join("a.domain = ? OR a.domain LIKE ?" for _ in names)
+                + ")"
+            )
+            for name in names:
+                filters += [name, f"%.{name}"]
+
+        for match in (fts_query(q), fts_query(q, strict=False)):
+            if not match:
+                continue
+            try:
+                with self._lock:
+                    total = self._db.execute(
+                        "SELECT count(*) FROM articles_fts "
+                        f"JOIN articles a ON a.id = articles_fts.rowid WHERE {where}",
+                        [match] + filters,
+                    ).fetchone()[0]
+                    rows = self._db.execute(
+                        "SELECT a.title, a.description, a.url, a.published_at, "
+                        "a.source_id, a.source_name FROM articles_fts "
+                        f"JOIN articles a ON a.id = articles_fts.rowid WHERE {where} "
+                        "ORDER BY bm25(articles_fts) LIMIT ?",
+                        [match] + filters + [limit],
+                    ).fetchall()
+            except sqlite3.OperationalError:
+                continue
+            return total, [
+                {
+                    "title": title,
+                    "description": description,
+                    "url": url,
+                    "publishedAt": published_at,
+                    "source": {"id": source_id or None, "name": source_name},
+                }
+                for title, description, url, published_at, source_id, source_name in rows
+            ]
+        return 0, []
+
+    def prune(self, retention_days: float):
+        """Drop articles and coverage older than the retention period"""
+        now = time.time()
+        if now - self._pruned_at < INDEX_PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        cutoff = now - retention_days * 86400
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM articles WHERE published < ?", (cutoff,))
+            self._db.execute("DELETE FROM coverage WHERE end < ?", (cutoff,))
+            self._db.execute(
+                "UPDATE coverage SET start = ? WHERE start < ?", (cutoff, cutoff)
+            )
+
+
+def article_index(path: str) -> Optional[ArticleIndex]:
+    """Shared index per database file, None when SQLite lacks FTS5 or the file cannot be opened"""
+    with _indexes_lock:
+        if path not in _indexes:
+            try:
+                _indexes[path] = ArticleIndex(path)
+            except sqlite3.Error:
+                _indexes[path] = None
+        return _indexes[path]
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+_cache = ResponseCache()
+_indexes = {}
+_indexes_lock = threading.Lock()
+
 
 class Tools:
     class Valves(BaseModel):
         NEWS_API_KEY: str = Field(
             default="", description="Your News API Key from https://newsapi.org/"
         )
+        CACHE_ENABLED: bool = Field(
+            default=True, description="Cache responses of identical queries"
+        )
+        CACHE_MAX_ENTRIES: int = Field(
+            default=256, description="Maximum number of cached responses"
+        )
+        INDEX_ENABLED: bool = Field(
+            default=True,
+            description="Keep fetched articles in a local full-text index and answer repeated searches from it",
+        )
+        INDEX_PATH: str = Field(
+            default="",
+            description="SQLite file for the article index, empty for the system temp directory",
+        )
+        INDEX_RETENTION_DAYS: float = Field(
+            default=30,
+            description="Articles older than this are removed from the index",
+        )
+        DEDUPLICATE: bool = Field(
+            default=True,
+            description="Show articles about the same story (e.g. syndicated copies) once, with the number of other sources",
+        )
 
     def __init__(self):
         self.valves = self.Valves()
 
-    def get_top_headlines(
+    async def get_top_headlines(
         self,
         q: str = "",
         category: str = "",
         country: str = "",
         sources: str = "",
+        pages: int = 1,
+        __event_emitter__: Optional[Callable[[dict], Any]] = None,
     ) -> str:
         """
         Get the top headlines. (Use at least one param, set :param category: to general as default)
@@ -32,6 +677,7 @@ class Tools:
         :param category: Category of the news, e.g., general, business, entertainment, health, science, sports, technology
         :param country: 2-letter ISO 3166-1 country code, e.g., us, gb, cn (optional, cannot be used with sources)
         :param sources: Comma-separated news sources, e.g., bbc-news,the-verge (optional, cannot be used with country)
+        :param pages: Number of pages of 10 articles to fetch, default 1 (max 5)
         :return: Top headlines articles
         """
         if not self.valves.NEWS_API_KEY:
@@ -40,59 +686,37 @@ class Tools:
         if country and sources:
             return "Error: 'country' and 'sources' parameters cannot be used together."
 
-        try:
-            api = NewsApiClient(api_key=self.valves.NEWS_API_KEY)
-
-            # Build parameters
-            params = {}
-            if q:
-                params["q"] = q
-            if category:
-                params["category"] = category
-            if country:
-                params["country"] = country
-            if sources:
-                params["sources"] = sources
-
-            # Get top headlines
-            result = api.get_top_headlines(**params)
-
-            # Format the response
-            if result.get("status") == "ok":
-                articles = result.get("articles", [])
-                if not articles:
-                    return "No articles found."
-
-                formatted_result = f"Found {result.get('totalResults', len(articles))} top headlines:\n\n"
-                for idx, article in enumerate(articles[:10], 1):  # Limit to 10 articles
-                    formatted_result += (
-                        f"**{idx}. {article.get('title', 'No title')}**\n"
-                    )
-                    formatted_result += f"   Source: {article.get('source', {}).get('name', 'Unknown')}\n"
-                    formatted_result += (
-                        f"   Published: {article.get('publishedAt', 'Unknown')}\n"
-                    )
-                    if article.get("description"):
-                        formatted_result += f"   {article.get('description')}\n"
-                    formatted_result += f"   {article.get('url', 'No URL')}\n\n"
-
-                if len(articles) > 10:
-                    formatted_result += f"_Showing 10 of {len(articles)} articles_\n"
+        # Build parameters
+        params = {}
+        if q:
+            params["q"] = q
+        if category:
+            params["category"] = category
+        if country:
+            params["country"] = country
+        if sources:
+            params["sources"] = sources
 
-                return formatted_result
-            else:
-                return f"Error: {result.get('message', 'Unknown error')}"
-
-        except Exception as e:
-            return f"Error fetching top headlines: {str(e)}"
+        index = self._index()
+        return await self._search(
+            "top_headlines",
+            params,
+            pages,
+            "top headlines",
+            "Error fetching top headlines",
+            __event_emitter__,
+            ingest=(lambda batch, total, done: index.ingest(batch)) if index else None,
+        )
 
-    def get_everything(
+    async def get_everything(
         self,
         q: str = "",
         sources: str = "",
         domains: str = "",
         from_param: str = "",
         to: str = "",
+        pages: int = 1,
+        __event_emitter__: Optional[Callable[[dict], Any]] = None,
     ) -> str:
         """
         Search through all news articles matching the query.
@@ -102,57 +726,313 @@ class Tools:
         :param domains: Comma-separated domains, e.g., bbc.co.uk,techcrunch.com (optional)
         :param from_param: Start date in YYYY-MM-DD format, must be within 30 days (If use :param to:, :param from_param: must be used)
         :param to: End date in YYYY-MM-DD format (optional)
+        :param pages: Number of pages of 10 articles to fetch, default 1 (max 5)
         :return: News articles matching the query
         """
         if not self.valves.NEWS_API_KEY:
             return "Error: NEWS_API_KEY is not set. Please configure it in the tool settings."
 
+        # Build parameters
+        params = {}
+        if q:
+            params["q"] = q
+        if sources:
+            params["sources"] = sources
+        if domains:
+            params["domains"] = domains
+        if from_param:
+            params["from_param"] = from_param
+        if to:
+            params["to"] = to
+
+        # Queries the index cannot express (e.g. unbalanced parentheses) go upstream
+        index = self._index() if fts_query(q) else None
+        if index is None:
+            return await self._search(
+                "everything",
+                params,
+                pages,
+                "articles",
+                "Error fetching news",
+                __event_emitter__,
+            )
+
         try:
-            api = NewsApiClient(api_key=self.valves.NEWS_API_KEY)
-
-            # Build parameters
-            params = {}
-            if q:
-                params["q"] = q
-            if sources:
-                params["sources"] = sources
-            if domains:
-                params["domains"] = domains
-            if from_param:
-                params["from_param"] = from_param
-            if to:
-                params["to"] = to
-
-            # Get everything
-            result = api.get_everything(**params)
-
-            # Format the response
-            if result.get("status") == "ok":
-                articles = result.get("articles", [])
-                if not articles:
-                    return "No articles found."
-
-                formatted_result = (
-                    f"Found {result.get('totalResults', len(articles))} articles:\n\n"
-                )
-                for idx, article in enumerate(articles[:10], 1):  # Limit to 10 articles
-                    formatted_result += (
-                        f"**{idx}. {article.get('title', 'No title')}**\n"
+            now = time.time()
+            start = (
+                parse_time(from_param)
+                if from_param
+                else now - self.valves.INDEX_RETENTION_DAYS * 86400
+            )
+            end = min(parse_time(to, end_of_day=True) if to else now, now)
+        except ValueError as e:
+            return f"Error: invalid date: {str(e)}"
+
+        scope = dict(normalize_params({"q": q, "sources": sources, "domains": domains}))
+        scope = (scope.get("q", ""), scope.get("sources", ""), scope.get("domains", ""))
+        pages = max(1, min(pages, MAX_PAGES))
+        gaps = index.gaps(*scope, start, end, pages * PAGE_SIZE)
+
+        if gaps == [(start, end)]:
+            # Nothing covered yet: stream straight from NewsAPI while indexing
+            fetched = []
+
+            def ingest(batch, total, done):
+                index.ingest(batch)
+                fetched.extend(batch)
+                if done:
+                    index.record(
+                        *scope, start, end, len(fetched), len(fetched) >= total
                     )
-                    formatted_result += f"   Source: {article.get('source', {}).get('name', 'Unknown')}\n"
-                    formatted_result += (
-                        f"   Published: {article.get('publishedAt', 'Unknown')}\n"
+
+            return await self._search(
+                "everything",
+                params,
+                pages,
+                "articles",
+                "Error fetching news",
+                __event_emitter__,
+                ingest=ingest,
+            )
+
+        if gaps:
+            if __event_emitter__:
+                await __event_emitter__(
+                    {
+                        "type": "status",
+                        "data": {
+                            "description": f"Fetching {len(gaps)} missing time range(s)",
+                            "done": False,
+                        },
+                    }
+                )
+            try:
+                await asyncio.to_thread(
+                    self._fill_gaps, index, scope, params, gaps, pages
+                )
+            except Exception as e:
+                if __event_emitter__:
+                    await __event_emitter__(
+                        {
+                            "type": "status",
+                            "data": {"description": "Failed", "done": True},
+                        }
                     )
-                    if article.get("description"):
-                        formatted_result += f"   {article.get('description')}\n"
-                    formatted_result += f"   {article.get('url', 'No URL')}\n\n"
+                return f"Error fetching news: {str(e)}"
 
-                if len(articles) > 10:
-                    formatted_result += f"_Showing 10 of {len(articles)} articles_\n"
+        total, articles = await asyncio.to_thread(
+            index.search, q, start, end, scope[1], scope[2], pages * PAGE_SIZE
+        )
+        clusters = StoryClusters(self.valves.DEDUPLICATE)
+        for article in articles:
+            clusters.add(article)
+        stories = clusters.items()
+        if __event_emitter__:
+            for idx, (article, others) in enumerate(stories, 1):
+                await __event_emitter__(
+                    {
+                        "type": "message",
+                        "data": {"content": format_article(idx, article, others)},
+                    }
+                )
+            await __event_emitter__(
+                {
+                    "type": "status",
+                    "data": {
+                        "description": f"Found {total} articles in the local index",
+                        "done": True,
+                    },
+                }
+            )
+        return self._render(total, stories, "articles", __event_emitter__)
+
+    async def _search(
+        self,
+        endpoint: str,
+        params: dict,
+        pages: int,
+        label: str,
+        error_prefix: str,
+        emitter: Optional[Callable[[dict], Any]],
+        ingest: Optional[Callable[[List[dict], int, bool], None]] = None,
+    ) -> str:
+        """
+        Fetch up to `pages` pages of articles
+
+        With an event emitter, each article is pushed to the chat as soon as its
+        page arrives (the next page is already being fetched meanwhile) and the
+        return value is only a compact summary. Without one, the full markdown
+        list is returned. Near-duplicate articles are collapsed into one story
+        per card. `ingest` receives every page (articles, total results,
+        whether it was the last page).
+        """
+        pages = max(1, min(pages, MAX_PAGES))
 
-                return formatted_result
-            else:
-                return f"Error: {result.get('message', 'Unknown error')}"
+        async def emit(event_type: str, data: dict):
+            if emitter:
+                await emitter({"type": event_type, "data": data})
+
+        def fetch(page: int):
+            return self._fetch(
+                endpoint, {**params, "page_size": PAGE_SIZE, "page": page}
+            )
+
+        await emit("status", {"description": f"Fetching {label}", "done": False})
+
+        articles = []
+        clusters = StoryClusters(self.valves.DEDUPLICATE)
+        total = 0
+        pending = None
+        try:
+            pending = asyncio.create_task(asyncio.to_thread(fetch, 1))
+            for page in range(1, pages + 1):
+                result = await pending
+                pending = None
+                if result.get("status") != "ok":
+                    if articles:
+                        # Keep the pages already shown, but close the status
+                        await emit(
+                            "status",
+                            {
+                                "description": f"Received {len(articles)} of {total} "
+                                f"{label} (page {page} failed)",
+                                "done": True,
+                            },
+                        )
+                        break
+                    await emit("status", {"description": "Failed", "done": True})
+                    return f"Error: {result.get('message', 'Unknown error')}"
+
+                batch = result.get("articles", [])
+                total = result.get("totalResults", len(batch))
+                more = (
+                    page < pages
+                    and len(batch) == PAGE_SIZE
+                    and page * PAGE_SIZE < total
+                )
+                if more:
+                    # Start the next page before rendering this one
+                    pending = asyncio.create_task(asyncio.to_thread(fetch, page + 1))
+                if ingest:
+                    await asyncio.to_thread(ingest, batch, total, not more)
+
+                # Cluster the whole page first so its cards already list the
+                # other sources of the same story
+                first = len(clusters.stories)
+                for article in batch:
+                    articles.append(article)
+                    clusters.add(article)
+                for idx, (article, others) in enumerate(
+                    clusters.items()[first:], first + 1
+                ):
+                    await emit(
+                        "message", {"content": format_article(idx, article, others)}
+                    )
+                await emit(
+                    "status",
+                    {
+                        "description": f"Received {len(articles)} of {total} {label}",
+                        "done": not more,
+                    },
+                )
+                if not more:
+                    break
 
         except Exception as e:
-            return f"Error fetching news: {str(e)}"
+            if pending is not None:
+                pending.cancel()
+            await emit("status", {"description": "Failed", "done": True})
+            if not articles:
+                return f"{error_prefix}: {str(e)}"
+
+        return self._render(total, clusters.items(), label, emitter)
+
+    def _render(
+        self,
+        total: int,
+        stories: List[tuple],
+        label: str,
+        emitter: Optional[Callable[[dict], Any]],
+    ) -> str:
+        """Compact summary when the stories were already emitted, full list otherwise"""
+        if not stories:
+            return "No articles found."
+        if emitter:
+            return format_summary(total, stories)
+
+        formatted_result = f"Found {total} {label}:\n\n"
+        for idx, (article, others) in enumerate(stories, 1):
+            formatted_result += format_article(idx, article, others)
+        if len(stories) < total:
+            formatted_result += (
+                f"_Showing {len(stories)} stories from {total} {label}_\n"
+            )
+        return formatted_result
+
+    def _fetch(self, endpoint: str, params: dict) -> dict:
+        """
+        Call a NewsAPI endpoint through the shared client, using the cache
+
+        :param endpoint: "top_headlines" or "everything"
+        :param params: Keyword arguments for the NewsApiClient method
+        :return: Parsed response
+        """
+        api = news_client(self.valves.NEWS_API_KEY)
+        fetch = getattr(api, f"get_{endpoint}")
+        if not self.valves.CACHE_ENABLED:
+            return fetch(**params)
+
+        key = (self.valves.NEWS_API_KEY, endpoint) + normalize_params(params)
+        hit, result = _cache.get(key)
+        if hit:
+            return result
+
+        result = fetch(**params)
+        if result.get("status") == "ok":
+            _cache.max_entries = self.valves.CACHE_MAX_ENTRIES
+            _cache.put(key, result, cache_ttl(endpoint, params))
+        return result
+
+    def _index(self) -> Optional[ArticleIndex]:
+        """The local article index, pruned of old articles, or None when disabled"""
+        if not self.valves.INDEX_ENABLED:
+            return None
+        index = article_index(
+            self.valves.INDEX_PATH
+            or os.path.join(tempfile.gettempdir(), "newsapi_articles.db")
+        )
+        if index is not None:
+            index.prune(self.valves.INDEX_RETENTION_DAYS)
+        return index
+
+    def _fill_gaps(
+        self, index: ArticleIndex, scope: tuple, params: dict, gaps: list, pages: int
+    ):
+        """Fetch the uncovered time ranges of a search into the index"""
+        for start, end in gaps:
+            fetched = 0
+            total = 0
+            for page in range(1, max(1, min(pages, MAX_PAGES)) + 1):
+                result = self._fetch(
+                    "everything",
+                    {
+                        **params,
+                        "from_param": datetime.fromtimestamp(start, timezone.utc)
+                        .isoformat(timespec="seconds")
+                        .replace("+00:00", ""),
+                        "to": datetime.fromtimestamp(end, timezone.utc)
+                        .isoformat(timespec="seconds")
+                        .replace("+00:00", ""),
+                        "page_size": PAGE_SIZE,
+                        "page": page,
+                    },
+                )
+                if result.get("status") != "ok":
+                    raise ValueError(result.get("message", "Unknown error"))
+                batch = result.get("articles", [])
+                total = result.get("totalResults", len(batch))
+                index.ingest(batch)
+                fetched += len(batch)
+                if len(batch) < PAGE_SIZE or fetched >= total:
+                    break
+            index.record(*scope, start, end, fetched, fetched >= total)
@@ -1,21 +1,1604 @@
 """
 title: Finnhub_api
 author: Avesed
-version: 2.0
+version: 2.13
 description: use finnhub api to get stock datas
 """
 
 import requests
+import codecs
 import json
-from typing import Callable, Any
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import date, datetime, timedelta
+from difflib import get_close_matches
+from typing import Callable, Any, List, Optional
 from pydantic import BaseModel, Field
 
+try:
+    import numpy as np
+except ImportError:
+    # 可选: 组合汇总等向量化计算需要 numpy
+    np = None
+
+try:
+    import websocket
+except ImportError:
+    # 可选: 实时报价需要 websocket-client
+    websocket = None
+
+BASE_URL = "https://finnhub.io/api/v1"
+WS_URL = "wss://ws.finnhub.io"
+
+# 连续 429 时的最长退避时间 (秒)
+MAX_BACKOFF = 60
+
+# 批量报价最多支持的股票数
+MAX_BATCH_SYMBOLS = 50
+
+# 公司概览可选的部分及其标题，顺序即输出顺序
+SNAPSHOT_SECTIONS = {
+    "profile": "公司信息",
+    "quote": "报价",
+    "financials": "财务指标",
+    "recommendations": "分析师推荐",
+    "earnings": "收益惊喜",
+}
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# 各端点缓存时间 (秒)，按数据更新频率分级；未列出的端点不缓存
+CACHE_TTL = {
+    "/quote": 15,
+    "/stock/insider-transactions": 12 * HOUR,
+    "/stock/insider-sentiment": 12 * HOUR,
+    "/stock/profile2": 3 * DAY,
+    "/stock/peers": 3 * DAY,
+    "/stock/metric": DAY,
+    "/stock/recommendation": DAY,
+    "/stock/earnings": DAY,
+    "/search": 3 * DAY,
+    "/stock/financials-reported": DAY,  # 见 cache_ttl: 缓存到下一份财报
+}
+
+# 财报间隔 (天)，用于估计下一份财报的提交时间
+FILING_INTERVAL_DAYS = {"annual": 365, "quarterly": 92}
+
+# 新闻存储: 每个股票/类别最多保留的条数和天数，同一来源的最短刷新间隔 (秒)
+NEWS_MAX_ITEMS = 500
+NEWS_RETENTION_DAYS = 30
+NEWS_MAX_FEEDS = 200
+NEWS_REFRESH_SECONDS = 60
+# NewsStore.state() 返回的字段
+NEWS_STATE_FIELDS = ("latest", "max_id", "covered_from", "covered_to", "fetched_at")
+
+# 内部交易代码 (SEC Form 4)
+INSIDER_CODES = {
+    "P": "公开市场买入",
+    "S": "公开市场卖出",
+    "A": "授予",
+    "M": "行使期权",
+    "F": "扣税",
+    "G": "赠与",
+    "D": "处置给公司",
+    "C": "转换",
+    "X": "行权",
+}
+# 集中买入: CLUSTER_DAYS 天内至少 CLUSTER_MIN_INSIDERS 位内部人公开市场买入
+CLUSTER_DAYS = 30
+CLUSTER_MIN_INSIDERS = 3
+# 滚动 MSPR 的月数
+MSPR_WINDOW_MONTHS = 3
+# 缓存解析后内部交易数组的股票数
+INSIDER_CACHE_SYMBOLS = 64
+
+# K 线周期 -> 每根 K 线的秒数
+CANDLE_RESOLUTIONS = {
+    "1": MINUTE,
+    "5": 5 * MINUTE,
+    "15": 15 * MINUTE,
+    "30": 30 * MINUTE,
+    "60": HOUR,
+    "D": DAY,
+    "W": 7 * DAY,
+    "M": 30 * DAY,
+}
+# 每年的 K 线数，用于年化波动率 (日内按每天 6.5 个交易小时)
+BARS_PER_YEAR = {"D": 252, "W": 52, "M": 12}
+TRADING_SECONDS_PER_DAY = 6.5 * HOUR
+# 同一股票和周期的 K 线最短刷新间隔 (秒)
+CANDLE_REFRESH_SECONDS = 60
+# K 线字段，存储为 (6, n) 的数组，每个字段一行连续存放
+CANDLE_FIELDS = ("t", "o", "h", "l", "c", "v")
+# 指数移动平均分块计算的块大小
+EMA_BLOCK = 128
+
+# 同行对比的指标: 名称 -> (标题, /stock/metric 字段 (按优先级), 越高越好 / 越低越好 / None 不计入综合排名)
+PEER_METRICS = {
+    "pe": ("P/E", ("peBasicExclExtraTTM", "peTTM", "peAnnual"), False),
+    "gross_margin": ("毛利率%", ("grossMarginTTM", "grossMarginAnnual"), True),
+    "operating_margin": (
+        "营业利润率%",
+        ("operatingMarginTTM", "operatingMarginAnnual"),
+        True,
+    ),
+    "net_margin": ("净利率%", ("netProfitMarginTTM", "netProfitMarginAnnual"), True),
+    "roe": ("ROE%", ("roeTTM", "roeRfy"), True),
+    "revenue_growth": ("营收增长%", ("revenueGrowthTTMYoy", "revenueGrowth3Y"), True),
+    "beta": ("Beta", ("beta",), None),
+    "market_cap": ("市值 (百万)", ("marketCapitalization",), None),
+}
+DEFAULT_PEER_METRICS = ["pe", "net_margin", "roe", "beta", "market_cap"]
+# 只有正值才有意义的指标 (如亏损公司的负 P/E)，其余值按缺失处理
+POSITIVE_PEER_METRICS = ("pe", "market_cap")
+MAX_PEERS = 20
+
+# 收益日历按固定天数的窗口分段获取和缓存
+CALENDAR_WINDOW_DAYS = 7
+# 一次最多查询的天数
+MAX_CALENDAR_DAYS = 366
+# 收益日历窗口的刷新间隔 (秒): 近期窗口 (前后两周内) 经常变动，更远的未来次之，已过去的基本不变
+CALENDAR_REFRESH = {"near": HOUR, "future": DAY, "past": 7 * DAY}
+CALENDAR_SESSIONS = {"bmo": "盘前", "amc": "盘后", "dmh": "盘中"}
+# 最多保存的窗口数 (约两年)，超出时淘汰最久未使用的窗口
+CALENDAR_MAX_WINDOWS = 104
+
+# 财报常用科目及对应的 XBRL 概念 (按优先级)，也可直接传入概念名
+FINANCIAL_LINE_ITEMS = {
+    "revenue": (
+        "Revenues",
+        "RevenueFromContractWithCustomerExcludingAssessedTax",
+        "SalesRevenueNet",
+    ),
+    "gross_profit": ("GrossProfit",),
+    "operating_income": ("OperatingIncomeLoss",),
+    "net_income": ("NetIncomeLoss", "ProfitLoss"),
+    "eps": ("EarningsPerShareBasic",),
+    "eps_diluted": ("EarningsPerShareDiluted",),
+    "total_assets": ("Assets",),
+    "total_liabilities": ("Liabilities",),
+    "equity": ("StockholdersEquity",),
+    "cash": ("CashAndCashEquivalentsAtCarryingValue",),
+    "operating_cash_flow": ("NetCashProvidedByUsedInOperatingActivities",),
+}
+DEFAULT_FINANCIAL_ITEMS = ["revenue", "net_income", "eps"]
+
+# 财报表头中保留的字段
+REPORT_FIELDS = ("year", "quarter", "form", "filedDate", "acceptedDate")
+
+# 流式解析时每次读取的字节数
+STREAM_CHUNK_SIZE = 64 * 1024
+# JSON 数字可能包含的字符
+NUMBER_CHARS = frozenset("0123456789+-.eE")
+
+
+class RateLimitTimeout(Exception):
+    """排队等待超过了允许的最长时间"""
+
+
+class RateLimiter:
+    """
+    所有 Tools 实例和并发用户共享的令牌桶限流器
+
+    同时维护每秒和每分钟两个令牌桶。令牌不足时调用方排队等待，
+    超过最长等待时间才失败。收到 429 时按 Retry-After 或指数退避暂停所有请求。
+    """
+
+    def __init__(self, per_second: int = 30, per_minute: int = 60):
+        self.per_second = per_second
+        self.per_minute = per_minute
+        self._second_tokens = float(per_second)
+        self._minute_tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._strikes = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+    @property
+    def queue_depth(self) -> int:
+        """当前排队等待令牌的请求数"""
+        return self._waiting
+
+    def configure(self, per_second: int, per_minute: int):
+        """更新限额 (来自工具设置)"""
+        with self._cond:
+            self.per_second = max(1, per_second)
+            self.per_minute = max(1, per_minute)
+            self._second_tokens = min(self._second_tokens, self.per_second)
+            self._minute_tokens = min(self._minute_tokens, self.per_minute)
+
+    def acquire(self, max_wait: float):
+        """获取一个令牌，最多等待 max_wait 秒，否则抛出 RateLimitTimeout"""
+        deadline = time.monotonic() + max_wait
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if (
+                        now >= self._paused_until
+                        and self._second_tokens >= 1
+                        and self._minute_tokens >= 1
+                    ):
+                        self._second_tokens -= 1
+                        self._minute_tokens -= 1
+                        return
+                    wait = max(
+                        self._paused_until - now,
+                        (1 - self._second_tokens) / self.per_second,
+                        (1 - self._minute_tokens) * 60 / self.per_minute,
+                    )
+                    if now + wait > deadline:
+                        raise RateLimitTimeout(
+                            f"请求过于频繁, 排队超过 {max_wait:.0f} 秒 (当前排队: {self._waiting})"
+                        )
+                    self._cond.wait(wait)
+            finally:
+                self._waiting -= 1
+
+    def throttle(self, retry_after: Optional[float] = None) -> float:
+        """收到 429 后暂停所有请求，返回暂停秒数"""
+        with self._cond:
+            self._strikes += 1
+            if retry_after is None:
+                retry_after = min(MAX_BACKOFF, 2 ** (self._strikes - 1))
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._second_tokens = min(self._second_tokens, 0.0)
+            self._cond.notify_all()
+            return retry_after
+
+    def pause(self, seconds: float):
+        """服务端报告额度已用完时，暂停到额度重置"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def succeeded(self):
+        """请求成功，重置退避"""
+        if self._strikes:
+            with self._cond:
+                self._strikes = 0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self._second_tokens = min(
+            self.per_second, self._second_tokens + elapsed * self.per_second
+        )
+        self._minute_tokens = min(
+            self.per_minute, self._minute_tokens + elapsed * self.per_minute / 60
+        )
+
+
+def normalize_params(params: dict) -> dict:
+    """股票代码不区分大小写，统一为大写后再生成缓存键和发送请求"""
+    if isinstance(params.get("symbol"), str):
+        return {**params, "symbol": params["symbol"].strip().upper()}
+    return params
+
+
+def cache_ttl(path: str, params: dict, data: Any) -> float:
+    """
+    端点的缓存时间 (秒)
+
+    财报数据缓存到预计的下一份财报提交时间 (最近一份的提交日期加上报告间隔)，
+    已经过期的估计按默认时间缓存。
+    """
+    ttl = CACHE_TTL.get(path, 0)
+    if path == "/stock/financials-reported" and isinstance(data, dict):
+        try:
+            filed = max(
+                datetime.strptime(report["filedDate"][:10], "%Y-%m-%d")
+                for report in data.get("data") or []
+            )
+        except (KeyError, TypeError, ValueError):
+            return ttl
+        interval = FILING_INTERVAL_DAYS.get(params.get("freq"), 92)
+        next_filing = filed + timedelta(days=interval)
+        ttl = max(ttl, (next_filing - datetime.now()).total_seconds())
+    return ttl
+
+
+class JsonStream:
+    """
+    增量 JSON 读取器: 从字节块流中按需解码下一个值
+
+    每次只在缓冲区中保留尚未解析的部分，值不完整时成倍读取更多数据再重试，
+    总解析量与已读取的数据量成线性关系。
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def peek(self) -> str:
+        """跳过空白，返回下一个字符 (不消耗)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill(1):
+                raise ValueError("JSON 意外结束")
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON 格式错误: 期望 {char!r}，实际为 {found!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """解码下一个完整的值"""
+        self.peek()
+        while True:
+            pending = len(self.buffer) - self.pos
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill(2 * pending):
+                    raise
+                continue
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                # 数字可能在块边界被截断 ("2." | "5", "1e" | "3")，
+                # 数字字符延伸到缓冲区末尾时读到更多数据后再确认
+                token_end = end
+                while (
+                    token_end < len(self.buffer)
+                    and self.buffer[token_end] in NUMBER_CHARS
+                ):
+                    token_end += 1
+                if token_end == len(self.buffer) and self._fill(2 * pending):
+                    continue
+                if token_end != end:
+                    raise ValueError(
+                        f"JSON 格式错误: 无效的数字 {self.buffer[self.pos : token_end]!r}"
+                    )
+            self.pos = end
+            return value
+
+    def _fill(self, size: int) -> bool:
+        """读取数据直到未解析部分至少为 size 个字符，已到结尾时返回 False"""
+        if self.eof:
+            return False
+        parts = [self.buffer[self.pos :]]
+        pending = len(parts[0])
+        for chunk in self._chunks:
+            text = self._text.decode(chunk)
+            parts.append(text)
+            pending += len(text)
+            if pending >= size:
+                break
+        else:
+            parts.append(self._text.decode(b"", final=True))
+            self.eof = True
+        self.buffer = "".join(parts)
+        self.pos = 0
+        return len(self.buffer) > len(parts[0]) or not self.eof
+
+
+def iter_json_array(chunks, key: str):
+    """
+    逐个解析 JSON 对象中顶层 key 数组的元素，不构建整个文档
+
+    其他顶层字段会被解码后丢弃；调用方可随时停止迭代，剩余数据不再读取。
+    """
+    stream = JsonStream(chunks)
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        name = stream.value()
+        stream.expect(":")
+        if name == key and stream.peek() == "[":
+            stream.expect("[")
+            if stream.peek() == "]":
+                return
+            while True:
+                yield stream.value()
+                if stream.peek() == "]":
+                    return
+                stream.expect(",")
+        stream.value()
+        if stream.peek() == "}":
+            return
+        stream.expect(",")
+
+
+def parse_financials_reported(response, limit: int, items: List[str]) -> dict:
+    """
+    流式解析 /stock/financials-reported 响应
+
+    只读取最近 limit 份报告，每份只保留表头字段和 items 中的科目
+    (科目名见 FINANCIAL_LINE_ITEMS，或直接使用 XBRL 概念名)。
+    """
+    # 概念名 (去掉 us-gaap_ 等前缀，小写) -> (科目, 优先级)
+    concepts = {}
+    for item in items:
+        for rank, concept in enumerate(FINANCIAL_LINE_ITEMS.get(item, (item,))):
+            concepts.setdefault(_concept_key(concept), (item, rank))
+
+    reports = []
+    if limit > 0:
+        chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+        for report in iter_json_array(chunks, "data"):
+            found = {}
+            for section in ("ic", "bs", "cf"):
+                for line in (report.get("report") or {}).get(section) or []:
+                    match = concepts.get(_concept_key(line.get("concept") or ""))
+                    if match is None:
+                        continue
+                    item, rank = match
+                    if item not in found or rank < found[item][0]:
+                        found[item] = (rank, line.get("value"), line.get("unit"))
+            summary = {field: report.get(field) for field in REPORT_FIELDS}
+            summary["items"] = {
+                item: {"value": found[item][1], "unit": found[item][2]}
+                for item in items
+                if item in found
+            }
+            reports.append(summary)
+            if len(reports) >= limit:
+                break
+    return {"data": reports}
+
+
+def _concept_key(concept: str) -> str:
+    """us-gaap_NetIncomeLoss / us-gaap:NetIncomeLoss / NetIncomeLoss -> netincomeloss"""
+    return concept.replace(":", "_").split("_", 1)[-1].lower()
+
+
+class ResponseCache:
+    """
+    按端点分级 TTL 的 LRU 响应缓存
+
+    所有实例共享，内存由最大条目数限制，并按端点统计命中率。
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (data, expires_at)
+        self._stats = {}  # path -> [hits, misses]
+        self._lock = threading.Lock()
+
+    def get(self, path: str, key: tuple):
+        """返回 (是否命中, 数据)"""
+        with self._lock:
+            counters = self._stats.setdefault(path, [0, 0])
+            entry = self._entries.get(key)
+            if entry is not None and time.time() < entry[1]:
+                self._entries.move_to_end(key)
+                counters[0] += 1
+                return True, entry[0]
+            if entry is not None:
+                del self._entries[key]
+            counters[1] += 1
+            return False, None
+
+    def put(self, key: tuple, data: Any, ttl: float):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (data, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max(1, self.max_entries):
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """各端点的命中次数、未命中次数和命中率"""
+        with self._lock:
+            return {
+                path: {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+                }
+                for path, (hits, misses) in self._stats.items()
+            }
+
+
+class SingleFlight:
+    """
+    合并相同的并发请求
+
+    同一个键同时只有一个调用真正执行，其余调用等待并共享它的结果 (或异常)，
+    并按端点统计被合并的调用数。
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> {"done", "result", "error"}
+        self._stats = {}  # path -> [执行次数, 被合并次数]
+        self._lock = threading.Lock()
+
+    def do(self, path: str, key: tuple, fn: Callable) -> Any:
+        with self._lock:
+            counters = self._stats.setdefault(path, [0, 0])
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {
+                    "done": threading.Event(),
+                    "result": None,
+                    "error": None,
+                }
+                counters[0] += 1
+            else:
+                counters[1] += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+    def stats(self) -> dict:
+        """各端点实际执行的请求数和被合并的调用数"""
+        with self._lock:
+            return {
+                path: {"executed": executed, "collapsed": collapsed}
+                for path, (executed, collapsed) in self._stats.items()
+            }
+
+
+class LiveQuoteStream:
+    """
+    订阅 Finnhub WebSocket 成交推送的后台线程，维护内存中的最新报价表
+
+    订阅的股票为关注列表加上最近查询过的股票。报价以最近一次 REST 报价
+    (开盘价、前收盘价、最高/最低价) 为基础，用实时成交价更新。
+    连接断开后按指数退避自动重连。
+    """
+
+    def __init__(self, url: str, token: str):
+        self.url = url
+        self.token = token
+        self.watchlist = set()
+        self._recent = {}  # symbol -> 最近查询时间 (monotonic)
+        self._subscribed = set()
+        self._base = {}  # symbol -> REST 报价
+        # symbol -> [价格, 成交时间 (秒), 最高, 最低, 收到时间 (monotonic)]
+        self._trades = {}
+        self._lock = threading.Lock()
+        self._ws = None
+        self._connected = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="finnhub-ws", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def stop(self, timeout: float = 5):
+        """关闭连接并等待后台线程退出"""
+        with self._lock:
+            self._stopped.set()
+            ws = self._ws
+        if ws is not None:
+            ws.close()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def track(self, symbols, watchlist, recent_seconds: float):
+        """
+        更新订阅: 关注列表加上最近查询的股票，过期的股票取消订阅
+
+        :param symbols: 本次查询的股票
+        :param watchlist: 关注列表
+        :param recent_seconds: 最近查询的股票保留订阅的秒数
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.watchlist = set(watchlist)
+            for symbol in symbols:
+                self._recent[symbol] = now
+            for symbol, seen in list(self._recent.items()):
+                if now - seen > recent_seconds:
+                    del self._recent[symbol]
+            wanted = self.watchlist | set(self._recent)
+            added = wanted - self._subscribed
+            removed = self._subscribed - wanted
+            self._subscribed = wanted
+            for symbol in removed:
+                self._trades.pop(symbol, None)
+        if self._connected:
+            for symbol in added:
+                self._send("subscribe", symbol)
+            for symbol in removed:
+                self._send("unsubscribe", symbol)
+
+    def update_base(self, symbol: str, quote: dict):
+        """记录 REST 报价，作为实时报价的基础"""
+        with self._lock:
+            self._base[symbol] = dict(quote)
+            trade = self._trades.get(symbol)
+            # 比 REST 报价更旧的成交不再使用
+            if trade and trade[1] < (quote.get("t") or 0):
+                del self._trades[symbol]
+
+    def quote(self, symbol: str, max_age: float) -> Optional[dict]:
+        """
+        本地报价，格式与 /quote 相同
+
+        :param max_age: 最近成交距今的最大秒数，超过视为过期
+        :return: 报价，无基础报价、无成交或已过期时返回 None
+        """
+        with self._lock:
+            base = self._base.get(symbol)
+            trade = self._trades.get(symbol)
+            if not self._connected or not base or not trade:
+                return None
+            price, traded_at, high, low, received = trade
+        if time.monotonic() - received > max_age:
+            return None
+
+        previous_close = base.get("pc") or 0
+        quote = dict(base)
+        quote.update(
+            {
+                "c": price,
+                "h": max(base.get("h") or price, high),
+                "l": min(base.get("l") or price, low),
+                "d": round(price - previous_close, 4) if previous_close else None,
+                "dp": (
+                    round((price - previous_close) / previous_close * 100, 4)
+                    if previous_close
+                    else None
+                ),
+                "t": int(traded_at),
+            }
+        )
+        return quote
+
+    def _run(self):
+        backoff = 1
+        while True:
+            with self._lock:
+                if self._stopped.is_set():
+                    break
+                ws = self._ws = websocket.WebSocketApp(
+                    f"{self.url}?token={self.token}",
+                    on_open=self._on_open,
+                    on_message=self._on_message,
+                    on_close=self._on_close,
+                    on_error=self._on_close,
+                )
+            started = time.monotonic()
+            ws.run_forever(ping_interval=30, ping_timeout=10)
+            self._connected = False
+            # 连接稳定过一段时间则重新从 1 秒开始退避
+            if time.monotonic() - started > MAX_BACKOFF:
+                backoff = 1
+            # 退避期间被停止时立即退出
+            if self._stopped.wait(backoff):
+                break
+            backoff = min(MAX_BACKOFF, backoff * 2)
+
+    def _on_open(self, ws):
+        # 创建连接后、开始运行前被停止时 close() 不生效，在这里补上
+        if self._stopped.is_set():
+            ws.close()
+            return
+        self._connected = True
+        with self._lock:
+            symbols = list(self._subscribed)
+        for symbol in symbols:
+            self._send("subscribe", symbol)
+
+    def _on_close(self, ws, *args):
+        self._connected = False
+
+    def _on_message(self, ws, message: str):
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            return
+        if payload.get("type") != "trade":
+            return
+        now = time.monotonic()
+        with self._lock:
+            for trade in payload.get("data") or []:
+                symbol = trade.get("s")
+                price = trade.get("p")
+                if symbol not in self._subscribed or price is None:
+                    continue
+                traded_at = (trade.get("t") or 0) / 1000
+                current = self._trades.get(symbol)
+                if current is None:
+                    self._trades[symbol] = [price, traded_at, price, price, now]
+                elif traded_at >= current[1]:
+                    current[0], current[1], current[4] = price, traded_at, now
+                    current[2] = max(current[2], price)
+                    current[3] = min(current[3], price)
+
+    def _send(self, action: str, symbol: str):
+        try:
+            self._ws.send(json.dumps({"type": action, "symbol": symbol}))
+        except Exception:
+            # 连接已断开，重连后 _on_open 会重新订阅
+            pass
+
+
+class SymbolIndex:
+    """
+    由 /stock/symbol 列表构建的本地股票代码索引
+
+    包含代码精确映射、代码前缀树，以及描述 (公司名) 的分词倒排索引，
+    支持前缀和拼写容错匹配。重建时先构建新结构再整体替换，查询不受影响。
+    """
+
+    def __init__(self):
+        self.exchanges = ()
+        self.built_at = 0.0
+        self.failed_at = 0.0
+        self._entries = []  # (symbol, description, type)
+        self._exact = {}  # 代码 -> [id]
+        self._trie = {}  # 代码前缀树，"" 键保存在此结束的 id
+        self._tokens = {}  # 描述分词 -> [id]
+        self._vocabulary = []  # 排序后的分词，用于前缀和模糊匹配
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._entries)
+
+    def is_stale(self, exchanges, max_age: float) -> bool:
+        # 重建失败后 5 分钟内不再重试
+        if time.time() - self.failed_at < 5 * MINUTE:
+            return False
+        return (
+            tuple(exchanges) != self.exchanges or time.time() - self.built_at > max_age
+        )
+
+    def start_refresh(self) -> bool:
+        """标记开始重建，已有重建在进行时返回 False"""
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+            return True
+
+    def finish_refresh(self, succeeded: bool):
+        with self._lock:
+            self._refreshing = False
+            if not succeeded:
+                self.failed_at = time.time()
+
+    def build(self, listings: List[dict], exchanges):
+        """用 /stock/symbol 返回的列表重建索引"""
+        entries = []
+        exact = {}
+        trie = {}
+        tokens = {}
+        for item in listings:
+            symbol = item.get("symbol")
+            if not symbol:
+                continue
+            i = len(entries)
+            description = item.get("description") or ""
+            entries.append((symbol, description, item.get("type") or ""))
+
+            keys = {symbol.upper(), (item.get("displaySymbol") or symbol).upper()}
+            for key in keys:
+                exact.setdefault(key, []).append(i)
+                node = trie
+                for char in key:
+                    node = node.setdefault(char, {})
+                node.setdefault("", []).append(i)
+            for token in set(self._tokenize(description)):
+                tokens.setdefault(token, []).append(i)
+
+        with self._lock:
+            self._entries = entries
+            self._exact = exact
+            self._trie = trie
+            self._tokens = tokens
+            self._vocabulary = sorted(tokens)
+            self.exchanges = tuple(exchanges)
+            self.built_at = time.time()
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        """精确代码 > 代码前缀 > 描述分词匹配，同级优先普通股和较短的代码"""
+        with self._lock:
+            entries = self._entries
+            exact = self._exact
+            trie = self._trie
+            tokens = self._tokens
+            vocabulary = self._vocabulary
+
+        scores = {}
+        key = query.strip().upper()
+        for i in exact.get(key, []):
+            scores[i] = 3.0
+
+        if key and " " not in key:
+            node = trie
+            for char in key:
+                node = node.get(char)
+                if node is None:
+                    break
+            else:
+                # 按代码长度逐层展开，优先较短的代码
+                level = [node]
+                found = 0
+                while level and found < limit * 5:
+                    next_level = []
+                    for current in level:
+                        for child_key, child in current.items():
+                            if child_key == "":
+                                for i in child:
+                                    scores.setdefault(i, 2.0)
+                                    found += 1
+                            else:
+                                next_level.append(child)
+                    level = next_level
+
+        words = self._tokenize(query)
+        if words:
+            matched = {}
+            for position, word in enumerate(words):
+                weights = {}
+                for i in tokens.get(word, []):
+                    weights[i] = 1.0
+                if position == len(words) - 1:
+                    # 最后一个词可能还没输完，做前缀匹配
+                    start = bisect_left(vocabulary, word)
+                    for candidate in vocabulary[start : start + 50]:
+                        if not candidate.startswith(word):
+                            break
+                        for i in tokens[candidate]:
+                            weights.setdefault(i, 0.9)
+                if not weights:
+                    # 拼写容错: 只比较首字母相同的词
+                    start = bisect_left(vocabulary, word[0])
+                    end = bisect_left(vocabulary, chr(ord(word[0]) + 1), start)
+                    for candidate in get_close_matches(
+                        word, vocabulary[start:end], n=3, cutoff=0.8
+                    ):
+                        for i in tokens[candidate]:
+                            weights.setdefault(i, 0.7)
+                for i, weight in weights.items():
+                    matched[i] = matched.get(i, 0.0) + weight
+            for i, total in matched.items():
+                score = total / len(words)
+                if score >= 0.7:
+                    scores[i] = max(scores.get(i, 0.0), score)
+
+        ranked = sorted(
+            scores,
+            key=lambda i: (
+                -scores[i],
+                entries[i][2] != "Common Stock",
+                len(entries[i][0]),
+                entries[i][0],
+            ),
+        )
+        return [
+            {
+                "symbol": entries[i][0],
+                "description": entries[i][1],
+                "type": entries[i][2],
+            }
+            for i in ranked[:limit]
+        ]
+
+    @staticmethod
+    def _tokenize(text: str) -> List[str]:
+        return "".join(c if c.isalnum() else " " for c in text.lower()).split()
+
+
+class NewsStore:
+    """
+    按股票和类别增量维护的新闻存储
+
+    每个来源记录高水位 (最新的 datetime 和 id) 以及已覆盖的日期区间，
+    之后只需获取更新的新闻。新闻按 id 和链接去重，按条数和时间淘汰，
+    来源本身按最近使用淘汰。
+    """
+
+    def __init__(self):
+        self._feeds = OrderedDict()  # (类型, 名称) -> feed
+        self._lock = threading.Lock()
+
+    def state(self, key: tuple) -> dict:
+        """来源的高水位和覆盖区间: latest, max_id, covered_from, covered_to, fetched_at"""
+        with self._lock:
+            feed = self._feeds.get(key)
+            if feed is None:
+                return {
+                    "latest": 0,
+                    "max_id": 0,
+                    "covered_from": None,
+                    "covered_to": None,
+                    "fetched_at": 0.0,
+                }
+            return {name: feed[name] for name in NEWS_STATE_FIELDS}
+
+    def add(
+        self,
+        key: tuple,
+        items: List[dict],
+        covered_from: Optional[date] = None,
+        covered_to: Optional[date] = None,
+    ) -> int:
+        """写入新获取的新闻，返回新增条数"""
+        now = time.time()
+        with self._lock:
+            feed = self._feeds.get(key)
+            if feed is None:
+                feed = self._feeds[key] = {
+                    "items": {},  # id (或链接) -> 新闻
+                    "urls": set(),
+                    "latest": 0,
+                    "max_id": 0,
+                    "covered_from": covered_from,
+                    "covered_to": covered_to,
+                    "fetched_at": 0.0,
+                }
+            self._feeds.move_to_end(key)
+            while len(self._feeds) > NEWS_MAX_FEEDS:
+                self._feeds.popitem(last=False)
+
+            added = 0
+            for item in items:
+                ident = item.get("id") or item.get("url")
+                url = item.get("url")
+                if not ident or ident in feed["items"] or url in feed["urls"]:
+                    continue
+                feed["items"][ident] = item
+                if url:
+                    feed["urls"].add(url)
+                feed["latest"] = max(feed["latest"], item.get("datetime") or 0)
+                if isinstance(item.get("id"), int):
+                    feed["max_id"] = max(feed["max_id"], item["id"])
+                added += 1
+
+            if covered_from is not None:
+                feed["covered_from"] = min(
+                    feed["covered_from"] or covered_from, covered_from
+                )
+            if covered_to is not None:
+                feed["covered_to"] = max(feed["covered_to"] or covered_to, covered_to)
+            feed["fetched_at"] = now
+            self._evict(feed, now)
+            return added
+
+    def items(self, key: tuple, since: float = 0, limit: int = 5) -> List[dict]:
+        """since (时间戳) 之后的新闻，最新的在前"""
+        with self._lock:
+            feed = self._feeds.get(key)
+            if feed is None:
+                return []
+            self._feeds.move_to_end(key)
+            recent = [
+                item
+                for item in feed["items"].values()
+                if (item.get("datetime") or 0) >= since
+            ]
+        recent.sort(key=lambda item: item.get("datetime") or 0, reverse=True)
+        return recent[:limit]
+
+    def _evict(self, feed: dict, now: float):
+        """
+        删除超过保留天数的新闻，条数超限时删除最旧的
+
+        只有按时间淘汰会缩小覆盖区间；按条数删除的新闻所在区间仍记为已覆盖，
+        否则下次查询会重新获取这段区间，获取后又被删除。
+        """
+        cutoff = now - NEWS_RETENTION_DAYS * DAY
+        recent = sorted(
+            (
+                item
+                for item in feed["items"].values()
+                if (item.get("datetime") or 0) >= cutoff
+            ),
+            key=lambda item: item.get("datetime") or 0,
+            reverse=True,
+        )
+        if len(recent) == len(feed["items"]) <= NEWS_MAX_ITEMS:
+            return
+
+        recent = recent[:NEWS_MAX_ITEMS]
+        feed["items"] = {item.get("id") or item.get("url"): item for item in recent}
+        feed["urls"] = {item["url"] for item in recent if item.get("url")}
+        if feed["covered_from"] is not None:
+            feed["covered_from"] = max(feed["covered_from"], date.fromtimestamp(cutoff))
+
+
+class InsiderHistory:
+    """
+    内部交易历史的列式数组 (需要 numpy)
+
+    每笔交易一行: 日期、内部人、交易代码、股数变化和金额，
+    名称和代码编码为整数，分组统计都用 bincount 一次完成。
+    """
+
+    def __init__(self, transactions: List[dict]):
+        rows = [
+            t
+            for t in transactions
+            if (t.get("transactionDate") or t.get("filingDate")) and t.get("change")
+        ]
+        self.dates = np.array(
+            [(t.get("transactionDate") or t["filingDate"])[:10] for t in rows],
+            dtype="datetime64[D]",
+        )
+        self.names, self.insider = np.unique(
+            np.array([t.get("name") or "N/A" for t in rows], dtype=str),
+            return_inverse=True,
+        )
+        self.codes, self.code = np.unique(
+            np.array([t.get("transactionCode") or "?" for t in rows], dtype=str),
+            return_inverse=True,
+        )
+        self.change = np.array([t["change"] for t in rows], dtype=float)
+        self.price = np.array(
+            [t.get("transactionPrice") or 0 for t in rows], dtype=float
+        )
+        self.value = self.change * self.price
+
+        order = np.argsort(self.dates, kind="stable")
+        for field in ("dates", "insider", "code", "change", "price", "value"):
+            setattr(self, field, getattr(self, field)[order])
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def since(self, start) -> "np.ndarray":
+        """start (含) 之后交易的掩码"""
+        return self.dates >= np.datetime64(start, "D")
+
+    def by_insider(self, mask) -> dict:
+        """每位内部人的净股数、买入金额和卖出金额"""
+        return self._group(self.insider[mask], len(self.names), mask)
+
+    def by_code(self, mask) -> dict:
+        """每种交易代码的笔数和净股数"""
+        return self._group(self.code[mask], len(self.codes), mask)
+
+    def by_month(self, mask, start) -> dict:
+        """start 所在月份起每月的净股数、买卖金额和 MSPR (含滚动 MSPR)"""
+        first = np.datetime64(start, "M")
+        months = self.dates[mask].astype("datetime64[M]")
+        last = max(first, months.max()) if len(months) else first
+        index = (months - first).astype(int)
+        groups = self._group(index, int((last - first).astype(int)) + 1, mask)
+        groups["months"] = first + np.arange(len(groups["count"]))
+
+        # MSPR 只统计公开市场买入 (P) 和卖出 (S) 的股数: 100 * (买 - 卖) / (买 + 卖)
+        open_market = self._code_mask("P") | self._code_mask("S")
+        change = np.where(open_market, self.change, 0)[mask]
+        size = len(groups["count"])
+        bought = np.bincount(index, weights=np.maximum(change, 0), minlength=size)
+        sold = np.bincount(index, weights=np.maximum(-change, 0), minlength=size)
+        groups["mspr"] = self._mspr(bought, sold)
+
+        window = MSPR_WINDOW_MONTHS
+        bought_sum = np.cumsum(np.concatenate(([0.0], bought)))
+        sold_sum = np.cumsum(np.concatenate(([0.0], sold)))
+        lower = np.maximum(np.arange(1, size + 1) - window, 0)
+        groups["rolling_mspr"] = self._mspr(
+            bought_sum[1:] - bought_sum[lower], sold_sum[1:] - sold_sum[lower]
+        )
+        return groups
+
+    def cluster_buys(self, mask) -> List[dict]:
+        """
+        集中买入: CLUSTER_DAYS 天内至少 CLUSTER_MIN_INSIDERS 位不同内部人公开市场买入
+
+        按买入日期排序，用内部人的累计计数矩阵一次算出每个窗口内的不同人数，
+        重叠的窗口只报告最早的一个。
+        """
+        buys = mask & self._code_mask("P") & (self.change > 0)
+        dates = self.dates[buys]
+        if len(dates) == 0:
+            return []
+        insiders = self.insider[buys]
+        values = self.value[buys]
+
+        ends = np.searchsorted(dates, dates + CLUSTER_DAYS, side="left")
+        present = np.zeros((len(dates) + 1, len(self.names)), dtype=np.int32)
+        present[np.arange(1, len(dates) + 1), insiders] = 1
+        present = np.cumsum(present, axis=0)
+        distinct = np.count_nonzero(
+            present[ends] - present[np.arange(len(dates))], axis=1
+        )
+        value_sum = np.concatenate(([0.0], np.cumsum(values)))
+        totals = value_sum[ends] - value_sum[np.arange(len(dates))]
+
+        clusters = []
+        covered_until = None
+        for i in np.flatnonzero(distinct >= CLUSTER_MIN_INSIDERS):
+            if covered_until is not None and dates[i] < covered_until:
+                continue
+            covered_until = dates[i] + CLUSTER_DAYS
+            clusters.append(
+                {
+                    "start": str(dates[i]),
+                    "insiders": int(distinct[i]),
+                    "value": float(totals[i]),
+                }
+            )
+        return clusters
+
+    def _group(self, index, size: int, mask) -> dict:
+        change = self.change[mask]
+        value = self.value[mask]
+        return {
+            "count": np.bincount(index, minlength=size),
+            "net_shares": np.bincount(index, weights=change, minlength=size),
+            "bought_value": np.bincount(
+                index, weights=np.where(change > 0, value, 0), minlength=size
+            ),
+            "sold_value": np.bincount(
+                index, weights=np.where(change < 0, -value, 0), minlength=size
+            ),
+        }
+
+    def _code_mask(self, code: str):
+        matches = np.flatnonzero(self.codes == code)
+        if len(matches) == 0:
+            return np.zeros(len(self.code), dtype=bool)
+        return self.code == matches[0]
+
+    @staticmethod
+    def _mspr(bought, sold):
+        total = bought + sold
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(total > 0, 100 * (bought - sold) / total, np.nan)
+
+
+def sma(x, n: int):
+    """简单移动平均，前 n-1 个值为 NaN"""
+    out = np.full(len(x), np.nan)
+    if len(x) >= n:
+        total = np.cumsum(np.concatenate(([0.0], x)))
+        out[n - 1 :] = (total[n:] - total[:-n]) / n
+    return out
+
+
+def rolling_std(x, n: int):
+    """滚动标准差 (总体)，前 n-1 个值为 NaN"""
+    out = np.full(len(x), np.nan)
+    if len(x) >= n:
+        centered = x - x.mean()  # 减去均值，降低累加平方时的精度损失
+        total = np.cumsum(np.concatenate(([0.0], centered)))
+        squares = np.cumsum(np.concatenate(([0.0], centered * centered)))
+        mean = (total[n:] - total[:-n]) / n
+        variance = (squares[n:] - squares[:-n]) / n - mean * mean
+        out[n - 1 :] = np.sqrt(np.maximum(variance, 0))
+    return out
+
+
+def smooth(x, alpha: float, n: int):
+    """
+    指数平滑: 以前 n 个值的均值为初值，之后 y[i] = (1 - alpha) * y[i-1] + alpha * x[i]
+
+    递推按 EMA_BLOCK 分块，每块用一次矩阵乘法完成 (权重均不大于 1，数值稳定)，
+    只有块之间是 Python 循环。前 n-1 个值为 NaN。
+    """
+    out = np.full(len(x), np.nan)
+    if len(x) < n:
+        return out
+    previous = x[:n].mean()
+    out[n - 1] = previous
+
+    lag = np.subtract.outer(np.arange(EMA_BLOCK), np.arange(EMA_BLOCK))
+    weights = np.where(lag >= 0, alpha * (1 - alpha) ** np.maximum(lag, 0), 0.0)
+    decay = (1 - alpha) ** np.arange(1, EMA_BLOCK + 1)
+    for start in range(n, len(x), EMA_BLOCK):
+        block = x[start : start + EMA_BLOCK]
+        size = len(block)
+        values = weights[:size, :size] @ block + decay[:size] * previous
+        out[start : start + size] = values
+        previous = values[-1]
+    return out
+
+
+def ema(x, n: int):
+    """指数移动平均 (alpha = 2 / (n + 1))"""
+    return smooth(x, 2 / (n + 1), n)
+
+
+def rsi(close, n: int = 14):
+    """相对强弱指数 (Wilder 平滑)"""
+    out = np.full(len(close), np.nan)
+    if len(close) <= n:
+        return out
+    change = np.diff(close)
+    gain = smooth(np.maximum(change, 0), 1 / n, n)
+    loss = smooth(np.maximum(-change, 0), 1 / n, n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # 没有任何涨跌 (价格不变) 时 RSI 取中性值 50
+        out[1:] = np.where(
+            loss > 0, 100 - 100 / (1 + gain / loss), np.where(gain > 0, 100.0, 50.0)
+        )
+    out[:n] = np.nan
+    return out
+
+
+def macd(close, fast: int = 12, slow: int = 26, signal: int = 9):
+    """MACD 线、信号线和柱状图"""
+    line = ema(close, fast) - ema(close, slow)
+    signal_line = np.full(len(close), np.nan)
+    if len(close) >= slow:
+        signal_line[slow - 1 :] = smooth(line[slow - 1 :], 2 / (signal + 1), signal)
+    return line, signal_line, line - signal_line
+
+
+def bollinger(close, n: int = 20, width: float = 2.0):
+    """布林带: 中轨、上轨、下轨"""
+    middle = sma(close, n)
+    deviation = rolling_std(close, n)
+    return middle, middle + width * deviation, middle - width * deviation
+
+
+def atr(high, low, close, n: int = 14):
+    """平均真实波幅 (Wilder 平滑)"""
+    previous = np.concatenate(([close[0]], close[:-1])) if len(close) else close
+    true_range = np.maximum.reduce(
+        [high - low, np.abs(high - previous), np.abs(low - previous)]
+    )
+    return smooth(true_range, 1 / n, n)
+
+
+def technical_indicators(bars, bars_per_year: float) -> dict:
+    """K 线 (CANDLE_FIELDS 行) 的常用技术指标，返回最新一根 K 线的值"""
+    high, low, close = (np.ascontiguousarray(bars[i], dtype=float) for i in (2, 3, 4))
+    returns = np.diff(np.log(close)) if len(close) > 1 else np.array([])
+    line, signal_line, histogram = macd(close)
+    middle, upper, lower = bollinger(close)
+
+    def last(series):
+        return float(series[-1]) if len(series) else float("nan")
+
+    band = last(upper) - last(lower)
+    return {
+        "close": last(close),
+        "sma20": last(sma(close, 20)),
+        "sma50": last(sma(close, 50)),
+        "sma200": last(sma(close, 200)),
+        "ema12": last(ema(close, 12)),
+        "ema26": last(ema(close, 26)),
+        "rsi14": last(rsi(close)),
+        "macd": last(line),
+        "macd_signal": last(signal_line),
+        "macd_histogram": last(histogram),
+        "bollinger_upper": last(upper),
+        "bollinger_lower": last(lower),
+        "bollinger_percent": (
+            (last(close) - last(lower)) / band if band else float("nan")
+        ),
+        "atr14": last(atr(high, low, close)),
+        "return_1": float(np.expm1(returns[-1])) if len(returns) else float("nan"),
+        "return_20": (
+            float(np.expm1(returns[-20:].sum())) if len(returns) >= 20 else float("nan")
+        ),
+        "return_total": float(close[-1] / close[0] - 1) if len(close) else float("nan"),
+        "volatility_20": (
+            float(returns[-20:].std(ddof=1) * np.sqrt(bars_per_year))
+            if len(returns) >= 20
+            else float("nan")
+        ),
+    }
+
+
+def percentile_ranks(matrix):
+    """
+    每列的百分位排名 (0-100，值越大排名越高)，NaN 不参与排名并保持为 NaN
+
+    相同的值取平均排名 (与先后顺序无关)；只有一个有效值的列排名为 100。
+    """
+    ranks = np.full(matrix.shape, np.nan)
+    for j in range(matrix.shape[1]):
+        valid = ~np.isnan(matrix[:, j])
+        values = matrix[valid, j]
+        if len(values) == 1:
+            ranks[valid, j] = 100.0
+        elif len(values) > 1:
+            ordered = np.sort(values)
+            below = np.searchsorted(ordered, values, "left")
+            upto = np.searchsorted(ordered, values, "right")
+            ranks[valid, j] = (below + upto - 1) / 2 / (len(values) - 1) * 100
+    return ranks
+
+
+class CandleStore:
+    """
+    按股票和周期保存的 K 线历史 (需要 numpy)
+
+    每个序列是 (6, n) 的 float64 数组 (CANDLE_FIELDS 各占一行，按时间排序)，
+    保存为 .npy 文件并以内存映射方式读取；新 K 线合并后整体写入新文件再替换。
+    磁盘不可写时只保存在内存中。
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        # (symbol, resolution) -> {"bars", "fetched_at", "covered_from"}
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def get(self, symbol: str, resolution: str) -> dict:
+        """序列的 bars (可能为 None)、上次获取时间和已覆盖的起始时间戳"""
+        with self._lock:
+            series = self._series.get((symbol, resolution))
+            if series is None:
+                bars = None
+                path = self._path(symbol, resolution)
+                if path and os.path.exists(path):
+                    try:
+                        bars = np.load(path, mmap_mode="r")
+                    except (OSError, ValueError):
+                        bars = None
+                series = self._series[(symbol, resolution)] = {
+                    "bars": bars,
+                    "fetched_at": 0.0,
+                    "covered_from": None,
+                }
+            return dict(series)
+
+    def merge(
+        self,
+        symbol: str,
+        resolution: str,
+        new_bars,
+        covered_from: Optional[int] = None,
+    ):
+        """合并新获取的 K 线 (同一时间戳以新数据为准) 并记录获取时间"""
+        with self._lock:
+            series = self._series.setdefault(
+                (symbol, resolution),
+                {"bars": None, "fetched_at": 0.0, "covered_from": None},
+            )
+            series["fetched_at"] = time.time()
+            if covered_from is not None:
+                series["covered_from"] = min(
+                    series["covered_from"] or covered_from, covered_from
+                )
+            if new_bars is None or not new_bars.shape[1]:
+                return
+
+            old = series["bars"]
+            combined = (
+                new_bars if old is None else np.concatenate((old, new_bars), axis=1)
+            )
+            # 倒序后 unique 取到的是每个时间戳最后出现 (即最新获取) 的一根
+            _, index = np.unique(combined[0][::-1], return_index=True)
+            combined = np.ascontiguousarray(combined[:, len(combined[0]) - 1 - index])
+            series["bars"] = self._save(symbol, resolution, combined)
+
+    def _path(self, symbol: str, resolution: str) -> Optional[str]:
+        if not self.directory:
+            return None
+        name = "".join(c if c.isalnum() or c in "._-" else "_" for c in symbol)
+        return os.path.join(self.directory, f"{name}_{resolution}.npy")
+
+    def _save(self, symbol: str, resolution: str, bars):
+        path = self._path(symbol, resolution)
+        if not path:
+            return bars
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temporary = f"{path}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                np.save(f, bars)
+            os.replace(temporary, path)
+            return np.load(path, mmap_mode="r")
+        except OSError:
+            return bars
+
+
+class EarningsCalendarStore:
+    """
+    按日期窗口增量维护的收益日历
+
+    日历按 CALENDAR_WINDOW_DAYS 天分窗口获取，每个窗口按与今天的距离决定刷新间隔。
+    所有窗口的条目合并为按日期排序的索引，区间查询用二分查找完成。
+    窗口数超过 CALENDAR_MAX_WINDOWS 时淘汰最久未使用的窗口。
+    """
+
+    def __init__(self):
+        self._windows = OrderedDict()  # 窗口序号 -> (获取时间, 条目列表)
+        self._dates = []  # 排序索引: 日期字符串
+        self._events = []  # 与 _dates 对应的条目
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def window_of(day: date) -> int:
+        return day.toordinal() // CALENDAR_WINDOW_DAYS
+
+    @staticmethod
+    def window_range(window: int):
+        """窗口的起止日期 (含)"""
+        start = date.fromordinal(max(1, window * CALENDAR_WINDOW_DAYS))
+        return start, date.fromordinal((window + 1) * CALENDAR_WINDOW_DAYS - 1)
+
+    def stale_windows(self, start: date, end: date, today: date) -> List[int]:
+        """区间内缺失或需要刷新的窗口"""
+        now = time.time()
+        stale = []
+        with self._lock:
+            for window in range(self.window_of(start), self.window_of(end) + 1):
+                entry = self._windows.get(window)
+                if entry is None or now - entry[0] > self._max_age(window, today):
+                    stale.append(window)
+                else:
+                    self._windows.move_to_end(window)
+        return stale
+
+    def update(self, window: int, events: List[dict]):
+        """写入一个窗口的数据，内容有变化时重建排序索引"""
+        first, last = (d.isoformat() for d in self.window_range(window))
+        unique = {}
+        for event in events:
+            day = event.get("date") or ""
+            if first <= day <= last and event.get("symbol"):
+                unique[(day, event["symbol"])] = event
+        events = [unique[key] for key in sorted(unique)]
+
+        with self._lock:
+            previous = self._windows.get(window)
+            self._windows[window] = (time.time(), events)
+            self._windows.move_to_end(window)
+            evicted = False
+            while len(self._windows) > CALENDAR_MAX_WINDOWS:
+                self._windows.popitem(last=False)
+                evicted = True
+            if previous is not None and previous[1] == events and not evicted:
+                return
+            ordered = [
+                event
+                for _, (_, window_events) in sorted(self._windows.items())
+                for event in window_events
+            ]
+            self._events = ordered
+            self._dates = [event["date"] for event in ordered]
+
+    def query(self, start: date, end: date) -> List[dict]:
+        """区间 (含两端) 内的条目，按日期排序"""
+        with self._lock:
+            lo = bisect_left(self._dates, start.isoformat())
+            hi = bisect_right(self._dates, end.isoformat())
+            return self._events[lo:hi]
+
+    def _max_age(self, window: int, today: date) -> float:
+        first, last = self.window_range(window)
+        if last < today - timedelta(days=14):
+            return CALENDAR_REFRESH["past"]
+        if first > today + timedelta(days=14):
+            return CALENDAR_REFRESH["future"]
+        return CALENDAR_REFRESH["near"]
+
+
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+_candle_stores = {}
+_candle_stores_lock = threading.Lock()
+
+
+def candle_store(directory: str) -> CandleStore:
+    """共享的 K 线存储，每个缓存目录一个"""
+    with _candle_stores_lock:
+        store = _candle_stores.get(directory)
+        if store is None:
+            store = _candle_stores[directory] = CandleStore(directory)
+        return store
+
+
+def live_quote_stream(url: str, token: str) -> "LiveQuoteStream":
+    """
+    共享的实时报价连接，同一时间只保留一个
+
+    地址或 API Key 变化时关闭旧连接并等待其线程退出，再建立新连接。
+    """
+    with _streams_lock:
+        stream = _streams.get((url, token))
+        if stream is None:
+            _stop_streams()
+            stream = LiveQuoteStream(url, token)
+            _streams[(url, token)] = stream
+        return stream
+
+
+def stop_live_quote_streams():
+    """关闭所有实时报价连接 (关闭 LIVE_QUOTES_ENABLED 时调用)"""
+    with _streams_lock:
+        _stop_streams()
+
+
+def _stop_streams():
+    # 调用方持有 _streams_lock
+    while _streams:
+        _, stream = _streams.popitem()
+        stream.stop()
+
+
+# 所有实例共享同一个 API 额度和响应缓存
+_limiter = RateLimiter()
+_cache = ResponseCache()
+_flights = SingleFlight()
+_symbol_index = SymbolIndex()
+_earnings_calendar = EarningsCalendarStore()
+_news_store = NewsStore()
+_insider_histories = OrderedDict()  # 股票代码 -> (过期时间, InsiderHistory)
+_insider_lock = threading.Lock()
+
 
 class Tools:
     class Valves(BaseModel):
         FINNHUB_API_KEY: str = Field(
             default="", description="Finnhub API Key"
         )
+        RATE_LIMIT_PER_SECOND: int = Field(
+            default=30, description="每秒最多请求数 (Finnhub 限额)"
+        )
+        RATE_LIMIT_PER_MINUTE: int = Field(
+            default=60, description="每分钟最多请求数 (免费版为 60)"
+        )
+        RATE_LIMIT_MAX_WAIT: float = Field(
+            default=10, description="超出限额时最多排队等待的秒数"
+        )
+        BATCH_CONCURRENCY: int = Field(default=8, description="批量请求时的最大并发数")
+        LIVE_QUOTES_ENABLED: bool = Field(
+            default=False,
+            description="通过 WebSocket 订阅实时成交，本地回答报价 (需要 websocket-client)",
+        )
+        LIVE_QUOTES_WATCHLIST: str = Field(
+            default="", description="始终订阅的股票，逗号分隔，如 AAPL,MSFT"
+        )
+        LIVE_QUOTES_RECENT_MINUTES: float = Field(
+            default=30, description="最近查询过的股票保持订阅的分钟数"
+        )
+        LIVE_QUOTES_MAX_AGE: float = Field(
+            default=60, description="实时报价的最长有效秒数，超过则改用 REST"
+        )
+        LIVE_QUOTES_URL: str = Field(default=WS_URL, description="WebSocket 地址")
+        SYMBOL_INDEX_EXCHANGES: str = Field(
+            default="US",
+            description="本地代码搜索索引包含的交易所，逗号分隔，如 US,HK，留空则只用远程搜索",
+        )
+        SYMBOL_INDEX_REFRESH_HOURS: float = Field(
+            default=24, description="本地代码搜索索引的刷新间隔 (小时)"
+        )
+        SNAPSHOT_TIMEOUT: float = Field(
+            default=15, description="公司概览等待所有部分返回的最长秒数"
+        )
+        EARNINGS_WATCHLIST: str = Field(
+            default="", description="收益日历关注列表，逗号分隔，如 AAPL,MSFT"
+        )
+        CANDLE_CACHE_DIR: str = Field(
+            default="",
+            description="K 线历史的本地存储目录，留空则使用系统临时目录",
+        )
+        CACHE_ENABLED: bool = Field(default=True, description="缓存 API 响应")
+        CACHE_MAX_ENTRIES: int = Field(default=1024, description="最多缓存的响应数")
 
     def __init__(self):
         self.valves = self.Valves()
@@ -31,12 +1614,7 @@ class Tools:
             return "错误: 请先在工具设置中配置 Finnhub API Key"
 
         try:
-            url = "https://finnhub.io/api/v1/quote"
-            params = {"symbol": symbol, "token": self.valves.FINNHUB_API_KEY}
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-
-            data = response.json()
+            data = self._quote(symbol)
 
             if not data or data.get("c") == 0:
                 return f"未找到股票代码: {symbol}"
@@ -57,23 +1635,231 @@ class Tools:
         except Exception as e:
             return f"获取股票报价失败: {str(e)}"
 
-    def finnhub_company_profile(self, symbol: str) -> str:
+    def finnhub_batch_quote(
+        self, symbols: List[str], shares: Optional[List[float]] = None
+    ) -> str:
+        """
+        批量获取多只股票的实时报价，可选计算持仓市值和当日盈亏
+
+        :param symbols: 股票代码列表，如 ["AAPL", "MSFT", "NVDA"]
+        :param shares: 可选，每只股票的持股数量，顺序与 symbols 一致
+        :return: 报价汇总表 (及持仓汇总)
+        """
+        if not self.valves.FINNHUB_API_KEY:
+            return "错误: 请先在工具设置中配置 Finnhub API Key"
+
+        symbols = [s.strip().upper() for s in symbols if s and s.strip()]
+        if not symbols:
+            return "错误: 请提供至少一个股票代码"
+        if len(symbols) > MAX_BATCH_SYMBOLS:
+            return f"错误: 一次最多查询 {MAX_BATCH_SYMBOLS} 只股票"
+        if shares is not None and len(shares) != len(symbols):
+            return "错误: shares 的数量必须与 symbols 一致"
+
+        def fetch(symbol):
+            try:
+                data = self._quote(symbol)
+                if not data or data.get("c") == 0:
+                    return symbol, None, "未找到股票代码"
+                return symbol, data, None
+            except Exception as e:
+                return symbol, None, str(e)
+
+        # 并发数不超过限流器的每秒额度，多余的请求在限流器中排队
+        workers = max(
+            1,
+            min(
+                self.valves.BATCH_CONCURRENCY,
+                self.valves.RATE_LIMIT_PER_SECOND,
+                len(symbols),
+            ),
+        )
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(fetch, symbols))
+
+        quotes = [(symbol, data) for symbol, data, _ in results if data]
+        errors = [(symbol, error) for symbol, _, error in results if error]
+
+        result = f"批量报价 ({len(quotes)}/{len(symbols)} 成功):\n\n"
+        if quotes:
+            result += (
+                "| 代码 | 当前价格 | 涨跌 | 涨跌幅 | 最高价 | 最低价 | 前收盘价 |\n"
+            )
+            result += "|---|---|---|---|---|---|---|\n"
+            result += "".join(
+                f"| {symbol} | ${data.get('c', 'N/A')} | ${data.get('d', 'N/A')} "
+                f"| {data.get('dp', 'N/A')}% | ${data.get('h', 'N/A')} "
+                f"| ${data.get('l', 'N/A')} | ${data.get('pc', 'N/A')} |\n"
+                for symbol, data in quotes
+            )
+
+        if shares is not None and quotes:
+            # 同一代码出现多次时合并持股数量
+            held = {}
+            for symbol, count in zip(symbols, shares):
+                held[symbol] = held.get(symbol, 0) + count
+            positions = dict(quotes)
+            result += "\n" + self._portfolio_summary(
+                list(positions),
+                [held[symbol] for symbol in positions],
+                list(positions.values()),
+            )
+
+        if errors:
+            result += "\n错误:\n"
+            result += "".join(f"- {symbol}: {error}\n" for symbol, error in errors)
+
+        return result.strip()
+
+    def finnhub_stock_candles(
+        self, symbol: str, resolution: str = "D", days: int = 30, limit: int = 10
+    ) -> str:
+        """
+        获取股票历史 K 线 (开高低收和成交量)
+
+        :param symbol: 股票代码，如 AAPL, TSLA
+        :param resolution: K 线周期: 1, 5, 15, 30, 60 (分钟), D (日), W (周), M (月)，默认 D
+        :param days: 获取最近多少天，默认 30
+        :param limit: 显示最近几根 K 线，默认 10
+        :return: 区间统计和最近的 K 线
+        """
+        if not self.valves.FINNHUB_API_KEY:
+            return "错误: 请先在工具设置中配置 Finnhub API Key"
+        if np is None:
+            return "错误: K 线需要安装 numpy"
+
+        resolution = resolution.strip().upper()
+        if resolution not in CANDLE_RESOLUTIONS:
+            return (
+                f"错误: 未知的周期 {resolution}，可选: {', '.join(CANDLE_RESOLUTIONS)}"
+            )
+
+        try:
+            symbol = symbol.strip().upper()
+            bars = self._candle_history(symbol, resolution, days)
+            if not bars.shape[1]:
+                return f"未找到 {symbol} 的 K 线数据"
+
+            t, o, h, l, c, v = bars
+            result = f"{symbol} K 线 ({resolution}，最近{days}天，{len(t)} 根):\n\n"
+            result += f"区间最高: ${h.max():.2f}，区间最低: ${l.min():.2f}\n"
+            result += f"区间涨跌: {(c[-1] / o[0] - 1) * 100:+.2f}%，总成交量: {v.sum():,.0f}\n\n"
+            result += "| 时间 | 开盘 | 最高 | 最低 | 收盘 | 成交量 |\n"
+            result += "|---|---|---|---|---|---|\n"
+            time_format = (
+                "%Y-%m-%d" if resolution in BARS_PER_YEAR else "%Y-%m-%d %H:%M"
+            )
+            for i in range(len(t) - 1, max(-1, len(t) - 1 - limit), -1):
+                result += (
+                    f"| {datetime.fromtimestamp(t[i]).strftime(time_format)} "
+                    f"| {o[i]:.2f} | {h[i]:.2f} | {l[i]:.2f} | {c[i]:.2f} | {v[i]:,.0f} |\n"
+                )
+
+            return result.strip()
+
+        except Exception as e:
+            return f"获取 K 线失败: {str(e)}"
+
+    def finnhub_technical_indicators(
+        self, symbols: List[str], resolution: str = "D", days: int = 365
+    ) -> str:
+        """
+        计算一只或多只股票的技术指标: SMA/EMA、RSI、MACD、布林带、ATR、收益率和波动率
+
+        :param symbols: 股票代码列表，如 ["NVDA", "AAPL"]
+        :param resolution: K 线周期: 1, 5, 15, 30, 60 (分钟), D (日), W (周), M (月)，默认 D
+        :param days: 使用最近多少天的 K 线，默认 365 (200 日均线需要足够的历史)
+        :return: 每只股票最新的指标值
+        """
+        if not self.valves.FINNHUB_API_KEY:
+            return "错误: 请先在工具设置中配置 Finnhub API Key"
+        if np is None:
+            return "错误: 技术指标需要安装 numpy"
+
+        resolution = resolution.strip().upper()
+        if resolution not in CANDLE_RESOLUTIONS:
+            return (
+                f"错误: 未知的周期 {resolution}，可选: {', '.join(CANDLE_RESOLUTIONS)}"
+            )
+        symbols = [s.strip().upper() for s in symbols if s and s.strip()]
+        if not symbols:
+            return "错误: 请提供至少一个股票代码"
+        if len(symbols) > MAX_BATCH_SYMBOLS:
+            return f"错误: 一次最多查询 {MAX_BATCH_SYMBOLS} 只股票"
+
+        bars_per_year = BARS_PER_YEAR.get(
+            resolution, 252 * TRADING_SECONDS_PER_DAY / CANDLE_RESOLUTIONS[resolution]
+        )
+
+        def compute(symbol):
+            try:
+                bars = self._candle_history(symbol, resolution, days)
+                if not bars.shape[1]:
+                    return symbol, None, "未找到 K 线数据"
+                return symbol, technical_indicators(bars, bars_per_year), None
+            except Exception as e:
+                return symbol, None, str(e)
+
+        workers = max(
+            1,
+            min(
+                self.valves.BATCH_CONCURRENCY,
+                self.valves.RATE_LIMIT_PER_SECOND,
+                len(symbols),
+            ),
+        )
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(compute, symbols))
+
+        def fmt(value, pattern="{:.2f}"):
+            return "N/A" if np.isnan(value) else pattern.format(value)
+
+        result = f"技术指标 ({resolution}，最近{days}天):\n\n"
+        errors = []
+        for symbol, values, error in results:
+            if error:
+                errors.append((symbol, error))
+                continue
+            result += f"{symbol} 收盘 ${fmt(values['close'])}\n"
+            result += (
+                f"   SMA20/50/200: {fmt(values['sma20'])} / {fmt(values['sma50'])} "
+                f"/ {fmt(values['sma200'])}，EMA12/26: {fmt(values['ema12'])} "
+                f"/ {fmt(values['ema26'])}\n"
+            )
+            result += (
+                f"   RSI14: {fmt(values['rsi14'], '{:.1f}')}，MACD: {fmt(values['macd'])} "
+                f"(信号 {fmt(values['macd_signal'])}，柱 {fmt(values['macd_histogram'])})\n"
+            )
+            result += (
+                f"   布林带: {fmt(values['bollinger_lower'])} - {fmt(values['bollinger_upper'])} "
+                f"(%B {fmt(values['bollinger_percent'])})，ATR14: {fmt(values['atr14'])}\n"
+            )
+            result += (
+                f"   收益率: 最近1根 {fmt(values['return_1'] * 100, '{:+.2f}')}%，"
+                f"最近20根 {fmt(values['return_20'] * 100, '{:+.2f}')}%，"
+                f"区间 {fmt(values['return_total'] * 100, '{:+.2f}')}%，"
+                f"20根年化波动率 {fmt(values['volatility_20'] * 100, '{:.1f}')}%\n\n"
+            )
+
+        if errors:
+            result += "错误:\n"
+            result += "".join(f"- {symbol}: {error}\n" for symbol, error in errors)
+
+        return result.strip()
+
+    def finnhub_company_profile(self, symbol: str, refresh: bool = False) -> str:
         """
         获取公司详细信息 (Profile2)
 
         :param symbol: 股票代码，如 AAPL, TSLA
+        :param refresh: 跳过缓存重新获取最新数据，默认 False
         :return: 公司信息
         """
         if not self.valves.FINNHUB_API_KEY:
             return "错误: 请先在工具设置中配置 Finnhub API Key"
 
         try:
-            url = "https://finnhub.io/api/v1/stock/profile2"
-            params = {"symbol": symbol, "token": self.valves.FINNHUB_API_KEY}
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-
-            data = response.json()
+            data = self._get("/stock/profile2", {"symbol": symbol}, refresh=refresh)
 
             if not data:
                 return f"未找到公司信息: {symbol}"
@@ -97,23 +1883,19 @@ class Tools:
         except Exception as e:
             return f"获取公司信息失败: {str(e)}"
 
-    def finnhub_company_peers(self, symbol: str) -> str:
+    def finnhub_company_peers(self, symbol: str, refresh: bool = False) -> str:
         """
         获取公司同行/竞争对手列表
 
         :param symbol: 股票代码，如 AAPL, TSLA
+        :param refresh: 跳过缓存重新获取最新数据，默认 False
         :return: 同行公司列表
         """
         if not self.valves.FINNHUB_API_KEY:
             return "错误: 请先在工具设置中配置 Finnhub API Key"
 
         try:
-            url = "https://finnhub.io/api/v1/stock/peers"
-            params = {"symbol": symbol, "token": self.valves.FINNHUB_API_KEY}
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-
-            data = response.json()
+            data = self._get("/stock/peers", {"symbol": symbol}, refresh=refresh)
 
             if not data:
                 return f"未找到 {symbol} 的同行公司"
@@ -138,16 +1920,7 @@ class Tools:
             return "错误: 请先在工具设置中配置 Finnhub API Key"
 
         try:
-            url = "https://finnhub.io/api/v1/stock/metric"
-            params = {
-                "symbol": symbol,
-                "metric": metric,
-                "token": self.valves.FINNHUB_API_KEY,
-            }
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-
-            data = response.json()
+            data = self._get("/stock/metric", {"symbol": symbol, "metric": metric})
 
             if not data or "metric" not in data:
                 return f"未找到 {symbol} 的财务指标"
@@ -178,6 +1951,124 @@ class Tools:
         except Exception as e:
             return f"获取财务指标失败: {str(e)}"
 
+    def finnhub_peer_comparison(
+        self,
+        symbol: str,
+        metrics: Optional[List[str]] = None,
+        max_peers: int = 10,
+    ) -> str:
+        """
+        同行对比: 获取同行公司的财务指标，生成带百分位排名的对比表
+
+        :param symbol: 股票代码，如 AAPL, TSLA
+        :param metrics: 可选，对比的指标: pe, gross_margin, operating_margin, net_margin, roe, revenue_growth, beta, market_cap；默认 pe, net_margin, roe, beta, market_cap
+        :param max_peers: 最多对比几家同行，默认 10
+        :return: 按综合百分位排序的对比表
+        """
+        if not self.valves.FINNHUB_API_KEY:
+            return "错误: 请先在工具设置中配置 Finnhub API Key"
+        if np is None:
+            return "错误: 同行对比需要安装 numpy"
+
+        metrics = [
+            m.strip().lower() for m in metrics or DEFAULT_PEER_METRICS if m.strip()
+        ]
+        unknown = [m for m in metrics if m not in PEER_METRICS]
+        if unknown:
+            return f"错误: 未知的指标 {', '.join(unknown)}，可选: {', '.join(PEER_METRICS)}"
+
+        try:
+            symbol = symbol.strip().upper()
+            peers = self._get("/stock/peers", {"symbol": symbol}) or []
+            symbols = [symbol] + [p for p in peers if p and p.upper() != symbol]
+            symbols = list(dict.fromkeys(symbols))[
+                : max(1, min(max_peers, MAX_PEERS)) + 1
+            ]
+            if len(symbols) == 1:
+                return f"未找到 {symbol} 的同行公司"
+
+            def fetch(peer):
+                try:
+                    data = self._get("/stock/metric", {"symbol": peer, "metric": "all"})
+                    return (data or {}).get("metric") or {}, None
+                except Exception as e:
+                    return {}, str(e)
+
+            workers = max(
+                1,
+                min(
+                    self.valves.BATCH_CONCURRENCY,
+                    self.valves.RATE_LIMIT_PER_SECOND,
+                    len(symbols),
+                ),
+            )
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(fetch, symbols))
+
+            def value(blob, metric):
+                for field in PEER_METRICS[metric][1]:
+                    if isinstance(blob.get(field), (int, float)):
+                        if metric in POSITIVE_PEER_METRICS and blob[field] <= 0:
+                            return np.nan
+                        return blob[field]
+                return np.nan
+
+            # 行: 公司，列: 指标
+            matrix = np.array(
+                [[value(blob, m) for m in metrics] for blob, _ in results],
+                dtype=float,
+            )
+            ranks = percentile_ranks(matrix)
+
+            # 综合百分位: 越低越好的指标取反，只统计有方向的指标
+            direction = np.array(
+                [
+                    {True: 1.0, False: -1.0, None: 0.0}[PEER_METRICS[m][2]]
+                    for m in metrics
+                ]
+            )
+            signed = np.where(direction > 0, ranks, 100 - ranks)[:, direction != 0]
+            counted = ~np.isnan(signed)
+            score = np.where(
+                counted.any(axis=1),
+                np.where(counted, signed, 0).sum(axis=1)
+                / np.maximum(counted.sum(axis=1), 1),
+                np.nan,
+            )
+            order = np.argsort(np.where(np.isnan(score), np.inf, -score), kind="stable")
+
+            result = f"{symbol} 同行对比 ({len(symbols)} 家公司，括号内为百分位):\n\n"
+            result += "| 排名 | 代码 | " + " | ".join(
+                PEER_METRICS[m][0] for m in metrics
+            )
+            result += " | 综合百分位 |\n"
+            result += "|---" * (len(metrics) + 3) + "|\n"
+            for position, i in enumerate(order, 1):
+                name = f"**{symbols[i]}**" if i == 0 else symbols[i]
+                cells = [
+                    (
+                        "N/A"
+                        if np.isnan(matrix[i, j])
+                        else f"{matrix[i, j]:,.2f} ({ranks[i, j]:.0f})"
+                    )
+                    for j in range(len(metrics))
+                ]
+                overall = "N/A" if np.isnan(score[i]) else f"{score[i]:.0f}"
+                result += f"| {position} | {name} | " + " | ".join(cells)
+                result += f" | {overall} |\n"
+
+            errors = [
+                (symbols[i], error) for i, (_, error) in enumerate(results) if error
+            ]
+            if errors:
+                result += "\n错误:\n"
+                result += "".join(f"- {peer}: {error}\n" for peer, error in errors)
+
+            return result.strip()
+
+        except Exception as e:
+            return f"同行对比失败: {str(e)}"
+
     def finnhub_insider_transactions(self, symbol: str) -> str:
         """
         获取公司内部交易记录
@@ -189,12 +2080,7 @@ class Tools:
             return "错误: 请先在工具设置中配置 Finnhub API Key"
 
         try:
-            url = "https://finnhub.io/api/v1/stock/insider-transactions"
-            params = {"symbol": symbol, "token": self.valves.FINNHUB_API_KEY}
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-
-            data = response.json()
+            data = self._get("/stock/insider-transactions", {"symbol": symbol})
 
             if not data or "data" not in data:
                 return f"未找到 {symbol} 的内部交易记录"
@@ -214,32 +2100,122 @@ class Tools:
         except Exception as e:
             return f"获取内部交易失败: {str(e)}"
 
+    def finnhub_insider_analytics(
+        self, symbol: str, months: int = 12, refresh: bool = False
+    ) -> str:
+        """
+        分析完整的内部交易历史: 按内部人、月份和交易类型汇总净买卖，滚动 MSPR 和集中买入
+
+        :param symbol: 股票代码，如 TSLA, AAPL
+        :param months: 分析最近几个月，默认 12
+        :param refresh: 跳过缓存重新获取最新数据，默认 False
+        :return: 内部交易分析摘要
+        """
+        if not self.valves.FINNHUB_API_KEY:
+            return "错误: 请先在工具设置中配置 Finnhub API Key"
+        if np is None:
+            return "错误: 内部交易分析需要安装 numpy"
+
+        try:
+            symbol = symbol.strip().upper()
+            history = self._insider_history(symbol, refresh)
+            if not len(history):
+                return f"未找到 {symbol} 的内部交易记录"
+
+            months = max(1, min(months, 120))
+            today = np.datetime64(date.today(), "D")
+            start = (today.astype("datetime64[M]") - (months - 1)).astype(
+                "datetime64[D]"
+            )
+            mask = history.since(start)
+            if not mask.any():
+                return f"{symbol} 最近{months}个月没有内部交易记录"
+
+            insiders = history.by_insider(mask)
+            codes = history.by_code(mask)
+            monthly = history.by_month(mask, start)
+            active = np.flatnonzero(insiders["count"])
+
+            result = (
+                f"{symbol} 内部交易分析 (最近{months}个月，"
+                f"{int(mask.sum())} 笔交易，{len(active)} 位内部人):\n\n"
+            )
+            result += (
+                f"合计: 净 {insiders['net_shares'].sum():+,.0f} 股，"
+                f"买入 ${insiders['bought_value'].sum():,.0f}，"
+                f"卖出 ${insiders['sold_value'].sum():,.0f}\n\n"
+            )
+
+            net_value = insiders["bought_value"] - insiders["sold_value"]
+            result += "按内部人 (净金额绝对值前5):\n"
+            for i in active[np.argsort(-np.abs(net_value[active]))][:5]:
+                result += (
+                    f"- {history.names[i]}: 净 {insiders['net_shares'][i]:+,.0f} 股，"
+                    f"买入 ${insiders['bought_value'][i]:,.0f}，"
+                    f"卖出 ${insiders['sold_value'][i]:,.0f}\n"
+                )
+
+            result += "\n按交易类型:\n"
+            for i in np.flatnonzero(codes["count"]):
+                code = history.codes[i]
+                result += (
+                    f"- {code} ({INSIDER_CODES.get(code, '其他')}): "
+                    f"{codes['count'][i]} 笔，净 {codes['net_shares'][i]:+,.0f} 股\n"
+                )
+
+            result += f"\n按月份 (MSPR / {MSPR_WINDOW_MONTHS}个月滚动 MSPR):\n"
+            for i in np.flatnonzero(monthly["count"]):
+                mspr = monthly["mspr"][i]
+                rolling = monthly["rolling_mspr"][i]
+                result += (
+                    f"- {monthly['months'][i]}: 净 {monthly['net_shares'][i]:+,.0f} 股，"
+                    f"买入 ${monthly['bought_value'][i]:,.0f}，"
+                    f"卖出 ${monthly['sold_value'][i]:,.0f}，"
+                    f"MSPR {'N/A' if np.isnan(mspr) else f'{mspr:.1f}'} / "
+                    f"{'N/A' if np.isnan(rolling) else f'{rolling:.1f}'}\n"
+                )
+
+            clusters = history.cluster_buys(mask)
+            result += f"\n集中买入 ({CLUSTER_DAYS}天内至少{CLUSTER_MIN_INSIDERS}位内部人公开市场买入):\n"
+            if not clusters:
+                result += "- 无\n"
+            for cluster in clusters:
+                result += (
+                    f"- {cluster['start']} 起: {cluster['insiders']} 位内部人，"
+                    f"共 ${cluster['value']:,.0f}\n"
+                )
+
+            return result.strip()
+
+        except Exception as e:
+            return f"内部交易分析失败: {str(e)}"
+
     def finnhub_insider_sentiment(
-        self, symbol: str, from_date: str = "2023-01-01", to_date: str = "2024-12-31"
+        self, symbol: str, from_date: str = None, to_date: str = None
     ) -> str:
         """
         获取公司内部交易情绪
 
         :param symbol: 股票代码，如 TSLA, AAPL
-        :param from_date: 开始日期，格式 YYYY-MM-DD
-        :param to_date: 结束日期，格式 YYYY-MM-DD
+        :param from_date: 开始日期，格式 YYYY-MM-DD，默认为一年前
+        :param to_date: 结束日期，格式 YYYY-MM-DD，默认为今天
         :return: 内部情绪信息
         """
         if not self.valves.FINNHUB_API_KEY:
             return "错误: 请先在工具设置中配置 Finnhub API Key"
 
         try:
-            url = "https://finnhub.io/api/v1/stock/insider-sentiment"
-            params = {
-                "symbol": symbol,
-                "from": from_date,
-                "to": to_date,
-                "token": self.valves.FINNHUB_API_KEY,
-            }
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
+            if not to_date:
+                to_date = date.today().isoformat()
+            if not from_date:
+                from_date = (
+                    date.fromisoformat(to_date) - timedelta(days=365)
+                ).isoformat()
 
-            data = response.json()
+            data = self._get(
+                "/stock/insider-sentiment",
+                {"symbol": symbol, "from": from_date, "to": to_date},
+            )
 
             if not data or "data" not in data:
                 return f"未找到 {symbol} 的内部情绪数据"
@@ -259,63 +2235,80 @@ class Tools:
         except Exception as e:
             return f"获取内部情绪失败: {str(e)}"
 
-    def finnhub_financials_reported(self, symbol: str, freq: str = "annual") -> str:
+    def finnhub_financials_reported(
+        self,
+        symbol: str,
+        freq: str = "annual",
+        refresh: bool = False,
+        limit: int = 3,
+        items: Optional[List[str]] = None,
+    ) -> str:
         """
         获取公司财务报告 (原始数据)
 
         :param symbol: 股票代码，如 AAPL, TSLA
         :param freq: 频率 annual (年度) 或 quarterly (季度)
+        :param refresh: 跳过缓存重新获取最新数据，默认 False
+        :param limit: 最近几份报告，默认 3
+        :param items: 要提取的科目，如 revenue, net_income, eps, eps_diluted, gross_profit, operating_income, total_assets, total_liabilities, equity, cash, operating_cash_flow，或 XBRL 概念名；默认 revenue, net_income, eps
         :return: 财务报告信息
         """
         if not self.valves.FINNHUB_API_KEY:
             return "错误: 请先在工具设置中配置 Finnhub API Key"
 
-        try:
-            url = "https://finnhub.io/api/v1/stock/financials-reported"
-            params = {
-                "symbol": symbol,
-                "freq": freq,
-                "token": self.valves.FINNHUB_API_KEY,
-            }
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
+        limit = max(1, min(limit, 20))
+        items = [i.strip() for i in items or DEFAULT_FINANCIAL_ITEMS if i.strip()]
 
-            data = response.json()
-
-            if not data or "data" not in data:
+        try:
+            # 完整响应包含全部历史报告的所有科目，流式解析只取需要的部分
+            data = self._get(
+                "/stock/financials-reported",
+                {"symbol": symbol, "freq": freq},
+                refresh=refresh,
+                parse=lambda response: parse_financials_reported(
+                    response, limit, items
+                ),
+                variant=(limit, tuple(items)),
+            )
+
+            if not data or not data.get("data"):
                 return f"未找到 {symbol} 的财务报告"
 
-            reports = data["data"][:3]  # 只显示最近3条
+            reports = data["data"]
             result = f"{symbol} 财务报告 ({freq}):\n\n"
 
             for i, report in enumerate(reports, 1):
                 result += f"{i}. 报告期: {report.get('year', 'N/A')}-Q{report.get('quarter', '')}\n"
                 result += f"   提交日期: {report.get('filedDate', 'N/A')}\n"
                 result += f"   接受日期: {report.get('acceptedDate', 'N/A')}\n"
-                result += f"   表格类型: {report.get('form', 'N/A')}\n\n"
+                result += f"   表格类型: {report.get('form', 'N/A')}\n"
+                for item, line in report["items"].items():
+                    result += (
+                        f"   {item}: {line['value']} {line.get('unit') or ''}".rstrip()
+                    )
+                    result += "\n"
+                result += "\n"
 
             return result.strip()
 
         except Exception as e:
             return f"获取财务报告失败: {str(e)}"
 
-    def finnhub_recommendation_trends(self, symbol: str) -> str:
+    def finnhub_recommendation_trends(self, symbol: str, refresh: bool = False) -> str:
         """
         获取分析师推荐趋势
 
         :param symbol: 股票代码，如 AAPL, TSLA
+        :param refresh: 跳过缓存重新获取最新数据，默认 False
         :return: 推荐趋势信息
         """
         if not self.valves.FINNHUB_API_KEY:
             return "错误: 请先在工具设置中配置 Finnhub API Key"
 
         try:
-            url = "https://finnhub.io/api/v1/stock/recommendation"
-            params = {"symbol": symbol, "token": self.valves.FINNHUB_API_KEY}
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-
-            data = response.json()
+            data = self._get(
+                "/stock/recommendation", {"symbol": symbol}, refresh=refresh
+            )
 
             if not data:
                 return f"未找到 {symbol} 的推荐信息"
@@ -335,23 +2328,19 @@ class Tools:
         except Exception as e:
             return f"获取推荐趋势失败: {str(e)}"
 
-    def finnhub_earnings_surprises(self, symbol: str) -> str:
+    def finnhub_earnings_surprises(self, symbol: str, refresh: bool = False) -> str:
         """
         获取公司历史季度收益惊喜
 
         :param symbol: 股票代码，如 AAPL, TSLA
+        :param refresh: 跳过缓存重新获取最新数据，默认 False
         :return: 收益惊喜信息
         """
         if not self.valves.FINNHUB_API_KEY:
             return "错误: 请先在工具设置中配置 Finnhub API Key"
 
         try:
-            url = "https://finnhub.io/api/v1/stock/earnings"
-            params = {"symbol": symbol, "token": self.valves.FINNHUB_API_KEY}
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-
-            data = response.json()
+            data = self._get("/stock/earnings", {"symbol": symbol}, refresh=refresh)
 
             if not data:
                 return f"未找到 {symbol} 的收益数据"
@@ -370,8 +2359,86 @@ class Tools:
         except Exception as e:
             return f"获取收益惊喜失败: {str(e)}"
 
+    def finnhub_company_snapshot(
+        self, symbol: str, sections: Optional[List[str]] = None
+    ) -> str:
+        """
+        一次获取公司概览: 公司信息、报价、财务指标、分析师推荐和收益惊喜 (并发请求)
+
+        :param symbol: 股票代码，如 AAPL, TSLA
+        :param sections: 可选，只获取部分内容: profile, quote, financials, recommendations, earnings，默认全部
+        :return: 合并后的公司概览
+        """
+        if not self.valves.FINNHUB_API_KEY:
+            return "错误: 请先在工具设置中配置 Finnhub API Key"
+
+        symbol = symbol.strip().upper()
+        if sections:
+            sections = [s.strip().lower() for s in sections if s and s.strip()]
+            unknown = [s for s in sections if s not in SNAPSHOT_SECTIONS]
+            if unknown:
+                return (
+                    f"错误: 未知的部分 {', '.join(unknown)}，"
+                    f"可选: {', '.join(SNAPSHOT_SECTIONS)}"
+                )
+        else:
+            sections = list(SNAPSHOT_SECTIONS)
+        sections = [s for s in SNAPSHOT_SECTIONS if s in sections]
+        if not sections:
+            return f"错误: 请提供至少一个部分，可选: {', '.join(SNAPSHOT_SECTIONS)}"
+
+        # 所有部分共用一个截止时间，超时的部分单独报告，不影响已返回的部分
+        pool = ThreadPoolExecutor(
+            max_workers=max(1, min(len(sections), self.valves.BATCH_CONCURRENCY))
+        )
+        futures = {
+            section: pool.submit(self._snapshot_section, section, symbol)
+            for section in sections
+        }
+        deadline = time.monotonic() + self.valves.SNAPSHOT_TIMEOUT
+        parts = {}
+        errors = {}
+        for section, future in futures.items():
+            try:
+                parts[section] = future.result(
+                    timeout=max(0, deadline - time.monotonic())
+                )
+            except TimeoutError:
+                errors[section] = "超时"
+            except Exception as e:
+                errors[section] = str(e)
+        pool.shutdown(wait=False)
+
+        name = (parts.get("profile") or {}).get("name")
+        result = f"{name} ({symbol}) 概览:\n\n" if name else f"{symbol} 概览:\n\n"
+        for section in sections:
+            lines = (parts.get(section) or {}).get("lines")
+            if lines:
+                result += f"{SNAPSHOT_SECTIONS[section]}:\n"
+                result += "".join(f"   {line}\n" for line in lines)
+                result += "\n"
+            elif section not in errors:
+                errors[section] = "无数据"
+
+        if errors:
+            result += "未能获取:\n"
+            result += "".join(
+                f"- {SNAPSHOT_SECTIONS[section]}: {error}\n"
+                for section, error in errors.items()
+            )
+
+        return result.strip()
+
     def finnhub_earnings_calendar(
-        self, from_date: str = None, to_date: str = None, days: int = 30
+        self,
+        from_date: str = None,
+        to_date: str = None,
+        days: int = 30,
+        symbols: Optional[List[str]] = None,
+        watchlist: bool = False,
+        session: str = "",
+        page: int = 1,
+        page_size: int = 20,
     ) -> str:
         """
         获取收益发布日历
@@ -379,42 +2446,76 @@ class Tools:
         :param from_date: 开始日期，格式 YYYY-MM-DD，默认为今天
         :param to_date: 结束日期，格式 YYYY-MM-DD，默认为未来30天
         :param days: 如果未指定日期，查询未来多少天，默认30天
+        :param symbols: 可选，只显示这些股票，如 ["AAPL", "MSFT"]
+        :param watchlist: 只显示关注列表 (工具设置中的 EARNINGS_WATCHLIST) 中的股票
+        :param session: 可选，按发布时段筛选: bmo (盘前), amc (盘后), dmh (盘中)
+        :param page: 页码，从 1 开始
+        :param page_size: 每页条数，默认 20
         :return: 收益日历信息
         """
         if not self.valves.FINNHUB_API_KEY:
             return "错误: 请先在工具设置中配置 Finnhub API Key"
 
         try:
-            from datetime import datetime, timedelta
-
-            # 如果没有提供日期，使用默认值
-            if not from_date:
-                from_date = datetime.now().strftime("%Y-%m-%d")
-            if not to_date:
-                to_date = (datetime.now() + timedelta(days=days)).strftime("%Y-%m-%d")
-
-            url = "https://finnhub.io/api/v1/calendar/earnings"
-            params = {
-                "from": from_date,
-                "to": to_date,
-                "token": self.valves.FINNHUB_API_KEY,
-            }
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-
-            data = response.json()
-
-            if not data or "earningsCalendar" not in data:
-                return f"未找到 {from_date} 到 {to_date} 的收益日历"
-
-            calendar = data["earningsCalendar"][:20]  # 显示前20条
-            result = f"收益发布日历 ({from_date} 到 {to_date}):\n\n"
+            today = date.today()
+            start = date.fromisoformat(from_date) if from_date else today
+            end = (
+                date.fromisoformat(to_date) if to_date else start + timedelta(days=days)
+            )
+            if end < start:
+                return "错误: 结束日期不能早于开始日期"
+            if (end - start).days >= MAX_CALENDAR_DAYS:
+                return f"错误: 一次最多查询 {MAX_CALENDAR_DAYS} 天"
+
+            session = session.strip().lower()
+            if session and session not in CALENDAR_SESSIONS:
+                return (
+                    f"错误: 未知的时段 {session}，可选: {', '.join(CALENDAR_SESSIONS)}"
+                )
 
-            for i, event in enumerate(calendar, 1):
+            wanted = {s.strip().upper() for s in symbols or [] if s.strip()}
+            if watchlist:
+                listed = {
+                    s.strip().upper()
+                    for s in self.valves.EARNINGS_WATCHLIST.split(",")
+                    if s.strip()
+                }
+                if not listed:
+                    return "错误: 请先在工具设置中配置 EARNINGS_WATCHLIST"
+                wanted = wanted & listed if wanted else listed
+
+            failed = self._sync_earnings_calendar(start, end, today)
+
+            events = [
+                event
+                for event in _earnings_calendar.query(start, end)
+                if (not wanted or event.get("symbol") in wanted)
+                and (not session or event.get("hour") == session)
+            ]
+
+            if not events:
+                if failed:
+                    return f"获取收益日历失败: {failed[0]}"
+                return f"未找到 {start} 到 {end} 的收益日历"
+
+            page_size = max(1, min(page_size, 100))
+            pages = (len(events) + page_size - 1) // page_size
+            page = max(1, min(page, pages))
+            offset = (page - 1) * page_size
+
+            result = f"收益发布日历 ({start} 到 {end})，共 {len(events)} 条，第 {page}/{pages} 页:\n\n"
+
+            for i, event in enumerate(events[offset : offset + page_size], offset + 1):
+                hour = event.get("hour") or "N/A"
                 result += f"{i}. {event.get('symbol', 'N/A')}\n"
                 result += f"   日期: {event.get('date', 'N/A')}\n"
                 result += f"   预期EPS: ${event.get('epsEstimate', 'N/A')}\n"
-                result += f"   盘前/盘后: {event.get('hour', 'N/A')}\n\n"
+                result += f"   盘前/盘后: {CALENDAR_SESSIONS.get(hour, hour)}\n\n"
+
+            if page < pages:
+                result += f"使用 page={page + 1} 查看下一页\n"
+            if failed:
+                result += f"注意: {len(failed)} 个日期窗口获取失败，结果可能不完整\n"
 
             return result.strip()
 
@@ -433,19 +2534,23 @@ class Tools:
             return "错误: 请先在工具设置中配置 Finnhub API Key"
 
         try:
-            url = "https://finnhub.io/api/v1/news"
-            params = {"category": category, "token": self.valves.FINNHUB_API_KEY}
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
+            key = ("market", category.lower())
+            state = _news_store.state(key)
+            if time.time() - state["fetched_at"] > NEWS_REFRESH_SECONDS:
+                # 只获取比已有新闻 id 更新的部分
+                params = {"category": category}
+                if state["max_id"]:
+                    params["minId"] = state["max_id"]
+                _news_store.add(key, self._request("/news", params) or [])
 
-            data = response.json()
+            data = _news_store.items(key, limit=limit)
 
             if not data:
                 return "未找到相关新闻"
 
             result = f"市场新闻 ({category.upper()}):\n\n"
 
-            for i, news in enumerate(data[:limit], 1):
+            for i, news in enumerate(data, 1):
                 result += f"{i}. {news.get('headline', 'N/A')}\n"
                 result += f"   日期: {news.get('datetime', 'N/A')}\n"
                 result += f"   来源: {news.get('source', 'N/A')}\n"
@@ -458,44 +2563,52 @@ class Tools:
         except Exception as e:
             return f"获取市场新闻失败: {str(e)}"
 
-    def finnhub_company_news(self, symbol: str, days: int = 7) -> str:
+    def finnhub_company_news(self, symbol: str, days: int = 7, limit: int = 5) -> str:
         """
         获取特定公司新闻
 
         :param symbol: 股票代码
         :param days: 获取最近几天的新闻，默认7天
+        :param limit: 返回新闻数量，默认5条
         :return: 公司新闻列表
         """
         if not self.valves.FINNHUB_API_KEY:
             return "错误: 请先在工具设置中配置 Finnhub API Key"
 
         try:
-            from datetime import datetime, timedelta
-
-            end_date = datetime.now()
+            symbol = symbol.strip().upper()
+            days = max(1, days)
+            end_date = date.today()
             start_date = end_date - timedelta(days=days)
 
-            url = "https://finnhub.io/api/v1/company-news"
-            params = {
-                "symbol": symbol,
-                "from": start_date.strftime("%Y-%m-%d"),
-                "to": end_date.strftime("%Y-%m-%d"),
-                "token": self.valves.FINNHUB_API_KEY,
-            }
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-
-            data = response.json()
+            if days > NEWS_RETENTION_DAYS:
+                # 超出存储保留范围，直接请求整个区间，不经过新闻存储
+                data = self._get(
+                    "/company-news",
+                    {
+                        "symbol": symbol,
+                        "from": start_date.isoformat(),
+                        "to": end_date.isoformat(),
+                    },
+                )
+                data = sorted(
+                    data or [], key=lambda item: item.get("datetime") or 0, reverse=True
+                )[:limit]
+            else:
+                key = ("company", symbol)
+                self._sync_company_news(key, symbol, start_date, end_date)
+                since = datetime.combine(start_date, datetime.min.time()).timestamp()
+                data = _news_store.items(key, since=since, limit=limit)
 
             if not data:
                 return f"未找到 {symbol} 的相关新闻"
 
             result = f"{symbol} 公司新闻 (最近{days}天):\n\n"
 
-            for i, news in enumerate(data[:5], 1):
-                date = datetime.fromtimestamp(news.get("datetime", 0))
+            for i, news in enumerate(data, 1):
+                published = datetime.fromtimestamp(news.get("datetime", 0))
                 result += f"{i}. {news.get('headline', 'N/A')}\n"
-                result += f"   日期: {date.strftime('%Y-%m-%d %H:%M')}\n"
+                result += f"   日期: {published.strftime('%Y-%m-%d %H:%M')}\n"
                 result += f"   来源: {news.get('source', 'N/A')}\n"
                 result += f"   摘要: {news.get('summary', 'N/A')[:200]}...\n"
                 result += f"   链接: {news.get('url', '#')}\n\n"
@@ -517,19 +2630,20 @@ class Tools:
             return "错误: 请先在工具设置中配置 Finnhub API Key"
 
         try:
-            url = "https://finnhub.io/api/v1/search"
-            params = {"q": query, "token": self.valves.FINNHUB_API_KEY}
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-
-            data = response.json()
-
-            if not data.get("result"):
+            # 优先使用本地索引，未就绪或无结果时使用远程搜索
+            matches = []
+            if self._symbol_index_ready():
+                matches = _symbol_index.search(query)
+            if not matches:
+                data = self._get("/search", {"q": query})
+                matches = data.get("result") or []
+
+            if not matches:
                 return f"未找到匹配的股票: {query}"
 
             result = f"搜索结果: {query}\n\n"
 
-            for i, item in enumerate(data["result"][:10], 1):
+            for i, item in enumerate(matches[:10], 1):
                 result += f"{i}. {item.get('description', 'N/A')}\n"
                 result += f"   代码: {item.get('symbol', 'N/A')}\n"
                 result += f"   类型: {item.get('type', 'N/A')}\n\n"
@@ -538,3 +2652,393 @@ class Tools:
 
         except Exception as e:
             return f"搜索失败: {str(e)}"
+
+    def _quote(self, symbol: str) -> dict:
+        """报价: 订阅中的股票优先使用实时报价表，否则 (或已过期) 请求 /quote"""
+        stream = None
+        if self.valves.LIVE_QUOTES_ENABLED and websocket is not None:
+            stream = live_quote_stream(
+                self.valves.LIVE_QUOTES_URL, self.valves.FINNHUB_API_KEY
+            )
+            watchlist = [
+                s.strip().upper()
+                for s in self.valves.LIVE_QUOTES_WATCHLIST.split(",")
+                if s.strip()
+            ]
+            stream.track(
+                [symbol.upper()],
+                watchlist,
+                self.valves.LIVE_QUOTES_RECENT_MINUTES * 60,
+            )
+            data = stream.quote(symbol.upper(), self.valves.LIVE_QUOTES_MAX_AGE)
+            if data is not None:
+                return data
+        elif _streams:
+            stop_live_quote_streams()
+
+        data = self._get("/quote", {"symbol": symbol})
+        if stream is not None and data and data.get("c"):
+            stream.update_base(symbol.upper(), data)
+        return data
+
+    def _snapshot_section(self, section: str, symbol: str) -> dict:
+        """获取概览的一个部分，返回 {"lines": [...]} (profile 另含 name)"""
+        if section == "profile":
+            data = self._get("/stock/profile2", {"symbol": symbol})
+            if not data:
+                return {}
+            return {
+                "name": data.get("name"),
+                "lines": [
+                    f"行业: {data.get('finnhubIndustry', 'N/A')}",
+                    f"交易所: {data.get('exchange', 'N/A')}",
+                    f"国家: {data.get('country', 'N/A')}",
+                    f"市值: ${data.get('marketCapitalization', 'N/A')}M",
+                    f"IPO日期: {data.get('ipo', 'N/A')}",
+                    f"网站: {data.get('weburl', 'N/A')}",
+                ],
+            }
+
+        if section == "quote":
+            data = self._quote(symbol)
+            if not data or data.get("c") == 0:
+                return {}
+            return {
+                "lines": [
+                    f"当前价格: ${data.get('c', 'N/A')} "
+                    f"({data.get('d', 'N/A')}, {data.get('dp', 'N/A')}%)",
+                    f"今日区间: ${data.get('l', 'N/A')} - ${data.get('h', 'N/A')}，"
+                    f"前收盘价: ${data.get('pc', 'N/A')}",
+                ]
+            }
+
+        if section == "financials":
+            data = self._get("/stock/metric", {"symbol": symbol, "metric": "all"})
+            metrics = (data or {}).get("metric") or {}
+            key_metrics = {
+                "52周区间": (
+                    f"{metrics['52WeekLow']} - {metrics['52WeekHigh']}"
+                    if metrics.get("52WeekLow") is not None
+                    and metrics.get("52WeekHigh") is not None
+                    else None
+                ),
+                "市盈率 (P/E)": metrics.get("peBasicExclExtraTTM"),
+                "每股收益 (EPS)": metrics.get("epsBasicExclExtraItemsTTM"),
+                "市净率 (P/B)": metrics.get("pbQuarterly"),
+                "股本回报率 (ROE)": metrics.get("roeTTM"),
+                "股息收益率": metrics.get("dividendYieldIndicatedAnnual"),
+                "Beta": metrics.get("beta"),
+            }
+            return {
+                "lines": [
+                    f"{key}: {value}"
+                    for key, value in key_metrics.items()
+                    if value is not None
+                ]
+            }
+
+        if section == "recommendations":
+            data = self._get("/stock/recommendation", {"symbol": symbol})
+            if not data:
+                return {}
+            rec = data[0]  # 最近一个月
+            return {
+                "lines": [
+                    f"{rec.get('period', 'N/A')}: 强烈买入 {rec.get('strongBuy', 0)}，"
+                    f"买入 {rec.get('buy', 0)}，持有 {rec.get('hold', 0)}，"
+                    f"卖出 {rec.get('sell', 0)}，强烈卖出 {rec.get('strongSell', 0)}"
+                ]
+            }
+
+        if section == "earnings":
+            data = self._get("/stock/earnings", {"symbol": symbol})
+            return {
+                "lines": [
+                    f"{earning.get('period', 'N/A')}: 实际EPS ${earning.get('actual', 'N/A')}，"
+                    f"预期 ${earning.get('estimate', 'N/A')}，"
+                    f"惊喜 {earning.get('surprisePercent', 'N/A')}%"
+                    for earning in (data or [])[:4]  # 最近4个季度
+                ]
+            }
+
+        raise ValueError(f"未知的部分: {section}")
+
+    def _sync_company_news(self, key: tuple, symbol: str, start: date, end: date):
+        """只获取存储中尚未覆盖的日期: 更早的缺口，以及上次获取之后的新闻"""
+        state = _news_store.state(key)
+        ranges = []
+        if state["covered_from"] is None:
+            ranges.append((start, end))
+        else:
+            if start < state["covered_from"]:
+                ranges.append((start, state["covered_from"]))
+            if time.time() - state["fetched_at"] > NEWS_REFRESH_SECONDS:
+                # 高水位所在的那天也重新获取，迟到的新闻靠去重过滤
+                latest = date.fromtimestamp(state["latest"]) if state["latest"] else end
+                ranges.append((min(latest, state["covered_to"]), end))
+
+        for first, last in ranges:
+            data = self._request(
+                "/company-news",
+                {"symbol": symbol, "from": first.isoformat(), "to": last.isoformat()},
+            )
+            _news_store.add(key, data or [], covered_from=first, covered_to=last)
+
+    def _sync_earnings_calendar(self, start: date, end: date, today: date) -> List[str]:
+        """并发获取区间内缺失或过期的日历窗口，返回失败窗口的错误信息"""
+        stale = _earnings_calendar.stale_windows(start, end, today)
+        if not stale:
+            return []
+
+        def fetch(window):
+            first, last = _earnings_calendar.window_range(window)
+            try:
+                data = self._request(
+                    "/calendar/earnings",
+                    {"from": first.isoformat(), "to": last.isoformat()},
+                )
+                _earnings_calendar.update(
+                    window, (data or {}).get("earningsCalendar") or []
+                )
+                return None
+            except Exception as e:
+                return str(e)
+
+        workers = max(
+            1,
+            min(
+                self.valves.BATCH_CONCURRENCY,
+                self.valves.RATE_LIMIT_PER_SECOND,
+                len(stale),
+            ),
+        )
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return [error for error in pool.map(fetch, stale) if error]
+
+    def _symbol_index_ready(self) -> bool:
+        """本地索引是否可用；过期时在后台重建 (重建期间仍使用旧索引)"""
+        exchanges = [
+            e.strip().upper()
+            for e in self.valves.SYMBOL_INDEX_EXCHANGES.split(",")
+            if e.strip()
+        ]
+        if not exchanges:
+            return False
+        max_age = self.valves.SYMBOL_INDEX_REFRESH_HOURS * HOUR
+        if _symbol_index.is_stale(exchanges, max_age) and _symbol_index.start_refresh():
+            threading.Thread(
+                target=self._refresh_symbol_index,
+                args=(exchanges,),
+                name="finnhub-symbols",
+                daemon=True,
+            ).start()
+        return _symbol_index.ready and _symbol_index.exchanges == tuple(exchanges)
+
+    def _refresh_symbol_index(self, exchanges: List[str]):
+        succeeded = False
+        try:
+            listings = []
+            for exchange in exchanges:
+                listings.extend(self._get("/stock/symbol", {"exchange": exchange}))
+            _symbol_index.build(listings, exchanges)
+            succeeded = True
+        except Exception:
+            # 保留旧索引，稍后重试
+            pass
+        finally:
+            _symbol_index.finish_refresh(succeeded)
+
+    def _insider_history(self, symbol: str, refresh: bool = False) -> InsiderHistory:
+        """解析后的内部交易数组，按股票缓存，避免后续问题重复解析"""
+        with _insider_lock:
+            cached = _insider_histories.get(symbol)
+            if cached is not None and not refresh and time.time() < cached[0]:
+                _insider_histories.move_to_end(symbol)
+                return cached[1]
+
+        path = "/stock/insider-transactions"
+        data = self._get(path, {"symbol": symbol}, refresh=refresh)
+        history = InsiderHistory((data or {}).get("data") or [])
+
+        with _insider_lock:
+            _insider_histories[symbol] = (time.time() + CACHE_TTL[path], history)
+            _insider_histories.move_to_end(symbol)
+            while len(_insider_histories) > INSIDER_CACHE_SYMBOLS:
+                _insider_histories.popitem(last=False)
+        return history
+
+    def _candle_history(self, symbol: str, resolution: str, days: int):
+        """
+        最近 days 天的 K 线，只向 Finnhub 请求本地还没有的部分:
+        比已存储更早的区间，以及最后一根 K 线 (可能尚未收盘) 之后的数据
+        """
+        candles = candle_store(
+            self.valves.CANDLE_CACHE_DIR
+            or os.path.join(tempfile.gettempdir(), "finnhub_candles")
+        )
+        now = int(time.time())
+        start = now - max(1, days) * DAY
+        series = candles.get(symbol, resolution)
+        bars = series["bars"]
+
+        ranges = []
+        if bars is None or not bars.shape[1]:
+            ranges.append((start, now, start))
+        else:
+            first, last = int(bars[0, 0]), int(bars[0, -1])
+            covered = min(first, series["covered_from"] or first)
+            if start < covered:
+                ranges.append((start, covered - 1, start))
+            if now - series["fetched_at"] > CANDLE_REFRESH_SECONDS:
+                ranges.append((last, now, None))
+
+        for first, last, covered_from in ranges:
+            data = self._request(
+                "/stock/candle",
+                {"symbol": symbol, "resolution": resolution, "from": first, "to": last},
+            )
+            new_bars = None
+            if data and data.get("s") == "ok":
+                new_bars = np.array(
+                    [data[field] for field in CANDLE_FIELDS], dtype=float
+                )
+            candles.merge(symbol, resolution, new_bars, covered_from)
+
+        bars = candles.get(symbol, resolution)["bars"]
+        if bars is None:
+            return np.empty((len(CANDLE_FIELDS), 0))
+        return bars[:, bars[0] >= start]
+
+    def _portfolio_summary(
+        self, symbols: List[str], shares: List[float], quotes: List[dict]
+    ) -> str:
+        """一次向量化计算持仓市值、权重和当日盈亏"""
+        if np is None:
+            return "持仓汇总需要安装 numpy\n"
+
+        # 每行: 当前价格, 前收盘价, 涨跌
+        prices = np.array(
+            [[q.get("c") or 0, q.get("pc") or 0, q.get("d") or 0] for q in quotes],
+            dtype=float,
+        )
+        held = np.asarray(shares, dtype=float)
+        value, previous, pnl = held @ prices
+        weights = held * prices[:, 0] / value if value else np.zeros(len(held))
+        pnl_pct = pnl / previous * 100 if previous else 0.0
+
+        top = np.argsort(-weights)[:5]
+        result = f"持仓市值: ${value:,.2f}\n"
+        result += f"当日盈亏: ${pnl:+,.2f} ({pnl_pct:+.2f}%)\n"
+        result += "最大持仓权重: " + ", ".join(
+            f"{symbols[i]} {weights[i]:.1%}" for i in top
+        )
+        return result + "\n"
+
+    def _get(
+        self,
+        path: str,
+        params: dict,
+        refresh: bool = False,
+        parse: Optional[Callable] = None,
+        variant: tuple = (),
+    ) -> Any:
+        """
+        发送 Finnhub GET 请求，优先使用缓存
+
+        :param path: API 路径，如 /quote
+        :param params: 查询参数 (不含 token)
+        :param refresh: 跳过缓存，强制重新获取 (结果仍会写入缓存)
+        :param parse: 可选，以流式方式解析响应的函数，默认完整解析 JSON
+        :param variant: 同一请求不同解析方式的缓存键后缀
+        :return: 解析后的 JSON
+        """
+        params = normalize_params(params)
+        if not self.valves.CACHE_ENABLED:
+            return self._request(path, params, parse, variant)
+
+        key = (path,) + tuple(sorted(params.items())) + variant
+        if not refresh:
+            hit, data = _cache.get(path, key)
+            if hit:
+                return data
+
+        data = self._request(path, params, parse, variant)
+        _cache.max_entries = self.valves.CACHE_MAX_ENTRIES
+        _cache.put(key, data, cache_ttl(path, params, data))
+        return data
+
+    def _request(
+        self,
+        path: str,
+        params: dict,
+        parse: Optional[Callable] = None,
+        variant: tuple = (),
+    ) -> Any:
+        """
+        发送 Finnhub GET 请求，相同的并发请求只发送一次并共享结果
+
+        :param path: API 路径，如 /quote
+        :param params: 查询参数 (不含 token)
+        :param parse: 可选，以流式方式解析响应的函数
+        :param variant: 同一请求不同解析方式的区分键
+        :return: 解析后的 JSON
+        """
+        params = normalize_params(params)
+        key = (
+            (path, self.valves.FINNHUB_API_KEY)
+            + tuple(sorted((name, str(value)) for name, value in params.items()))
+            + variant
+        )
+        return _flights.do(path, key, lambda: self._fetch(path, params, parse))
+
+    def _fetch(self, path: str, params: dict, parse: Optional[Callable] = None) -> Any:
+        """
+        发送受限流保护的 Finnhub GET 请求
+
+        :param path: API 路径，如 /quote
+        :param params: 查询参数 (不含 token)
+        :param parse: 可选，以流式方式解析响应的函数
+        :return: 解析后的 JSON
+        """
+        _limiter.configure(
+            self.valves.RATE_LIMIT_PER_SECOND, self.valves.RATE_LIMIT_PER_MINUTE
+        )
+        deadline = time.monotonic() + self.valves.RATE_LIMIT_MAX_WAIT
+        while True:
+            _limiter.acquire(max(0.0, deadline - time.monotonic()))
+            response = requests.get(
+                BASE_URL + path,
+                params={**params, "token": self.valves.FINNHUB_API_KEY},
+                timeout=10,
+                stream=parse is not None,
+            )
+            if response.status_code == 429:
+                response.close()
+                # 暂停后重新排队，超过最长等待时间时由 acquire 报错
+                _limiter.throttle(self._retry_after(response))
+                continue
+            _limiter.succeeded()
+
+            # 本周期额度已用完，暂停到重置时间
+            if response.headers.get("X-Ratelimit-Remaining") == "0":
+                try:
+                    reset = float(response.headers.get("X-Ratelimit-Reset", ""))
+                    _limiter.pause(min(MAX_BACKOFF, max(0.0, reset - time.time())))
+                except ValueError:
+                    pass
+
+            try:
+                response.raise_for_status()
+                if parse is None:
+                    return response.json()
+                return parse(response)
+            finally:
+                # 出错或提前停止读取时关闭连接，丢弃剩余数据
+                response.close()
+
+    def _retry_after(self, response) -> Optional[float]:
+        """解析 Retry-After 头 (秒)"""
+        try:
+            return min(MAX_BACKOFF, max(0.0, float(response.headers["Retry-After"])))
+        except (KeyError, ValueError):
+            return None
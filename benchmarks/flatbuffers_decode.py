@@ -0,0 +1,117 @@
+"""
+Decode time and peak memory of Open-Meteo JSON vs FlatBuffers responses
+
+Builds the same synthetic hourly forecast (random values, openmeteo_sdk
+schema) as a JSON document and as a size-prefixed FlatBuffers body, then
+times json.loads against decode_flatbuffers.
+
+    pip install numpy openmeteo_sdk
+    python benchmarks/flatbuffers_decode.py
+"""
+
+import json
+import os
+import sys
+import time
+import timeit
+import tracemalloc
+
+import flatbuffers
+import numpy as np
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "weather"
+    ),
+)
+import weather_with_air_quality as weather  # noqa: E402
+
+START = 1760659200
+OFFSET = 7200
+
+
+def build(fields, hours, seed=0):
+    """(FlatBuffers body, JSON body) of one location's hourly forecast"""
+    rng = np.random.default_rng(seed)
+    builder = flatbuffers.Builder(1024)
+    document = {
+        "latitude": 52.5,
+        "longitude": 13.4,
+        "utc_offset_seconds": OFFSET,
+        "timezone": "Europe/Berlin",
+        "hourly": {
+            "time": [
+                time.strftime("%Y-%m-%dT%H:%M", time.gmtime(START + 3600 * i + OFFSET))
+                for i in range(hours)
+            ]
+        },
+    }
+    variables = []
+    for field in fields:
+        values = np.round(rng.uniform(0, 30, hours), 1).astype(np.float32)
+        document["hourly"][field] = [round(float(v), 1) for v in values]
+        vector = builder.CreateNumpyVector(values)
+        builder.StartObject(13)
+        builder.PrependUOffsetTRelativeSlot(3, vector, 0)
+        variables.append(builder.EndObject())
+
+    builder.StartVector(4, len(variables), 4)
+    for variable in reversed(variables):
+        builder.PrependUOffsetTRelative(variable)
+    vector = builder.EndVector()
+    builder.StartObject(4)
+    builder.PrependInt64Slot(0, START, 0)
+    builder.PrependInt64Slot(1, START + 3600 * hours, 0)
+    builder.PrependInt32Slot(2, 3600, 0)
+    builder.PrependUOffsetTRelativeSlot(3, vector, 0)
+    hourly = builder.EndObject()
+
+    zone = builder.CreateString("Europe/Berlin")
+    builder.StartObject(15)
+    builder.PrependFloat32Slot(0, 52.5, 0)
+    builder.PrependFloat32Slot(1, 13.4, 0)
+    builder.PrependInt32Slot(6, OFFSET, 0)
+    builder.PrependUOffsetTRelativeSlot(7, zone, 0)
+    builder.PrependUOffsetTRelativeSlot(11, hourly, 0)
+    builder.FinishSizePrefixed(builder.EndObject())
+    return bytes(builder.Output()), json.dumps(document).encode()
+
+
+def peak(fn) -> int:
+    tracemalloc.start()
+    result = fn()
+    _, size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def case(name, variables, hours, locations):
+    fields = [f"v{i}" for i in range(variables)]
+    body, document = build(fields, hours)
+    body *= locations
+    if locations > 1:
+        document = b"[" + b",".join([document] * locations) + b"]"
+    params = {"hourly": fields}
+
+    def from_json():
+        return json.loads(document)
+
+    def from_flatbuffers():
+        return weather.decode_flatbuffers(body, params)
+
+    json_ms = min(timeit.repeat(from_json, number=20, repeat=5)) / 20 * 1e3
+    fb_ms = min(timeit.repeat(from_flatbuffers, number=20, repeat=5)) / 20 * 1e3
+    print(
+        f"{name:24} decode {json_ms:5.2f} / {fb_ms:5.2f} ms, "
+        f"peak {peak(from_json) / 1024:5.0f} / {peak(from_flatbuffers) / 1024:4.0f} KB "
+        f"(JSON / FlatBuffers)"
+    )
+
+
+if __name__ == "__main__":
+    case("168h x 6 vars", 6, 168, 1)
+    case("384h x 6 vars", 6, 384, 1)
+    case("384h x 20 vars", 20, 384, 1)
+    case("384h x 6 vars, 10 locs", 6, 384, 10)
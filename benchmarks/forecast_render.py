@@ -0,0 +1,115 @@
+"""
+Time get_hourly_forecast and get_daily_forecast on a fixed payload
+
+Open-Meteo is replaced by a synthetic 192-hour, 6-variable weather and
+2-variable air quality payload (16 forecast days), so only decoding of the
+cached response and rendering are measured. Pass the path of another copy of
+the tool to compare versions, e.g. the renderer before the columnar rewrite:
+
+    git show f4d564b^:weather/weather_with_air_quality.py > /tmp/before.py
+    python benchmarks/forecast_render.py /tmp/before.py
+    python benchmarks/forecast_render.py
+"""
+
+import hashlib
+import importlib.util
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TOOL = os.path.join(ROOT, "weather", "weather_with_air_quality.py")
+
+HOURS = 192
+DAYS = 16
+HOURLY = (
+    "temperature_2m",
+    "apparent_temperature",
+    "precipitation",
+    "precipitation_probability",
+    "wind_speed_10m",
+    "uv_index",
+)
+DAILY = (
+    "temperature_2m_max",
+    "temperature_2m_min",
+    "apparent_temperature_max",
+    "apparent_temperature_min",
+    "sunrise",
+    "sunset",
+    "wind_speed_10m_max",
+    "precipitation_sum",
+    "precipitation_probability_max",
+)
+
+
+def payloads():
+    """(weather, air quality) responses starting at the current UTC hour"""
+    rnd = random.Random(1)
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    hours = [
+        (now + timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M") for i in range(HOURS)
+    ]
+    days = [(now + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(DAYS)]
+    hourly = {"time": hours}
+    for field in HOURLY:
+        hourly[field] = [round(rnd.uniform(0, 30), 1) for _ in hours]
+    daily = {"time": days, "weather_code": [rnd.choice([0, 3, 61, 95]) for _ in days]}
+    for field in DAILY:
+        daily[field] = [round(rnd.uniform(0, 30), 1) for _ in days]
+    air = {
+        "time": hours,
+        "us_aqi": [rnd.randint(0, 320) for _ in hours],
+        "pm2_5": [round(rnd.uniform(0, 90), 1) for _ in hours],
+    }
+    weather = {
+        "timezone": "UTC",
+        "utc_offset_seconds": 0,
+        "hourly": hourly,
+        "daily": daily,
+    }
+    return weather, {"timezone": "UTC", "utc_offset_seconds": 0, "hourly": air}
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+def load(path: str):
+    spec = importlib.util.spec_from_file_location("weather_tool", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    weather, air = payloads()
+    module.requests.get = lambda url, params=None, **kwargs: Response(
+        air if "air-quality" in url else weather
+    )
+    return module
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TOOL
+    tools = load(path).Tools()
+
+    def hourly():
+        return tools.get_hourly_forecast(52.52, 13.41, 168)
+
+    def daily():
+        return tools.get_daily_forecast(52.52, 13.41, 16)
+
+    # Warm the response cache, then time rendering from it
+    output = hourly() + daily()
+    hourly_us = min(timeit.repeat(hourly, number=200, repeat=5)) / 200 * 1e6
+    daily_us = min(timeit.repeat(daily, number=2000, repeat=5)) / 2000 * 1e6
+    print(path)
+    print(f"  hourly, 168 h: {hourly_us:6.0f} us per call")
+    print(f"  daily, 16 d:   {daily_us:6.0f} us per call")
+    print(f"  output sha256: {hashlib.sha256(output.encode()).hexdigest()[:16]}")
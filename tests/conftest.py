@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The tools are single files in directories with spaces, not packages
+for directory in ("Stock info", "Get news", "weather"):
+    sys.path.insert(0, os.path.join(ROOT, directory))
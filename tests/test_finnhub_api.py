@@ -0,0 +1,118 @@
+import threading
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import finnhub_api
+
+
+@pytest.fixture
+def tools(monkeypatch):
+    monkeypatch.setattr(finnhub_api, "_news_store", finnhub_api.NewsStore())
+    tools = finnhub_api.Tools()
+    tools.valves.FINNHUB_API_KEY = "test"
+    return tools
+
+
+def test_company_news_does_not_refetch_ranges_trimmed_by_count(tools, monkeypatch):
+    # 120 items a day: a 7-day window holds more than NEWS_MAX_ITEMS
+    requests = []
+
+    def fake_request(path, params, parse=None, variant=()):
+        requests.append((params["from"], params["to"]))
+        first = date.fromisoformat(params["from"])
+        last = date.fromisoformat(params["to"])
+        items = []
+        day = first
+        while day <= last:
+            start = datetime.combine(day, datetime.min.time()).timestamp()
+            for i in range(120):
+                ident = int(start) + i * 600
+                items.append({"id": ident, "datetime": ident, "url": f"u{ident}"})
+            day += timedelta(days=1)
+        return items
+
+    monkeypatch.setattr(tools, "_request", fake_request)
+    tools.finnhub_company_news("AAPL", days=7)
+    assert len(requests) == 1
+
+    tools.finnhub_company_news("AAPL", days=7)
+    assert len(requests) == 1
+
+
+def test_company_news_beyond_retention_goes_upstream(tools, monkeypatch):
+    calls = []
+
+    def fake_get(path, params, **kwargs):
+        calls.append(params)
+        return [{"id": 1, "datetime": 1, "headline": "old", "url": "u1"}]
+
+    monkeypatch.setattr(tools, "_get", fake_get)
+    result = tools.finnhub_company_news("AAPL", days=90)
+    assert "最近90天" in result and "old" in result
+    assert len(calls) == 1
+    assert calls[0]["from"] == (date.today() - timedelta(days=90)).isoformat()
+
+
+def test_news_store_state_hides_internals():
+    store = finnhub_api.NewsStore()
+    store.add(("company", "AAPL"), [{"id": 1, "datetime": 1, "url": "u"}])
+    assert set(store.state(("company", "AAPL"))) == set(finnhub_api.NEWS_STATE_FIELDS)
+
+
+def test_rsi_of_flat_series_is_neutral():
+    np = pytest.importorskip("numpy")
+    assert finnhub_api.rsi(np.full(30, 10.0))[-1] == 50
+    assert finnhub_api.rsi(np.arange(30.0))[-1] == 100
+    assert finnhub_api.rsi(np.arange(30.0, 0, -1))[-1] == 0
+
+
+def test_earnings_calendar_windows_are_bounded(monkeypatch):
+    monkeypatch.setattr(finnhub_api, "CALENDAR_MAX_WINDOWS", 3)
+    store = finnhub_api.EarningsCalendarStore()
+    first = store.window_of(date(2026, 1, 1))
+    for window in range(first, first + 5):
+        day = store.window_range(window)[0].isoformat()
+        store.update(window, [{"date": day, "symbol": "AAPL"}])
+
+    assert len(store._windows) == 3
+    assert store.query(date(2026, 1, 1), date(2026, 1, 7)) == []
+    kept = store.window_range(first + 4)[0]
+    assert store.query(kept, kept) == [{"date": kept.isoformat(), "symbol": "AAPL"}]
+    assert store.stale_windows(date(2026, 1, 1), date(2026, 1, 1), date.today())
+
+
+class FakeWebSocketApp:
+    def __init__(self, url, on_open, **callbacks):
+        self.url = url
+        self.on_open = on_open
+        self.closed = threading.Event()
+
+    def run_forever(self, **kwargs):
+        self.on_open(self)
+        self.closed.wait(5)
+
+    def close(self):
+        self.closed.set()
+
+
+@pytest.mark.skipif(finnhub_api.websocket is None, reason="needs websocket-client")
+def test_live_quote_stream_is_replaced_and_stopped(tools, monkeypatch):
+    monkeypatch.setattr(finnhub_api.websocket, "WebSocketApp", FakeWebSocketApp)
+    monkeypatch.setattr(finnhub_api, "_streams", {})
+    tools.valves.LIVE_QUOTES_ENABLED = True
+    monkeypatch.setattr(tools, "_get", lambda path, params: {})
+
+    tools.valves.FINNHUB_API_KEY = "old"
+    tools._quote("AAPL")
+    old = finnhub_api._streams[(finnhub_api.WS_URL, "old")]
+    tools.valves.FINNHUB_API_KEY = "new"
+    tools._quote("AAPL")
+    new = finnhub_api._streams[(finnhub_api.WS_URL, "new")]
+    assert list(finnhub_api._streams) == [(finnhub_api.WS_URL, "new")]
+    assert not old._thread.is_alive()
+
+    tools.valves.LIVE_QUOTES_ENABLED = False
+    tools._quote("AAPL")
+    assert finnhub_api._streams == {}
+    assert not new._thread.is_alive()
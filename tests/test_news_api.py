@@ -0,0 +1,72 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import news_api
+
+ARTICLES = [
+    "elon musk spacex launch",
+    "elon musk nasa contract",
+    "elon musk tesla nasa deal",
+    "nasa budget",
+    "elon musk interview",
+]
+
+
+@pytest.fixture
+def fts():
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE VIRTUAL TABLE t USING fts5 (body)")
+    db.executemany("INSERT INTO t VALUES (?)", [(body,) for body in ARTICLES])
+    return lambda q: sorted(
+        body
+        for (body,) in db.execute(
+            "SELECT body FROM t WHERE t MATCH ?", (news_api.fts_query(q),)
+        )
+    )
+
+
+def test_fts_query_keeps_grouping(fts):
+    q = '"elon musk" -tesla AND (spacex OR nasa)'
+    assert news_api.fts_query(q) == (
+        '"elon musk" NOT "tesla" AND ("spacex" OR "nasa")'
+    )
+    assert fts(q) == ["elon musk nasa contract", "elon musk spacex launch"]
+    assert fts("(spacex OR nasa) musk") == [
+        "elon musk nasa contract",
+        "elon musk spacex launch",
+        "elon musk tesla nasa deal",
+    ]
+    assert fts("musk -(spacex OR nasa)") == ["elon musk interview"]
+
+
+@pytest.mark.parametrize("q", ["musk (spacex OR nasa", "musk) nasa", "(musk"])
+def test_fts_query_rejects_unbalanced_parentheses(q):
+    assert news_api.fts_query(q) is None
+
+
+def test_search_closes_status_when_a_later_page_fails(monkeypatch):
+    tools = news_api.Tools()
+
+    def fake_fetch(endpoint, params):
+        if params["page"] > 1:
+            return {"status": "error", "message": "rateLimited"}
+        articles = [
+            {"title": f"story {i}", "url": f"https://example.com/{i}"}
+            for i in range(news_api.PAGE_SIZE)
+        ]
+        return {"status": "ok", "totalResults": 30, "articles": articles}
+
+    monkeypatch.setattr(tools, "_fetch", fake_fetch)
+    events = []
+
+    async def emitter(event):
+        events.append(event)
+
+    asyncio.run(
+        tools._search("everything", {"q": "x"}, 3, "articles", "Error", emitter)
+    )
+    statuses = [e["data"] for e in events if e["type"] == "status"]
+    assert statuses[-1]["done"] is True
+    assert "page 2 failed" in statuses[-1]["description"]
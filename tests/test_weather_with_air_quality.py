@@ -0,0 +1,178 @@
+import json
+import time
+
+import pytest
+
+import weather_with_air_quality as weather
+
+try:
+    import flatbuffers
+    import numpy as np
+except ImportError:
+    flatbuffers = np = None
+
+needs_flatbuffers = pytest.mark.skipif(
+    weather.WeatherApiResponse is None or np is None,
+    reason="needs numpy and openmeteo_sdk",
+)
+
+START = 1760659200
+OFFSET = 7200
+
+
+def _variable(builder, values=None, value=None):
+    vector = None
+    if values is not None:
+        array = np.array([np.nan if v is None else v for v in values], np.float32)
+        vector = builder.CreateNumpyVector(array)
+    builder.StartObject(13)
+    if vector is not None:
+        builder.PrependUOffsetTRelativeSlot(3, vector, 0)
+    if value is not None:
+        builder.PrependFloat32Slot(2, value, 0.0)
+    return builder.EndObject()
+
+
+def _block(builder, end, interval, variables):
+    builder.StartVector(4, len(variables), 4)
+    for variable in reversed(variables):
+        builder.PrependUOffsetTRelative(variable)
+    vector = builder.EndVector()
+    builder.StartObject(4)
+    builder.PrependInt64Slot(0, START, 0)
+    builder.PrependInt64Slot(1, end, 0)
+    builder.PrependInt32Slot(2, interval, 0)
+    builder.PrependUOffsetTRelativeSlot(3, vector, 0)
+    return builder.EndObject()
+
+
+def _responses(hourly: dict, current: dict):
+    """The same hourly/current data as a FlatBuffers body and a JSON document"""
+    hours = len(next(iter(hourly.values())))
+    builder = flatbuffers.Builder(1024)
+    hourly_block = _block(
+        builder,
+        START + 3600 * hours,
+        3600,
+        [_variable(builder, values=values) for values in hourly.values()],
+    )
+    current_block = _block(
+        builder,
+        START + 900,
+        900,
+        [
+            _variable(builder, value=float("nan") if v is None else v)
+            for v in current.values()
+        ],
+    )
+    zone = builder.CreateString("Europe/Berlin")
+    builder.StartObject(15)
+    builder.PrependInt32Slot(6, OFFSET, 0)
+    builder.PrependUOffsetTRelativeSlot(7, zone, 0)
+    builder.PrependUOffsetTRelativeSlot(9, current_block, 0)
+    builder.PrependUOffsetTRelativeSlot(11, hourly_block, 0)
+    builder.FinishSizePrefixed(builder.EndObject())
+
+    def local(t):
+        return time.strftime("%Y-%m-%dT%H:%M", time.gmtime(t + OFFSET))
+
+    document = {
+        "utc_offset_seconds": OFFSET,
+        "timezone": "Europe/Berlin",
+        "current": {"time": local(START), **current},
+        "hourly": {
+            "time": [local(START + 3600 * i) for i in range(hours)],
+            **hourly,
+        },
+    }
+    params = {"hourly": list(hourly), "current": list(current)}
+    decoded = weather.decode_flatbuffers(bytes(builder.Output()), params)
+    return decoded, json.loads(json.dumps(document))
+
+
+def _render(weather_data: dict, air_data: dict) -> str:
+    rows = len(weather_data["hourly"]["time"])
+    current = air_data["current"]["us_aqi"]
+    return f"{current} ({weather.aqi_level(current)})\n" + weather.render_hourly_rows(
+        weather.to_columns(weather_data["hourly"], weather.HOURLY_FIELDS, rows),
+        weather.align_columns(
+            weather_data["hourly"]["time"],
+            air_data["hourly"],
+            weather.HOURLY_AIR_FIELDS,
+        ),
+    )
+
+
+@needs_flatbuffers
+def test_flatbuffers_gaps_render_like_json():
+    weather_fb, weather_json = _responses(
+        {
+            "temperature_2m": [12.5, None, 11.0],
+            "apparent_temperature": [11.0, 10.5, None],
+            "precipitation": [0.0, 0.25, 0.0],
+            "precipitation_probability": [10.0, None, 30.0],
+            "wind_speed_10m": [5.5, 6.0, 7.5],
+            "uv_index": [None, 1.0, 2.0],
+        },
+        {"temperature_2m": 12.5},
+    )
+    air_fb, air_json = _responses(
+        {"us_aqi": [42.0, None, 55.0], "pm2_5": [None, 3.5, 4.0]},
+        {"us_aqi": None},
+    )
+
+    expected = _render(weather_json, air_json)
+    assert "None (Unknown)" in expected
+    assert _render(weather_fb, air_fb) == expected
+
+
+def test_aqi_level_nan_is_unknown():
+    assert weather.aqi_level(float("nan")) == "Unknown"
+    assert weather.aqi_level(None) == "Unknown"
+    assert weather.aqi_level(42.0) == weather.aqi_level(42)
+
+
+def _city(geoname_id, name, country, admin1, population):
+    columns = [str(geoname_id), name, name, "", "40.0", "-89.0", "P", "PPL"]
+    columns += [country, "", admin1, "", "", "", str(population)]
+    columns += ["", "200", "America/Chicago", "2026-01-01"]
+    return "\t".join(columns) + "\n"
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    cities = tmp_path / "cities.txt"
+    cities.write_text(
+        _city(1, "Springfield", "US", "IL", 116000)
+        + _city(2, "Springfield", "US", "MO", 169000)
+        + _city(3, "Springfield", "US", "MA", 155000)
+        + _city(4, "Newcastle", "AU", "02", 322000)
+    )
+    (tmp_path / "admin1CodesASCII.txt").write_text(
+        "US.IL\tIllinois\tIllinois\t1\n"
+        "US.MO\tMissouri\tMissouri\t2\n"
+        "US.MA\tMassachusetts\tMassachusetts\t3\n"
+        "AU.02\tNew South Wales\tNew South Wales\t4\n"
+    )
+    return weather.Gazetteer(str(cities))
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("Springfield, Illinois", ["Springfield, Illinois, US"]),
+        ("Springfield, IL", ["Springfield, Illinois, US"]),
+        ("Springfield, missouri", ["Springfield, Missouri, US"]),
+        ("Newcastle, New South", ["Newcastle, New South Wales, AU"]),
+    ],
+)
+def test_gazetteer_region_qualifier(gazetteer, query, expected):
+    assert [place["name"] for place in gazetteer.search(query)] == expected
+
+
+@pytest.mark.parametrize("qualifier", ["field", "is", "ssouri", "South Wales"])
+def test_gazetteer_qualifier_needs_whole_words(gazetteer, qualifier):
+    place = gazetteer.search("Springfield")[0]
+    assert not gazetteer._qualifies(weather.normalize_place(qualifier), place)
+    newcastle = gazetteer.search("Newcastle")[0]
+    assert not gazetteer._qualifies(weather.normalize_place(qualifier), newcastle)
@@ -5,14 +5,845 @@ version: 1.1
 description: Get weather forecasts and air quality data
 """
 
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import unicodedata
+import warnings
 import requests
-from typing import Optional
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import date, datetime, timedelta, timezone
+from difflib import SequenceMatcher
+from typing import Callable, List, Optional, Tuple
 from pydantic import BaseModel, Field
 
+try:
+    import numpy as np
+except ImportError:
+    # Optional: needed for historical statistics and FlatBuffers responses
+    np = None
+
+try:
+    from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
+except ImportError:
+    # Optional: without it responses are always requested as JSON
+    WeatherApiResponse = None
+
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+AIR_QUALITY_URL = "https://air-quality-api.open-meteo.com/v1/air-quality"
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+
+# Shared deadline (seconds) for all upstream requests of a single tool call
+REQUEST_TIMEOUT = 10
+
+# Shared deadline (seconds) for the yearly chunks of a historical comparison
+HISTORY_TIMEOUT = 30
+
+# Historical comparison limits: years of history and days per compared period
+MAX_HISTORY_YEARS = 30
+MAX_HISTORY_DAYS = 31
+
+# The forecast API also serves this many past days, older periods use the archive
+FORECAST_PAST_DAYS = 92
+
+# Maximum number of locations in one batched comparison request
+MAX_LOCATIONS = 50
+
+# Upper bounds on names scanned per gazetteer lookup
+MAX_PREFIX_MATCHES = 5000
+MAX_FUZZY_CANDIDATES = 20000
+
+# Shared pool so weather and air quality requests can run side by side
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="open-meteo")
+
+# Separate pool for the yearly chunks of historical comparisons, so a long
+# history request cannot hold up forecast calls on the shared pool
+_history_executor = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="open-meteo-history"
+)
+
+
+WEATHER_CODES = {
+    0: "Clear sky",
+    1: "Mainly clear",
+    2: "Partly cloudy",
+    3: "Overcast",
+    45: "Fog",
+    48: "Depositing rime fog",
+    51: "Light drizzle",
+    53: "Moderate drizzle",
+    55: "Dense drizzle",
+    61: "Slight rain",
+    63: "Moderate rain",
+    65: "Heavy rain",
+    71: "Slight snow",
+    73: "Moderate snow",
+    75: "Heavy snow",
+    77: "Snow grains",
+    80: "Slight rain showers",
+    81: "Moderate rain showers",
+    82: "Violent rain showers",
+    85: "Slight snow showers",
+    86: "Heavy snow showers",
+    95: "Thunderstorm",
+    96: "Thunderstorm with hail",
+    99: "Thunderstorm with heavy hail",
+}
+
+# Upper bounds of the US AQI categories, the last level has no upper bound
+AQI_BREAKPOINTS = (50, 100, 150, 200, 300)
+AQI_LEVELS = (
+    "Good",
+    "Moderate",
+    "Unhealthy for Sensitive Groups",
+    "Unhealthy",
+    "Very Unhealthy",
+    "Hazardous",
+)
+# Precomputed level of every integer AQI value Open-Meteo reports
+AQI_LEVEL_TABLE = tuple(AQI_LEVELS[bisect_left(AQI_BREAKPOINTS, v)] for v in range(501))
+
+# Forecast store horizon, the maximum each API offers
+FORECAST_DAYS = 16
+AIR_QUALITY_FORECAST_DAYS = 7
+
+CURRENT_FIELDS = (
+    "temperature_2m",
+    "apparent_temperature",
+    "wind_speed_10m",
+    "precipitation",
+    "weather_code",
+    "is_day",
+)
+CURRENT_AIR_FIELDS = ("us_aqi", "pm10", "pm2_5", "carbon_monoxide")
+
+# Column order of the rendered forecasts, the first field is the time axis
+DAILY_FIELDS = (
+    "time",
+    "weather_code",
+    "temperature_2m_max",
+    "temperature_2m_min",
+    "apparent_temperature_max",
+    "apparent_temperature_min",
+    "sunrise",
+    "sunset",
+    "wind_speed_10m_max",
+    "precipitation_sum",
+    "precipitation_probability_max",
+)
+HOURLY_FIELDS = (
+    "time",
+    "temperature_2m",
+    "apparent_temperature",
+    "precipitation",
+    "precipitation_probability",
+    "wind_speed_10m",
+    "uv_index",
+)
+HOURLY_AIR_FIELDS = ("us_aqi", "pm2_5")
+
+# Daily variables of the historical comparison: (field, label, unit, period aggregate)
+HISTORY_FIELDS = (
+    ("temperature_2m_max", "Daily high", "°C", "mean"),
+    ("temperature_2m_min", "Daily low", "°C", "mean"),
+    ("temperature_2m_mean", "Daily mean", "°C", "mean"),
+    ("precipitation_sum", "Precipitation", "mm", "sum"),
+    ("wind_speed_10m_max", "Max wind", "km/h", "mean"),
+)
+
+DAILY_ROW = (
+    "[{}]\n"
+    "  Condition: {}\n"
+    "  Temperature: {}°C ~ {}°C\n"
+    "  Feels Like: {}°C ~ {}°C\n"
+    "  Max Wind Speed: {} km/h\n"
+    "  Precipitation: {} mm (Probability: {}%)\n"
+    "  Sunrise: {} | Sunset: {}\n\n"
+)
+HOURLY_ROW = (
+    "{}: {}°C (Feels {}°C), Wind {} km/h, Precip {} mm, UV {}, "
+    "AQI {} ({}), PM2.5 {} μg/m³\n"
+)
+
+
+def weather_description(code) -> str:
+    """Convert weather code to description"""
+    description = WEATHER_CODES.get(code)
+    if description is None:
+        return f"Unknown weather (code: {code})"
+    return description
+
+
+def aqi_level(aqi) -> str:
+    """Get air quality level based on AQI value"""
+    if type(aqi) is int and 0 <= aqi < len(AQI_LEVEL_TABLE):
+        return AQI_LEVEL_TABLE[aqi]
+    try:
+        value = float(aqi)
+    except (ValueError, TypeError):
+        return "Unknown"
+    if math.isnan(value):
+        return "Unknown"
+    return AQI_LEVELS[bisect_left(AQI_BREAKPOINTS, value)]
+
+
+def to_columns(block: dict, fields, rows: int, default="N/A") -> dict:
+    """
+    Columnar view of an Open-Meteo time block
+
+    Every requested field is cut or padded to exactly `rows` values once, so
+    renderers can zip the columns without per-row bounds checks.
+    """
+    columns = {}
+    for field in fields:
+        values = block.get(field)
+        if values is None:
+            values = ()
+        if len(values) >= rows:
+            columns[field] = values[:rows]
+        else:
+            columns[field] = list(values) + [default] * (rows - len(values))
+    return columns
+
+
+def align_columns(times, block: dict, fields, default="N/A") -> dict:
+    """
+    Columnar view of `block` aligned to the `times` axis by timestamp
+
+    Timestamps missing from `block` (e.g. beyond the air quality horizon)
+    are filled with `default`.
+    """
+    index = {t: i for i, t in enumerate(block.get("time") or ())}
+    positions = [index.get(t) for t in times]
+    columns = {}
+    for field in fields:
+        values = block.get(field)
+        if values is None:
+            values = ()
+        size = len(values)
+        columns[field] = [
+            values[i] if i is not None and i < size else default for i in positions
+        ]
+    return columns
+
+
+def local_hour(data: dict) -> str:
+    """Current hour of a response's location in Open-Meteo's ISO time format"""
+    offset = data.get("utc_offset_seconds", 0) or 0
+    now = datetime.now(timezone.utc) + timedelta(seconds=offset)
+    return now.strftime("%Y-%m-%dT%H:00")
+
+
+def render_daily_rows(columns: dict) -> str:
+    """Render a columnar daily forecast in one pass"""
+    codes = [0 if code == "N/A" else code for code in columns["weather_code"]]
+    return "".join(
+        DAILY_ROW.format(
+            date,
+            weather_description(code),
+            temp_min,
+            temp_max,
+            apparent_min,
+            apparent_max,
+            wind_max,
+            precip_sum,
+            precip_prob,
+            sunrise,
+            sunset,
+        )
+        for (
+            date,
+            code,
+            temp_max,
+            temp_min,
+            apparent_max,
+            apparent_min,
+            sunrise,
+            sunset,
+            wind_max,
+            precip_sum,
+            precip_prob,
+        ) in zip(columns["time"], codes, *(columns[f] for f in DAILY_FIELDS[2:]))
+    )
+
+
+def render_hourly_rows(weather: dict, air: dict) -> str:
+    """Render columnar hourly weather and air quality in one pass"""
+    return "".join(
+        HOURLY_ROW.format(
+            hour, temp, apparent, wind, precip, uv, aqi, aqi_level(aqi), pm25
+        )
+        for hour, temp, apparent, precip, wind, uv, aqi, pm25 in zip(
+            weather["time"],
+            weather["temperature_2m"],
+            weather["apparent_temperature"],
+            weather["precipitation"],
+            weather["wind_speed_10m"],
+            weather["uv_index"],
+            air["us_aqi"],
+            air["pm2_5"],
+        )
+    )
+
+
+class LocalTimes:
+    """
+    Lazy sequence of local ISO timestamps over Unix times
+
+    FlatBuffers responses carry time axes as (start, end, interval) and
+    sunrise/sunset as int64 Unix times. Strings are only built for the rows
+    that are actually read, in the same format the JSON API returns.
+    """
+
+    def __init__(self, epochs, utc_offset: int, fmt: str):
+        self.epochs = epochs
+        self.utc_offset = utc_offset
+        self.fmt = fmt
+
+    def __len__(self) -> int:
+        return len(self.epochs)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LocalTimes(self.epochs[index], self.utc_offset, self.fmt)
+        return time.strftime(
+            self.fmt, time.gmtime(int(self.epochs[index]) + self.utc_offset)
+        )
+
+    def __iter__(self):
+        for i in range(len(self.epochs)):
+            yield self[i]
+
+
+def decode_flatbuffers(content: bytes, params: dict):
+    """
+    Decode an Open-Meteo `format=flatbuffers` body into the JSON response shape
+
+    Series are kept as NumPy arrays read straight from the buffer instead of
+    Python lists. Several size-prefixed messages (one per location) decode
+    into a list, like the JSON API.
+    """
+    results = []
+    position = 0
+    while position + 4 <= len(content):
+        length = int.from_bytes(content[position : position + 4], "little")
+        response = WeatherApiResponse.GetRootAs(content, position + 4)
+        results.append(_flatbuffer_to_dict(response, params))
+        position += 4 + length
+    if not results:
+        raise ValueError("Empty FlatBuffers response")
+    return results[0] if len(results) == 1 else results
+
+
+def _flatbuffer_to_dict(response, params: dict) -> dict:
+    offset = response.UtcOffsetSeconds()
+    zone = response.Timezone()
+    data = {
+        "latitude": response.Latitude(),
+        "longitude": response.Longitude(),
+        "utc_offset_seconds": offset,
+        "timezone": zone.decode() if isinstance(zone, bytes) else zone,
+    }
+
+    sections = (
+        ("current", response.Current(), "%Y-%m-%dT%H:%M"),
+        ("hourly", response.Hourly(), "%Y-%m-%dT%H:%M"),
+        ("daily", response.Daily(), "%Y-%m-%d"),
+    )
+    for name, block, fmt in sections:
+        fields = params.get(name)
+        if not fields or block is None:
+            continue
+        if isinstance(fields, str):
+            fields = fields.split(",")
+
+        # Variables come back in the requested order
+        if name == "current":
+            section = {"time": LocalTimes((block.Time(),), offset, fmt)[0]}
+            for i, field in enumerate(fields):
+                value = block.Variables(i).Value()
+                section[field] = None if math.isnan(value) else round(value, 2)
+        else:
+            axis = range(block.Time(), block.TimeEnd(), block.Interval())
+            section = {"time": LocalTimes(axis, offset, fmt)}
+            for i, field in enumerate(fields):
+                variable = block.Variables(i)
+                if variable.ValuesInt64Length():
+                    section[field] = LocalTimes(
+                        variable.ValuesInt64AsNumpy(), offset, "%Y-%m-%dT%H:%M"
+                    )
+                else:
+                    # float32 -> float64 so values print like the JSON API does
+                    values = np.round(variable.ValuesAsNumpy().astype(np.float64), 2)
+                    if np.isnan(values).any():
+                        # Missing values are NaN here but null in JSON
+                        values = [None if math.isnan(v) else v for v in values.tolist()]
+                    section[field] = values
+        data[name] = section
+    return data
+
+
+def history_statistics(history, current):
+    """
+    Climate statistics of a period, vectorized over variables and years
+
+    `history` has shape (variables, years, days) and `current` shape
+    (variables, days), both NaN where data is missing. Each variable is
+    reduced to a per-year period aggregate (mean or sum, see HISTORY_FIELDS)
+    from which normals, percentiles, anomalies and the current period's rank
+    are computed; extremes are taken over all historical days.
+    """
+    is_sum = np.array([agg == "sum" for _, _, _, agg in HISTORY_FIELDS])[:, None]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        valid = ~np.isnan(history)
+        counts = valid.sum(axis=2)
+        totals = np.where(valid, history, 0.0).sum(axis=2)
+        yearly = np.where(is_sum, totals, totals / np.maximum(counts, 1))
+        yearly[counts == 0] = np.nan
+
+        current_valid = ~np.isnan(current)
+        current_count = current_valid.sum(axis=1)
+        current_total = np.where(current_valid, current, 0.0).sum(axis=1)
+        now = np.where(
+            is_sum[:, 0], current_total, current_total / np.maximum(current_count, 1)
+        )
+        now[current_count == 0] = np.nan
+
+        normal = np.nanmean(yearly, axis=1)
+        p10, p50, p90 = np.nanpercentile(yearly, [10, 50, 90], axis=1)
+        years = (~np.isnan(yearly)).sum(axis=1)
+        rank = (yearly < now[:, None]).sum(axis=1) / np.maximum(years, 1) * 100
+
+        flat = history.reshape(history.shape[0], -1)
+        filled_high = np.where(np.isnan(flat), -np.inf, flat)
+        filled_low = np.where(np.isnan(flat), np.inf, flat)
+        high_index = filled_high.argmax(axis=1)
+        low_index = filled_low.argmin(axis=1)
+
+    rows = np.arange(flat.shape[0])
+    return {
+        "current": now,
+        "normal": normal,
+        "anomaly": now - normal,
+        "p10": p10,
+        "p50": p50,
+        "p90": p90,
+        "rank": rank,
+        "years": years,
+        "high": flat[rows, high_index],
+        "high_index": np.stack(np.unravel_index(high_index, history.shape[1:]), 1),
+        "low": flat[rows, low_index],
+        "low_index": np.stack(np.unravel_index(low_index, history.shape[1:]), 1),
+    }
+
+
+def ordinal(n: int) -> str:
+    """1st, 2nd, 3rd, 4th, 11th, 12th, 13th, 21st..."""
+    if n % 100 in (11, 12, 13):
+        suffix = "th"
+    else:
+        suffix = {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+
+def normalize_place(text: str) -> str:
+    """Lowercase, strip accents and punctuation so place names compare loosely"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join("".join(c if c.isalnum() else " " for c in text).split())
+
+
+class _BlobStrings:
+    """Sequence view of the strings packed in a gazetteer blob, for bisect"""
+
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return bytes(self.blob[self.offsets[index] : self.offsets[index + 1]]).decode()
+
+
+def gazetteer_sources(source: str) -> Tuple[Optional[str], int, int]:
+    """
+    Region names file next to a GeoNames cities file, and the combined
+    (mtime, size) of both so the index is rebuilt when either changes
+    """
+    admin1 = os.path.join(os.path.dirname(source), "admin1CodesASCII.txt")
+    stat = os.stat(source)
+    mtime, size = stat.st_mtime_ns, stat.st_size
+    try:
+        admin1_stat = os.stat(admin1)
+    except OSError:
+        return None, mtime, size
+    return admin1, max(mtime, admin1_stat.st_mtime_ns), size + admin1_stat.st_size
+
+
+class Gazetteer:
+    """
+    Offline place-name index built from a GeoNames cities file
+
+    The index is written once next to the source file (`<file>.idx`) and
+    memory-mapped. It stores one column per record attribute and a sorted
+    table of normalized names (name, ASCII name and alternate names), so
+    exact and prefix lookups are binary searches and candidates are ranked
+    by population. Region (admin1) names come from `admin1CodesASCII.txt`
+    in the same directory when it exists, otherwise the region code is used.
+    """
+
+    MAGIC = b"OWGEO2\0\0"
+    # magic, records, keys, label, region and key blob sizes, source mtime and size
+    HEADER = struct.Struct("<8sIIIIIqq")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.index_path = source + ".idx"
+        admin1, mtime, size = gazetteer_sources(source)
+        self.source_stat = (mtime, size)
+        buffer = self._open_index()
+        if buffer is None:
+            data = self._build(admin1)
+            try:
+                tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.index_path)
+                buffer = self._open_index()
+            except OSError:
+                # Read-only location, keep the index in memory instead
+                pass
+            if buffer is None:
+                buffer = data
+        self._map(memoryview(buffer))
+
+    def search(self, query: str, limit: int = 5) -> List[dict]:
+        """
+        Find places matching `query`, e.g. "Paris", "Springfield, US",
+        "Springfield, Illinois" or "Springfield, IL"
+
+        Exact names rank above prefix matches, which rank above fuzzy
+        matches; ties are broken by population.
+        """
+        name, _, qualifier = query.partition(",")
+        key = normalize_place(name)
+        if not key:
+            return []
+
+        scores = {}
+        start = bisect_left(self._keys, key)
+        end = bisect_left(self._keys, key + "\U0010ffff", start)
+        for i in range(start, min(end, start + MAX_PREFIX_MATCHES)):
+            score = 2.0 if self._keys[i] == key else 1.0
+            record = self._key_records[i]
+            scores[record] = max(scores.get(record, 0.0), score)
+
+        if not scores:
+            # Fuzzy match among names sharing the first letters, for typos
+            start = bisect_left(self._keys, key[:2])
+            end = bisect_left(self._keys, key[:2] + "\U0010ffff", start)
+            matcher = SequenceMatcher(b=key)
+            for i in range(start, min(end, start + MAX_FUZZY_CANDIDATES)):
+                matcher.set_seq1(self._keys[i])
+                if matcher.real_quick_ratio() < 0.75 or matcher.quick_ratio() < 0.75:
+                    continue
+                ratio = matcher.ratio()
+                if ratio >= 0.75:
+                    record = self._key_records[i]
+                    scores[record] = max(scores.get(record, 0.0), ratio)
+
+        records = sorted(scores, key=lambda r: (-scores[r], -self._population[r]))
+        places = [self._place(record) for record in records]
+        qualifier = normalize_place(qualifier)
+        if qualifier:
+            # Keep places in the named country or region, if any are
+            filtered = [place for place in places if self._qualifies(qualifier, place)]
+            places = filtered or places
+        return places[:limit]
+
+    @staticmethod
+    def _qualifies(qualifier: str, place: dict) -> bool:
+        """
+        Whether a normalized qualifier names the place's country or region
+
+        Codes must match exactly; region names match whole words from the
+        start, so "new" matches "New South Wales" but "field" or "is" match
+        nothing.
+        """
+        if qualifier in (place["country"].lower(), place["region"].lower()):
+            return True
+        region = normalize_place(place["region_name"])
+        return bool(region) and (region + " ").startswith(qualifier + " ")
+
+    def _place(self, record: int) -> dict:
+        label = self._labels[record]
+        parts = label.rsplit(", ", 2)
+        return {
+            "name": label,
+            "country": parts[-1],
+            "region": self._regions[record],
+            "region_name": parts[1] if len(parts) == 3 else "",
+            "latitude": round(self._latitude[record], 4),
+            "longitude": round(self._longitude[record], 4),
+            "population": self._population[record],
+        }
+
+    def _open_index(self):
+        """Memory-map the index file if it exists and matches the source"""
+        try:
+            with open(self.index_path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            magic, _, _, _, _, _, mtime, size = self.HEADER.unpack_from(buffer)
+        except struct.error:
+            magic = None
+        if magic != self.MAGIC or (mtime, size) != self.source_stat:
+            buffer.close()
+            return None
+        return buffer
+
+    def _build(self, admin1: Optional[str]) -> bytes:
+        """Parse the GeoNames file (tab separated, cities*.txt layout) into index bytes"""
+        region_names = {}
+        if admin1:
+            # admin1CodesASCII.txt: "US.IL<tab>Illinois<tab>Illinois<tab>4896861"
+            with open(admin1, encoding="utf-8") as f:
+                for line in f:
+                    cols = line.rstrip("\n").split("\t")
+                    if len(cols) >= 2:
+                        region_names[cols[0]] = cols[1]
+
+        latitude = array("f")
+        longitude = array("f")
+        population = array("I")
+        labels = []
+        regions = []
+        keys = []
+        with open(self.source, encoding="utf-8") as f:
+            for line in f:
+                cols = line.rstrip("\n").split("\t")
+                if len(cols) < 15:
+                    continue
+                try:
+                    lat, lon = float(cols[4]), float(cols[5])
+                    pop = min(int(cols[14] or 0), 0xFFFFFFFF)
+                except ValueError:
+                    continue
+                record = len(labels)
+                latitude.append(lat)
+                longitude.append(lon)
+                population.append(pop)
+                region = region_names.get(f"{cols[8]}.{cols[10]}", cols[10])
+                labels.append(", ".join(c for c in (cols[1], region, cols[8]) if c))
+                regions.append(cols[10])
+                names = {cols[1], cols[2], *cols[3].split(",")}
+                for key in {normalize_place(n) for n in names if n}:
+                    if key:
+                        keys.append((key, record))
+        keys.sort()
+
+        label_offsets, label_blob = self._pack(labels)
+        region_offsets, region_blob = self._pack(regions)
+        key_offsets, key_blob = self._pack([key for key, _ in keys])
+        key_records = array("I", (record for _, record in keys))
+        header = self.HEADER.pack(
+            self.MAGIC,
+            len(labels),
+            len(keys),
+            len(label_blob),
+            len(region_blob),
+            len(key_blob),
+            *self.source_stat,
+        )
+        return b"".join(
+            (
+                header,
+                latitude.tobytes(),
+                longitude.tobytes(),
+                population.tobytes(),
+                label_offsets.tobytes(),
+                region_offsets.tobytes(),
+                key_offsets.tobytes(),
+                key_records.tobytes(),
+                label_blob,
+                region_blob,
+                key_blob,
+            )
+        )
+
+    @staticmethod
+    def _pack(strings: List[str]):
+        offsets = array("I", [0])
+        blob = bytearray()
+        for string in strings:
+            blob += string.encode()
+            offsets.append(len(blob))
+        return offsets, bytes(blob)
+
+    def _map(self, view: memoryview):
+        _, records, keys, label_size, region_size, key_size, _, _ = (
+            self.HEADER.unpack_from(view)
+        )
+        self._buffer = view
+        position = self.HEADER.size
+
+        def take(size: int, fmt: str) -> memoryview:
+            nonlocal position
+            column = view[position : position + size]
+            position += size
+            return column.cast(fmt) if fmt else column
+
+        self._latitude = take(records * 4, "f")
+        self._longitude = take(records * 4, "f")
+        self._population = take(records * 4, "I")
+        label_offsets = take((records + 1) * 4, "I")
+        region_offsets = take((records + 1) * 4, "I")
+        key_offsets = take((keys + 1) * 4, "I")
+        self._key_records = take(keys * 4, "I")
+        self._labels = _BlobStrings(label_offsets, take(label_size, ""))
+        self._regions = _BlobStrings(region_offsets, take(region_size, ""))
+        self._keys = _BlobStrings(key_offsets, take(key_size, ""))
+
+
+_gazetteers = {}
+_gazetteer_lock = threading.Lock()
+
+
+def load_gazetteer(source: str) -> Gazetteer:
+    """Shared Gazetteer for a GeoNames file, rebuilt when the file changes"""
+    with _gazetteer_lock:
+        gazetteer = _gazetteers.get(source)
+        _, mtime, size = gazetteer_sources(source)
+        if gazetteer is None or gazetteer.source_stat != (mtime, size):
+            gazetteer = Gazetteer(source)
+            _gazetteers[source] = gazetteer
+        return gazetteer
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache for Open-Meteo responses
+
+    Entries expire when the next model run is due. Expired entries are still
+    served for a grace period while a single background refresh replaces
+    them (stale-while-revalidate).
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (data, expires_at)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get_or_fetch(
+        self,
+        key: tuple,
+        fetch: Callable[[], dict],
+        expires_at: Callable[[], float],
+        stale_seconds: float,
+    ) -> dict:
+        """Return the cached response for key, fetching it when missing or too old"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                data, expiry = entry
+                if now < expiry:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return data
+                if now < expiry + stale_seconds:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        _executor.submit(self._refresh, key, fetch, expires_at)
+                    return data
+            self.misses += 1
+
+        data = fetch()
+        self._store(key, data, expires_at())
+        return data
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_ratio": (
+                    (self.hits + self.stale_hits) / lookups if lookups else 0.0
+                ),
+            }
+
+    def _refresh(self, key: tuple, fetch: Callable[[], dict], expires_at):
+        try:
+            self._store(key, fetch(), expires_at())
+        except Exception:
+            # Keep serving the stale entry; the next lookup retries the refresh
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key: tuple, data: dict, expiry: float):
+        with self._lock:
+            self._entries[key] = (data, expiry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max(1, self.max_entries):
+                self._entries.popitem(last=False)
+
 
 class Tools:
+    class Valves(BaseModel):
+        CACHE_GRID_DEGREES: float = Field(
+            default=0.05,
+            description="Round coordinates to this grid (degrees) when caching responses, 0 disables rounding",
+        )
+        CACHE_MAX_ENTRIES: int = Field(
+            default=512, description="Maximum number of cached Open-Meteo responses"
+        )
+        MODEL_UPDATE_MINUTES: int = Field(
+            default=60,
+            description="Open-Meteo model update interval, cached responses expire at the next update",
+        )
+        CACHE_STALE_SECONDS: int = Field(
+            default=1800,
+            description="How long an expired response may still be served while it is refreshed in the background, 0 disables",
+        )
+
+        USE_FLATBUFFERS: bool = Field(
+            default=False,
+            description="Request Open-Meteo's binary FlatBuffers format and decode series into typed arrays (needs numpy and openmeteo_sdk), falls back to JSON",
+        )
+
+        GEONAMES_FILE: str = Field(
+            default="",
+            description="Path to a GeoNames cities file (e.g. cities15000.txt) for place name lookups",
+        )
+
     def __init__(self):
-        pass
+        self.valves = self.Valves()
+        self._cache = ResponseCache(self.valves.CACHE_MAX_ENTRIES)
+        # Past weather never changes, so historical chunks are kept until evicted
+        self._history_cache = ResponseCache(self.valves.CACHE_MAX_ENTRIES)
 
     def get_current_weather(self, latitude: float, longitude: float) -> str:
         """
@@ -25,48 +856,11 @@ class Tools:
         Returns: Current weather and air quality information
         """
 
-        # Weather data parameters
-        weather_params = {
-            "latitude": latitude,
-            "longitude": longitude,
-            "timezone": "auto",
-            "current": [
-                "temperature_2m",
-                "apparent_temperature",
-                "wind_speed_10m",
-                "precipitation",
-                "weather_code",
-                "is_day",
-            ],
-        }
-
-        # Air quality parameters
-        air_params = {
-            "latitude": latitude,
-            "longitude": longitude,
-            "timezone": "auto",
-            "current": ["us_aqi", "pm10", "pm2_5", "carbon_monoxide"],
-            "domains": "cams_global",
-        }
-
         try:
-            # Request weather data
-            weather_response = requests.get(
-                "https://api.open-meteo.com/v1/forecast",
-                params=weather_params,
-                timeout=10,
+            # Answer from the location's forecast store
+            weather_data, air_data, air_error = self._fetch_forecast(
+                latitude, longitude
             )
-            weather_response.raise_for_status()
-            weather_data = weather_response.json()
-
-            # Request air quality data
-            air_response = requests.get(
-                "https://air-quality-api.open-meteo.com/v1/air-quality",
-                params=air_params,
-                timeout=10,
-            )
-            air_response.raise_for_status()
-            air_data = air_response.json()
 
             # Assemble results
             result = f"Location: Latitude {latitude}, Longitude {longitude}\n"
@@ -94,7 +888,10 @@ class Tools:
                 result += f"  - Day/Night: {'Day' if current.get('is_day') == 1 else 'Night'}\n\n"
 
             # Air quality information
-            if "current" in air_data:
+            if air_data is None:
+                result += "Current Air Quality\n"
+                result += f"  - Unavailable ({air_error})\n"
+            elif "current" in air_data:
                 current = air_data["current"]
                 aqi = current.get("us_aqi", "N/A")
                 aqi_level = self._get_aqi_level(aqi)
@@ -124,33 +921,10 @@ class Tools:
         Returns: Daily weather forecast information
         """
 
-        days = max(1, min(16, days))
-
-        params = {
-            "latitude": latitude,
-            "longitude": longitude,
-            "timezone": "auto",
-            "forecast_days": days,
-            "daily": [
-                "weather_code",
-                "temperature_2m_max",
-                "temperature_2m_min",
-                "apparent_temperature_max",
-                "apparent_temperature_min",
-                "sunrise",
-                "sunset",
-                "wind_speed_10m_max",
-                "precipitation_sum",
-                "precipitation_probability_max",
-            ],
-        }
+        days = max(1, min(FORECAST_DAYS, days))
 
         try:
-            response = requests.get(
-                "https://api.open-meteo.com/v1/forecast", params=params, timeout=10
-            )
-            response.raise_for_status()
-            data = response.json()
+            data, _, _ = self._fetch_forecast(latitude, longitude, air_quality=False)
 
             result = f"Location: Latitude {latitude}, Longitude {longitude}\n"
             result += f"Timezone: {data.get('timezone', 'N/A')}\n\n"
@@ -159,69 +933,8 @@ class Tools:
                 daily = data["daily"]
                 result += f"{days}-Day Forecast\n\n"
 
-                times = daily.get("time", [])
-                for i in range(len(times)):
-                    date = times[i]
-                    weather_code = (
-                        daily.get("weather_code", [])[i]
-                        if i < len(daily.get("weather_code", []))
-                        else 0
-                    )
-                    temp_max = (
-                        daily.get("temperature_2m_max", [])[i]
-                        if i < len(daily.get("temperature_2m_max", []))
-                        else "N/A"
-                    )
-                    temp_min = (
-                        daily.get("temperature_2m_min", [])[i]
-                        if i < len(daily.get("temperature_2m_min", []))
-                        else "N/A"
-                    )
-                    apparent_max = (
-                        daily.get("apparent_temperature_max", [])[i]
-                        if i < len(daily.get("apparent_temperature_max", []))
-                        else "N/A"
-                    )
-                    apparent_min = (
-                        daily.get("apparent_temperature_min", [])[i]
-                        if i < len(daily.get("apparent_temperature_min", []))
-                        else "N/A"
-                    )
-                    sunrise = (
-                        daily.get("sunrise", [])[i]
-                        if i < len(daily.get("sunrise", []))
-                        else "N/A"
-                    )
-                    sunset = (
-                        daily.get("sunset", [])[i]
-                        if i < len(daily.get("sunset", []))
-                        else "N/A"
-                    )
-                    wind_max = (
-                        daily.get("wind_speed_10m_max", [])[i]
-                        if i < len(daily.get("wind_speed_10m_max", []))
-                        else "N/A"
-                    )
-                    precip_sum = (
-                        daily.get("precipitation_sum", [])[i]
-                        if i < len(daily.get("precipitation_sum", []))
-                        else "N/A"
-                    )
-                    precip_prob = (
-                        daily.get("precipitation_probability_max", [])[i]
-                        if i < len(daily.get("precipitation_probability_max", []))
-                        else "N/A"
-                    )
-
-                    weather_desc = self._get_weather_description(weather_code)
-
-                    result += f"[{date}]\n"
-                    result += f"  Condition: {weather_desc}\n"
-                    result += f"  Temperature: {temp_min}°C ~ {temp_max}°C\n"
-                    result += f"  Feels Like: {apparent_min}°C ~ {apparent_max}°C\n"
-                    result += f"  Max Wind Speed: {wind_max} km/h\n"
-                    result += f"  Precipitation: {precip_sum} mm (Probability: {precip_prob}%)\n"
-                    result += f"  Sunrise: {sunrise} | Sunset: {sunset}\n\n"
+                rows = min(days, len(daily.get("time", [])))
+                result += render_daily_rows(to_columns(daily, DAILY_FIELDS, rows))
 
             return result
 
@@ -244,153 +957,496 @@ class Tools:
 
         hours = max(1, min(168, hours))
 
-        # Weather forecast parameters
+        try:
+            # Answer from the location's forecast store
+            weather_data, air_data, air_error = self._fetch_forecast(
+                latitude, longitude
+            )
+
+            result = f"Location: Latitude {latitude}, Longitude {longitude}\n"
+            result += f"Timezone: {weather_data.get('timezone', 'N/A')}\n\n"
+            result += f"{hours}-Hour Forecast\n\n"
+            if air_data is None:
+                result += f"Air quality unavailable ({air_error})\n\n"
+
+            if "hourly" in weather_data:
+                weather_hourly = weather_data["hourly"]
+                air_hourly = (air_data or {}).get("hourly", {})
+
+                # Start at the current local hour of the location
+                times = weather_hourly.get("time", [])
+                start = bisect_left(times, local_hour(weather_data))
+                weather_hourly = {
+                    field: values[start : start + hours]
+                    for field, values in weather_hourly.items()
+                    if field in HOURLY_FIELDS
+                }
+
+                rows = len(weather_hourly.get("time", []))
+                result += render_hourly_rows(
+                    to_columns(weather_hourly, HOURLY_FIELDS, rows),
+                    align_columns(
+                        weather_hourly["time"], air_hourly, HOURLY_AIR_FIELDS
+                    ),
+                )
+
+            return result
+
+        except requests.exceptions.RequestException as e:
+            return f"Failed to retrieve hourly forecast: {str(e)}"
+
+    def compare_weather(
+        self,
+        latitudes: List[float],
+        longitudes: List[float],
+        names: Optional[List[str]] = None,
+    ) -> str:
+        """
+        Compare current weather, today's range and air quality across several locations in one call
+
+        Parameters:
+        - latitudes: Latitude of each location (-90 to 90)
+        - longitudes: Longitude of each location (-180 to 180), same order as latitudes
+        - names: Optional display name of each location, e.g. ["Berlin", "Paris"]
+
+        Returns: One comparison table with a row per location
+        """
+
+        if not latitudes or len(latitudes) != len(longitudes):
+            return "Failed to compare weather: latitudes and longitudes must be non-empty lists of the same length"
+        if len(latitudes) > MAX_LOCATIONS:
+            return f"Failed to compare weather: at most {MAX_LOCATIONS} locations are supported"
+
+        names = list(names or [])
+        names += [
+            f"{lat}, {lon}"
+            for lat, lon in zip(latitudes[len(names) :], longitudes[len(names) :])
+        ]
+
+        # One batched request per API for all locations
         weather_params = {
-            "latitude": latitude,
-            "longitude": longitude,
+            "latitude": list(latitudes),
+            "longitude": list(longitudes),
             "timezone": "auto",
-            "forecast_days": (hours // 24) + 1,
-            "hourly": [
+            "forecast_days": 1,
+            "current": [
                 "temperature_2m",
                 "apparent_temperature",
-                "precipitation",
-                "precipitation_probability",
                 "wind_speed_10m",
-                "uv_index",
+                "precipitation",
+                "weather_code",
+            ],
+            "daily": [
+                "temperature_2m_max",
+                "temperature_2m_min",
+                "precipitation_probability_max",
             ],
         }
+        air_params = {
+            "latitude": list(latitudes),
+            "longitude": list(longitudes),
+            "timezone": "auto",
+            "current": ["us_aqi", "pm2_5"],
+            "domains": "cams_global",
+        }
+
+        try:
+            weather_data, air_data, air_error = self._fetch_weather_and_air(
+                weather_params, air_params
+            )
+        except requests.exceptions.RequestException as e:
+            return f"Failed to compare weather: {str(e)}"
+
+        # Open-Meteo returns a list for several locations and an object for one
+        weather_results = (
+            weather_data if isinstance(weather_data, list) else [weather_data]
+        )
+        # Build a new list: the response objects are shared with the cache
+        air_results = list(air_data) if isinstance(air_data, list) else [air_data or {}]
+        air_results += [{}] * (len(weather_results) - len(air_results))
+
+        rows = [
+            "| Location | Condition | Temp | Feels Like | Today | Rain Chance | Wind | AQI | PM2.5 |",
+            "|---|---|---|---|---|---|---|---|---|",
+        ]
+        for name, weather, air in zip(names, weather_results, air_results):
+            current = weather.get("current", {})
+            daily = to_columns(weather.get("daily", {}), weather_params["daily"], 1)
+            air_current = air.get("current", {})
+            aqi = air_current.get("us_aqi", "N/A")
+            rows.append(
+                f"| {name} "
+                f"| {weather_description(current.get('weather_code', 0))} "
+                f"| {current.get('temperature_2m', 'N/A')}°C "
+                f"| {current.get('apparent_temperature', 'N/A')}°C "
+                f"| {daily['temperature_2m_min'][0]}°C ~ {daily['temperature_2m_max'][0]}°C "
+                f"| {daily['precipitation_probability_max'][0]}% "
+                f"| {current.get('wind_speed_10m', 'N/A')} km/h "
+                f"| {aqi} ({aqi_level(aqi)}) "
+                f"| {air_current.get('pm2_5', 'N/A')} μg/m³ |"
+            )
+
+        result = f"Weather comparison for {len(weather_results)} locations\n\n"
+        result += "\n".join(rows) + "\n"
+        if air_data is None:
+            result += f"\nAir quality unavailable ({air_error})\n"
+        return result
+
+    def get_historical_comparison(
+        self,
+        latitude: float,
+        longitude: float,
+        start_date: str = "",
+        end_date: str = "",
+        years: int = 10,
+    ) -> str:
+        """
+        Compare a period's weather with the same dates in previous years (normals, percentiles, anomalies, records)
+
+        Parameters:
+        - latitude: Latitude coordinate (-90 to 90)
+        - longitude: Longitude coordinate (-180 to 180)
+        - start_date: First day in YYYY-MM-DD format, default 6 days before end_date
+        - end_date: Last day in YYYY-MM-DD format (may be up to 16 days ahead), default today
+        - years: Number of previous years to compare with (1-30), default 10
+
+        Returns: Climate comparison of the period against the previous years
+        """
+
+        if np is None:
+            return "Failed to compare with history: the numpy package is not installed"
+
+        try:
+            end = date.fromisoformat(end_date) if end_date else date.today()
+            start = (
+                date.fromisoformat(start_date)
+                if start_date
+                else end - timedelta(days=6)
+            )
+        except ValueError as e:
+            return f"Failed to compare with history: {str(e)}"
+        days = (end - start).days + 1
+        if not 1 <= days <= MAX_HISTORY_DAYS:
+            return f"Failed to compare with history: the period must cover 1 to {MAX_HISTORY_DAYS} days"
+        years = max(1, min(MAX_HISTORY_YEARS, years))
+
+        fields = [field for field, _, _, _ in HISTORY_FIELDS]
+        base = {
+            "latitude": self._snap_to_grid(latitude),
+            "longitude": self._snap_to_grid(longitude),
+            "timezone": "auto",
+            "daily": fields,
+        }
+
+        # One chunk per year, fetched concurrently and reduced into a
+        # (variables, years, days) matrix as each chunk arrives
+        deadline = time.monotonic() + HISTORY_TIMEOUT
+        history = np.full((len(fields), years, days), np.nan)
+        futures = []
+        for offset in range(1, years + 1):
+            year_start = self._shift_year(start, -offset)
+            params = {
+                **base,
+                "start_date": year_start.isoformat(),
+                "end_date": (year_start + timedelta(days=days - 1)).isoformat(),
+            }
+            futures.append(_history_executor.submit(self._fetch_history_chunk, params))
+
+        current_url = (
+            FORECAST_URL
+            if (date.today() - start).days <= FORECAST_PAST_DAYS
+            else ARCHIVE_URL
+        )
+        current_params = {
+            **base,
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+        }
+
+        try:
+            current = self._daily_matrix(
+                self._fetch_json(current_url, current_params), fields, days
+            )
+            for row, future in enumerate(futures):
+                history[:, row, :] = future.result(
+                    timeout=max(0.0, deadline - time.monotonic())
+                )
+        except FutureTimeoutError:
+            for future in futures:
+                future.cancel()
+            return f"Failed to compare with history: timed out after {HISTORY_TIMEOUT}s"
+        except requests.exceptions.RequestException as e:
+            for future in futures:
+                future.cancel()
+            return f"Failed to compare with history: {str(e)}"
+
+        stats = history_statistics(history, current)
+        first_year = start.year - years
+
+        def fmt(value) -> str:
+            return "N/A" if np.isnan(value) else f"{value:.1f}"
+
+        def day_of(index) -> str:
+            year_row, day = index
+            return (
+                self._shift_year(start, -(year_row + 1)) + timedelta(days=int(day))
+            ).isoformat()
+
+        rows = [
+            "| Variable | This period | Normal | Anomaly | P10 | Median | P90 | Rank | Record high | Record low |",
+            "|---|---|---|---|---|---|---|---|---|---|",
+        ]
+        for i, (_, label, unit, aggregate) in enumerate(HISTORY_FIELDS):
+            kind = "total" if aggregate == "sum" else "avg"
+            anomaly = stats["anomaly"][i]
+            rows.append(
+                f"| {label} {kind} ({unit}) "
+                f"| {fmt(stats['current'][i])} "
+                f"| {fmt(stats['normal'][i])} "
+                f"| {'N/A' if np.isnan(anomaly) else f'{anomaly:+.1f}'} "
+                f"| {fmt(stats['p10'][i])} "
+                f"| {fmt(stats['p50'][i])} "
+                f"| {fmt(stats['p90'][i])} "
+                f"| {ordinal(round(stats['rank'][i]))} pct of {stats['years'][i]} yrs "
+                f"| {fmt(stats['high'][i])} ({day_of(stats['high_index'][i])}) "
+                f"| {fmt(stats['low'][i])} ({day_of(stats['low_index'][i])}) |"
+            )
+
+        result = f"Location: Latitude {latitude}, Longitude {longitude}\n"
+        result += (
+            f"Period: {start.isoformat()} ~ {end.isoformat()} compared with the same "
+            f"dates in {first_year}-{start.year - 1} ({years} years)\n\n"
+        )
+        result += "\n".join(rows) + "\n"
+        result += "\nRank: share of previous years below this period. Records are single days.\n"
+        return result
+
+    def get_weather_by_place(self, place: str, forecast: str = "current") -> str:
+        """
+        Get weather for a place name without knowing its coordinates
+
+        Parameters:
+        - place: City name, optionally with a country code or region, e.g. "Paris", "Springfield, US", "Springfield, Illinois"
+        - forecast: "current" (weather and air quality now), "hourly" (next 24 hours) or "daily" (next 7 days)
+
+        Returns: The matched place and its weather information
+        """
+
+        if not self.valves.GEONAMES_FILE:
+            return "Failed to look up place: GEONAMES_FILE is not set. Please configure it in the tool settings."
+
+        try:
+            places = load_gazetteer(self.valves.GEONAMES_FILE).search(place)
+        except (OSError, ValueError, struct.error) as e:
+            return f"Failed to look up place: {str(e)}"
+        if not places:
+            return f"No place found matching: {place}"
+
+        best = places[0]
+        result = f"Matched place: {best['name']} (population {best['population']:,})\n"
+        if len(places) > 1:
+            others = "; ".join(
+                f"{p['name']} ({p['latitude']}, {p['longitude']})" for p in places[1:]
+            )
+            result += f"Other matches: {others}\n"
+        result += "\n"
+
+        if forecast == "hourly":
+            return result + self.get_hourly_forecast(
+                best["latitude"], best["longitude"]
+            )
+        if forecast == "daily":
+            return result + self.get_daily_forecast(best["latitude"], best["longitude"])
+        return result + self.get_current_weather(best["latitude"], best["longitude"])
+
+    def _fetch_forecast(
+        self, latitude: float, longitude: float, air_quality: bool = True
+    ) -> Tuple[dict, Optional[dict], Optional[str]]:
+        """
+        Get the forecast store of a location
+
+        One superset request (current, hourly and 16 daily days) per API is
+        shared by all tools, so current/daily/hourly questions about the same
+        place cost a single upstream fetch per model run.
+
+        Returns: (weather_data, air_data or None, air quality error or None)
+        """
+        weather_params = {
+            "latitude": latitude,
+            "longitude": longitude,
+            "timezone": "auto",
+            "forecast_days": FORECAST_DAYS,
+            "current": list(CURRENT_FIELDS),
+            "hourly": list(HOURLY_FIELDS[1:]),
+            "daily": list(DAILY_FIELDS[1:]),
+        }
+        if not air_quality:
+            return self._fetch_json(FORECAST_URL, weather_params), None, None
 
-        # Air quality parameters
         air_params = {
             "latitude": latitude,
             "longitude": longitude,
             "timezone": "auto",
-            "forecast_days": (hours // 24) + 1,
-            "hourly": ["us_aqi", "pm2_5"],
+            "forecast_days": AIR_QUALITY_FORECAST_DAYS,
+            "current": list(CURRENT_AIR_FIELDS),
+            "hourly": list(HOURLY_AIR_FIELDS),
             "domains": "cams_global",
         }
+        return self._fetch_weather_and_air(weather_params, air_params)
 
-        try:
-            # Get weather data
-            weather_response = requests.get(
-                "https://api.open-meteo.com/v1/forecast",
-                params=weather_params,
-                timeout=10,
+    def _fetch_json(self, url: str, params: dict) -> dict:
+        """Get an Open-Meteo response, served from the grid-quantized cache when possible"""
+        params = dict(params)
+        params["latitude"] = self._snap_coordinates(params["latitude"])
+        params["longitude"] = self._snap_coordinates(params["longitude"])
+        key = (url,) + tuple(
+            sorted(
+                (name, tuple(value) if isinstance(value, list) else value)
+                for name, value in params.items()
             )
-            weather_response.raise_for_status()
-            weather_data = weather_response.json()
-
-            # Get air quality data
-            air_response = requests.get(
-                "https://air-quality-api.open-meteo.com/v1/air-quality",
-                params=air_params,
-                timeout=10,
+        )
+
+        self._cache.max_entries = self.valves.CACHE_MAX_ENTRIES
+        return self._cache.get_or_fetch(
+            key,
+            lambda: self._request(url, params),
+            self._next_model_run,
+            self.valves.CACHE_STALE_SECONDS,
+        )
+
+    def _request(self, url: str, params: dict):
+        """Request an Open-Meteo response, preferring FlatBuffers when enabled"""
+        if (
+            self.valves.USE_FLATBUFFERS
+            and WeatherApiResponse is not None
+            and np is not None
+        ):
+            try:
+                return self._request_flatbuffers(url, params)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                raise
+            except Exception:
+                # Unsupported by the endpoint or undecodable, fall back to JSON
+                pass
+        return self._request_json(url, params)
+
+    def _request_flatbuffers(self, url: str, params: dict):
+        """Send a GET request with format=flatbuffers and decode it into typed arrays"""
+        response = requests.get(
+            url, params={**params, "format": "flatbuffers"}, timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+        return decode_flatbuffers(response.content, params)
+
+    def _request_json(self, url: str, params: dict) -> dict:
+        """Send a GET request to Open-Meteo and decode the JSON body"""
+        response = requests.get(url, params=params, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def _fetch_history_chunk(self, params: dict):
+        """One year of a historical comparison as a (variables, days) matrix, cached forever"""
+        key = (ARCHIVE_URL,) + tuple(
+            sorted(
+                (name, tuple(value) if isinstance(value, list) else value)
+                for name, value in params.items()
             )
-            air_response.raise_for_status()
-            air_data = air_response.json()
+        )
+        days = (
+            date.fromisoformat(params["end_date"])
+            - date.fromisoformat(params["start_date"])
+        ).days + 1
+        self._history_cache.max_entries = self.valves.CACHE_MAX_ENTRIES
+        return self._history_cache.get_or_fetch(
+            key,
+            lambda: self._daily_matrix(
+                self._request(ARCHIVE_URL, params), params["daily"], days
+            ),
+            lambda: math.inf,
+            0,
+        )
 
-            result = f"Location: Latitude {latitude}, Longitude {longitude}\n"
-            result += f"Timezone: {weather_data.get('timezone', 'N/A')}\n\n"
-            result += f"{hours}-Hour Forecast\n\n"
+    def _daily_matrix(self, data: dict, fields, days: int):
+        """Daily series of a response as a float (variables, days) array, NaN where missing"""
+        daily = data.get("daily", {})
+        matrix = np.full((len(fields), days), np.nan)
+        for row, field in enumerate(fields):
+            values = daily.get(field)
+            if values is None:
+                continue
+            values = np.asarray(values[:days], dtype=float)
+            matrix[row, : len(values)] = values
+        return matrix
 
-            if "hourly" in weather_data:
-                weather_hourly = weather_data["hourly"]
-                air_hourly = air_data.get("hourly", {})
+    def _shift_year(self, day: date, years: int) -> date:
+        """Same calendar day `years` later, Feb 29 falls back to Feb 28"""
+        try:
+            return day.replace(year=day.year + years)
+        except ValueError:
+            return day.replace(year=day.year + years, day=28)
 
-                times = weather_hourly.get("time", [])
-                for i in range(min(hours, len(times))):
-                    time = times[i]
-                    temp = (
-                        weather_hourly.get("temperature_2m", [])[i]
-                        if i < len(weather_hourly.get("temperature_2m", []))
-                        else "N/A"
-                    )
-                    apparent = (
-                        weather_hourly.get("apparent_temperature", [])[i]
-                        if i < len(weather_hourly.get("apparent_temperature", []))
-                        else "N/A"
-                    )
-                    precip = (
-                        weather_hourly.get("precipitation", [])[i]
-                        if i < len(weather_hourly.get("precipitation", []))
-                        else "N/A"
-                    )
-                    wind = (
-                        weather_hourly.get("wind_speed_10m", [])[i]
-                        if i < len(weather_hourly.get("wind_speed_10m", []))
-                        else "N/A"
-                    )
-                    uv = (
-                        weather_hourly.get("uv_index", [])[i]
-                        if i < len(weather_hourly.get("uv_index", []))
-                        else "N/A"
-                    )
+    def _snap_coordinates(self, value):
+        """Snap one coordinate, or a list of them to Open-Meteo's comma-separated form"""
+        if isinstance(value, (list, tuple)):
+            return ",".join(str(self._snap_to_grid(v)) for v in value)
+        return self._snap_to_grid(value)
 
-                    # Air quality data
-                    aqi = (
-                        air_hourly.get("us_aqi", [])[i]
-                        if i < len(air_hourly.get("us_aqi", []))
-                        else "N/A"
-                    )
-                    pm25 = (
-                        air_hourly.get("pm2_5", [])[i]
-                        if i < len(air_hourly.get("pm2_5", []))
-                        else "N/A"
-                    )
-                    aqi_level = self._get_aqi_level(aqi)
+    def _snap_to_grid(self, value: float) -> float:
+        """Round a coordinate to the configured cache grid"""
+        grid = self.valves.CACHE_GRID_DEGREES
+        if grid <= 0:
+            return value
+        return round(round(float(value) / grid) * grid, 6)
 
-                    result += f"{time}: {temp}°C (Feels {apparent}°C), Wind {wind} km/h, Precip {precip} mm, UV {uv}, AQI {aqi} ({aqi_level}), PM2.5 {pm25} μg/m³\n"
+    def _next_model_run(self) -> float:
+        """Unix timestamp of the next expected Open-Meteo model update"""
+        interval = max(1, self.valves.MODEL_UPDATE_MINUTES) * 60
+        return (math.floor(time.time() / interval) + 1) * interval
 
-            return result
+    def _fetch_weather_and_air(
+        self, weather_params: dict, air_params: dict
+    ) -> Tuple[dict, Optional[dict], Optional[str]]:
+        """
+        Fetch weather and air quality data concurrently under one shared deadline
 
-        except requests.exceptions.RequestException as e:
-            return f"Failed to retrieve hourly forecast: {str(e)}"
+        Weather failures are raised to the caller. Air quality failures are
+        reported through the returned error message so the weather result can
+        still be shown.
+
+        Returns: (weather_data, air_data or None, air quality error or None)
+        """
+        deadline = time.monotonic() + REQUEST_TIMEOUT
+        weather_future = _executor.submit(
+            self._fetch_json, FORECAST_URL, weather_params
+        )
+        air_future = _executor.submit(self._fetch_json, AIR_QUALITY_URL, air_params)
+
+        try:
+            weather_data = weather_future.result(
+                timeout=max(0.0, deadline - time.monotonic())
+            )
+        except FutureTimeoutError:
+            air_future.cancel()
+            raise requests.exceptions.Timeout(
+                f"Weather request timed out after {REQUEST_TIMEOUT}s"
+            )
+        except Exception:
+            air_future.cancel()
+            raise
+
+        try:
+            air_data = air_future.result(timeout=max(0.0, deadline - time.monotonic()))
+            return weather_data, air_data, None
+        except FutureTimeoutError:
+            air_future.cancel()
+            return weather_data, None, f"timed out after {REQUEST_TIMEOUT}s"
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return weather_data, None, str(e)
 
     def _get_weather_description(self, code: int) -> str:
         """Convert weather code to description"""
-        weather_codes = {
-            0: "Clear sky",
-            1: "Mainly clear",
-            2: "Partly cloudy",
-            3: "Overcast",
-            45: "Fog",
-            48: "Depositing rime fog",
-            51: "Light drizzle",
-            53: "Moderate drizzle",
-            55: "Dense drizzle",
-            61: "Slight rain",
-            63: "Moderate rain",
-            65: "Heavy rain",
-            71: "Slight snow",
-            73: "Moderate snow",
-            75: "Heavy snow",
-            77: "Snow grains",
-            80: "Slight rain showers",
-            81: "Moderate rain showers",
-            82: "Violent rain showers",
-            85: "Slight snow showers",
-            86: "Heavy snow showers",
-            95: "Thunderstorm",
-            96: "Thunderstorm with hail",
-            99: "Thunderstorm with heavy hail",
-        }
-        return weather_codes.get(code, f"Unknown weather (code: {code})")
+        return weather_description(code)
 
     def _get_aqi_level(self, aqi) -> str:
         """Get air quality level based on AQI value"""
-        try:
-            aqi_value = float(aqi)
-            if aqi_value <= 50:
-                return "Good"
-            elif aqi_value <= 100:
-                return "Moderate"
-            elif aqi_value <= 150:
-                return "Unhealthy for Sensitive Groups"
-            elif aqi_value <= 200:
-                return "Unhealthy"
-            elif aqi_value <= 300:
-                return "Very Unhealthy"
-            else:
-                return "Hazardous"
-        except (ValueError, TypeError):
-            return "Unknown"
+        return aqi_level(aqi)